@@ -29,6 +29,7 @@ class EventQueue(object):
     """ 
     Singleton object
     Midi Event queue between objects
+    Note: no object pushes events for now, the player reads the tempo from the tempo map
     """
     _single_instance = None
     @staticmethod
@@ -48,31 +49,73 @@ class EventQueue(object):
             print("Error: this Klass is a singleton klass.")
             return
         
+        # size must be a power of two, for masking the indexes
         self._max_ev =1024
-        self._ev_buffer = [EventMessage] * self._max_ev
+        self._mask = self._max_ev -1
+        # preallocated slots, written in place
+        self._ev_buffer = [EventMessage() for _ in range(self._max_ev)]
+        self._none_ev = EventMessage() # returned when there is nothing to read
+        # Note: single producer, single consumer
+        # the writer only modifies _write_index, the reader only modifies _read_index
         self._read_index =0
         self._write_index =0
+        self.drop_count =0 # events dropped, when the buffer is full
 
     #-----------------------------------------
 
     def push_event(self, type, value):
-        self._write_index +=1 # We will be able to count number of writings
-        index = self._write_index % self._max_ev
-        ev = EventMessage()
+        """
+        write an event in the next free slot
+        returns False whether the buffer is full and the event is dropped
+        from EventQueue object
+        """
+
+        write_index = self._write_index
+        if write_index - self._read_index >= self._max_ev:
+            self.drop_count +=1
+            return False
+        ev = self._ev_buffer[write_index & self._mask]
         ev.type = type
         ev.value = value
-        self._ev_buffer[index] = ev
+        # publish the event after writing the slot
+        self._write_index = write_index +1
+
+        return True
 
     #-----------------------------------------
 
     def pop_event(self):
-        if self._read_index == self._write_index:
-            ev = EventMessage() # None event
-            return ev
+        """
+        returns the next event slot, or a None event
+        Note: the slot is reused by the writer, so read its fields before the next pop
+        from EventQueue object
+        """
+
+        read_index = self._read_index
+        if read_index == self._write_index:
+            return self._none_ev
+        ev = self._ev_buffer[read_index & self._mask]
+        self._read_index = read_index +1
         
-        self._read_index +=1 # We save the read_index count
-        index = self._read_index % self._max_ev
-        return self._ev_buffer[index]
+        return ev
+
+    #-----------------------------------------
+
+    def pop_all(self):
+        """
+        returns a list of (type, value) tuples for all pending events, in one call
+        from EventQueue object
+        """
+
+        read_index = self._read_index
+        write_index = self._write_index
+        if read_index == write_index: return []
+        buf = self._ev_buffer
+        mask = self._mask
+        res = [(buf[i & mask].type, buf[i & mask].value) for i in range(read_index, write_index)]
+        self._read_index = write_index
+
+        return res
 
     #-----------------------------------------
     
@@ -86,6 +129,16 @@ class EventQueue(object):
 
     #-----------------------------------------
 
+    def count(self):
+        """
+        returns the number of pending events
+        from EventQueue object
+        """
+
+        return self._write_index - self._read_index
+
+    #-----------------------------------------
+
 #========================================
 
 def get_instance():
@@ -172,6 +172,17 @@ fluid_synth_program_change = cfunc('fluid_synth_program_change', c_int,
                                    ('chan', c_int, 1),
                                    ('prg', c_int, 1))
 
+fluid_synth_channel_pressure = cfunc('fluid_synth_channel_pressure', c_int,
+                                   ('synth', c_void_p, 1),
+                                   ('chan', c_int, 1),
+                                   ('val', c_int, 1))
+
+fluid_synth_key_pressure = cfunc('fluid_synth_key_pressure', c_int,
+                                   ('synth', c_void_p, 1),
+                                   ('chan', c_int, 1),
+                                   ('key', c_int, 1),
+                                   ('val', c_int, 1))
+
 fluid_synth_unset_program = cfunc('fluid_synth_unset_program', c_int,
                                    ('synth', c_void_p, 1),
                                    ('chan', c_int, 1))
@@ -353,6 +364,12 @@ fluid_sequencer_send_at = cfunc('fluid_sequencer_send_at', c_int,
                                ('absolute', c_int, 1))
                                
 
+fluid_sequencer_remove_events = cfunc('fluid_sequencer_remove_events', None,
+                                     ('seq', c_void_p, 1),
+                                     ('source', c_short, 1),
+                                     ('dest', c_short, 1),
+                                     ('type', c_int, 1))
+
 delete_fluid_sequencer = cfunc('delete_fluid_sequencer', None,
                               ('seq', c_void_p, 1))
 
@@ -389,6 +406,33 @@ fluid_event_noteoff = cfunc('fluid_event_noteoff', None,
                          ('channel', c_int, 1),
                          ('key', c_short, 1))
 
+fluid_event_control_change = cfunc('fluid_event_control_change', None,
+                         ('evt', c_void_p, 1),
+                         ('channel', c_int, 1),
+                         ('control', c_short, 1),
+                         ('val', c_int, 1))
+
+fluid_event_program_change = cfunc('fluid_event_program_change', None,
+                         ('evt', c_void_p, 1),
+                         ('channel', c_int, 1),
+                         ('preset_num', c_int, 1))
+
+fluid_event_pitch_bend = cfunc('fluid_event_pitch_bend', None,
+                         ('evt', c_void_p, 1),
+                         ('channel', c_int, 1),
+                         ('val', c_int, 1))
+
+fluid_event_channel_pressure = cfunc('fluid_event_channel_pressure', None,
+                         ('evt', c_void_p, 1),
+                         ('channel', c_int, 1),
+                         ('val', c_int, 1))
+
+fluid_event_key_pressure = cfunc('fluid_event_key_pressure', None,
+                         ('evt', c_void_p, 1),
+                         ('channel', c_int, 1),
+                         ('key', c_short, 1),
+                         ('val', c_int, 1))
+
 
 delete_fluid_event = cfunc('delete_fluid_event', None,
                           ('evt', c_void_p, 1))
@@ -521,6 +565,10 @@ def fluid_synth_write_s16_stereo(synth, len):
 
 # Object-oriented interface, simplifies access to functions
 
+class Error(Exception):
+    """FluidSynth call failed"""
+    pass
+
 class Synth:
     """Synth represents a FluidSynth synthesizer"""
     def __init__(self, gain=0.2, samplerate=44100, channels=256, **kwargs):
@@ -908,6 +956,41 @@ class Sequencer:
         self._schedule_event(evt, time, absolute)
         delete_fluid_event(evt)
 
+    def control_change(self, time, channel, control, value, source=-1, dest=-1, absolute=True):
+        evt = self._create_event(source, dest)
+        fluid_event_control_change(evt, channel, control, value)
+        self._schedule_event(evt, time, absolute)
+        delete_fluid_event(evt)
+
+    def program_change(self, time, channel, program, source=-1, dest=-1, absolute=True):
+        evt = self._create_event(source, dest)
+        fluid_event_program_change(evt, channel, program)
+        self._schedule_event(evt, time, absolute)
+        delete_fluid_event(evt)
+
+    def pitch_bend(self, time, channel, value, source=-1, dest=-1, absolute=True):
+        """Schedule a pitch bend, value from -8192 to +8191, like Synth.pitch_bend"""
+        evt = self._create_event(source, dest)
+        fluid_event_pitch_bend(evt, channel, value + 8192)
+        self._schedule_event(evt, time, absolute)
+        delete_fluid_event(evt)
+
+    def channel_pressure(self, time, channel, value, source=-1, dest=-1, absolute=True):
+        evt = self._create_event(source, dest)
+        fluid_event_channel_pressure(evt, channel, value)
+        self._schedule_event(evt, time, absolute)
+        delete_fluid_event(evt)
+
+    def key_pressure(self, time, channel, key, value, source=-1, dest=-1, absolute=True):
+        evt = self._create_event(source, dest)
+        fluid_event_key_pressure(evt, channel, key, value)
+        self._schedule_event(evt, time, absolute)
+        delete_fluid_event(evt)
+
+    def remove_events(self, source=-1, dest=-1, type=-1):
+        """Remove the scheduled events not yet processed, all by default"""
+        fluid_sequencer_remove_events(self.sequencer, source, dest, type)
+
     def timer(self, time, data=None, source=-1, dest=-1, absolute=True):
         evt = self._create_event(source, dest)
         fluid_event_timer(evt, data)
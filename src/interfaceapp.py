@@ -9,6 +9,7 @@ import os
 import midiplayer as midp
 import midimanager as midman
 import miditools as midto
+import midirender as midrend
 import utils as uti
 import logger as log
 
@@ -610,6 +611,140 @@ class InterfaceApp(object):
 
     #-------------------------------------------
 
+    def toggle_columnar(self, *args, **kwargs):
+        """
+        toggle columnar storage for the tracks events
+        from InterfaceApp object
+        """
+
+        columnar = self.curseq.set_columnar(not self.curseq.columnar)
+        if columnar:
+            self.msg_app = "Columnar storage On"
+        else:
+            self.msg_app = "Columnar storage Off"
+        self.notify(self.msg_app)
+
+    #-------------------------------------------
+
+    def toggle_sched_mode(self, *args, **kwargs):
+        """
+        toggle scheduler mode, between fixed polling, sleeping until the next event,
+        lookahead with a producer thread, and scheduling ahead in the synth sequencer
+        from InterfaceApp object
+        """
+
+        new_mode = (self.player.sched_mode + 1) % 4
+        mode = self.player.set_sched_mode(new_mode)
+        if mode != new_mode:
+            # the synth has no sequencer
+            mode = self.player.set_sched_mode(0)
+        if mode == 3:
+            self.msg_app = f"Sequencer scheduler On, ahead: {self.player.seq_ahead_time * 1000:.1f} ms"
+        elif mode == 2:
+            self.msg_app = f"Lookahead scheduler On, depth: {self.player.lookahead_time * 1000:.1f} ms"
+        elif mode == 1:
+            self.msg_app = "Deadline scheduler On"
+        else:
+            self.msg_app = "Deadline scheduler Off"
+        self.notify(self.msg_app)
+
+    #-------------------------------------------
+
+    def change_seq_ahead(self, msec=None, *args, **kwargs):
+        """
+        change the time in msec, the messages are scheduled ahead in the synth sequencer
+        from InterfaceApp object
+        """
+
+        if msec is not None:
+            try:
+                msec = float(msec)
+            except ValueError:
+                return
+            if msec <= 0: return
+            self.player.set_seq_ahead_time(msec / 1000)
+        self.msg_app = f"Sequencer ahead: {self.player.seq_ahead_time * 1000:.1f} ms"
+        self.notify(self.msg_app)
+
+    #-------------------------------------------
+
+    def change_lookahead(self, msec=None, *args, **kwargs):
+        """
+        change the lookahead depth in msec, for the lookahead scheduler
+        from InterfaceApp object
+        """
+
+        if msec is not None:
+            try:
+                msec = float(msec)
+            except ValueError:
+                return
+            if msec <= 0: return
+            self.player.set_lookahead_time(msec / 1000)
+        stats = self.player.get_timing_stats()
+        self.msg_app = (f"Lookahead: {self.player.lookahead_time * 1000:.1f} ms, "
+                f"underruns: {stats['underruns']}")
+        self.notify(self.msg_app)
+
+    #-------------------------------------------
+
+    def print_timing(self, *args, **kwargs):
+        """
+        print timing error statistics for sent events
+        from InterfaceApp object
+        """
+
+        stats = self.player.get_timing_stats()
+        self.msg_app = (f"Timing: count: {stats['count']}, mean: {stats['mean']:.3f} ms, "
+                f"p50: {stats['p50']:.3f} ms, p99: {stats['p99']:.3f} ms, "
+                f"max: {stats['max']:.3f} ms, last: {stats['last']:.3f} ms, "
+                f"underruns: {stats['underruns']}")
+        self.notify(self.msg_app)
+
+    #-------------------------------------------
+
+    def dump_timing(self, filename=None, *args, **kwargs):
+        """
+        dump raw timing samples to a csv file
+        from InterfaceApp object
+        """
+
+        if not filename: filename = "/tmp/zikdrum_timing.csv"
+        try:
+            count = self.player.dump_timing(filename)
+        except OSError as err:
+            self.msg_app = f"Error: unable to dump timing to {filename}: {err}"
+        else:
+            self.msg_app = f"Timing: {count} samples written to {filename}"
+        self.notify(self.msg_app)
+
+    #-------------------------------------------
+
+    def render_wav(self, filename=None, *args, **kwargs):
+        """
+        render the current sequence offline to a wav file
+        from InterfaceApp object
+        """
+
+        if not filename: filename = "/tmp/zikdrum.wav"
+        rend = midrend.MidiWaveRender()
+        if not rend.init_synth():
+            self.msg_app = "Error: unable to load the sound bank for rendering"
+            self.notify(self.msg_app)
+            return
+        try:
+            rend.render_seq(self.curseq, filename)
+        except OSError as err:
+            self.msg_app = f"Error: unable to render to {filename}: {err}"
+        else:
+            self.msg_app = (f"Rendering: {rend.audio_time:.1f} sec written to {filename}, "
+                    f"in {rend.render_time:.2f} sec")
+        finally:
+            rend.close_synth()
+        self.notify(self.msg_app)
+
+    #-------------------------------------------
+
     def toggle_quantize(self, *args, **kwargs):
         """
         toggle quantize
@@ -631,8 +766,9 @@ class InterfaceApp(object):
         from InterfaceApp object
         """
 
-        self.curseq.quantize_track()
-        self.msg_app =  "Quantize to: {}".format(self.player.quan_res)
+        if self.curseq.quantize_track():
+            self.make_undo("Quantize track", delta=1)
+        self.msg_app =  "Quantize to: {}".format(self.curseq.quan_res)
         self.notify(self.msg_app)
 
     #-------------------------------------------
@@ -650,7 +786,7 @@ class InterfaceApp(object):
             (left_loc, right_loc) = self.curseq.get_locators()
             (res, tracknum) = self.curseq.erase_track(tracknum, left_loc, right_loc)
         if res:
-            self.make_undo(title)
+            self.make_undo(title, delta=1)
             self.msg_app = "Erase track {}: ".format(tracknum)
         else:
             self.msg_app = "Track {}: not erased".format(tracknum)
@@ -719,8 +855,12 @@ class InterfaceApp(object):
         end_loop = self.curseq.get_end_loop()
         end_loop = self.format2bar(end_loop)
         bpm = self.curseq.get_bpm()
+        stats = self.player.get_timing_stats()
         self.msg_app = "Bar Position: {} / {}, start_loop: {}, end_loop: {},\
                 Bpm: {:.2f}".format(curbar, lastbar, start_loop, end_loop, bpm)
+        self.msg_app += "\nLateness p50: {:.3f} ms, p99: {:.3f} ms, max: {:.3f} ms,\
+                Loop rate: {:.1f}/s, Queue: {} (max: {})".format(stats['p50'], stats['p99'], stats['max'], 
+                        stats['loop_rate'], stats['queue_depth'], stats['queue_max'])
         self.notify(self.msg_app)
 
     #-------------------------------------------
@@ -752,18 +892,24 @@ class InterfaceApp(object):
 
     #-------------------------------------------
 
-    def make_undo(self, title):
+    def make_undo(self, title, delta=0):
         """
-        create a player copy
+        create an undo item, with the command recorded by the editing action whether delta,
+        otherwise a sequence snapshot, sharing unchanged events with the previous one
         from Interface App object
         """
 
-        player = None        
-        player = self.tools.duplicate_player_obj(self.player)
-        if player:
-            self.undoman.add_undo(title, player)
+        recorder = midto.get_recorder()
+        cmd = recorder.pop_command() if recorder.seq is self.curseq else None
+        recorder.set_sequence(self.curseq)
+        if delta and cmd and self.undoman.get_delta_count() < self.undoman.delta_max:
+            self.undoman.add_undo(title, cmd)
+            return cmd
+        snap = self.tools.make_snapshot(self.curseq)
+        if snap:
+            self.undoman.add_undo(title, snap)
 
-        return player
+        return snap
     
     #-------------------------------------------
 
@@ -774,16 +920,17 @@ class InterfaceApp(object):
         """
         
         curtitle = self.undoman.title
-        (title, player) = self.undoman.prev_undo()
-        if player:
-            # copy player to not modify the saved
-            new_player = self.tools.duplicate_player_obj(player)
-            self.player = new_player
+        old_index = self.undoman.index
+        (title, item) = self.undoman.prev_undo()
+        if item:
+            # commands are reverted, and for snapshots, only changed tracks are rebuilt
+            if self.tools.restore_undo(self.curseq, self.undoman, old_index):
+                self.msg_app = "Undo {}".format(curtitle)
+            else:
+                self.msg_app = "Undo not available"
+            midto.get_recorder().set_sequence(self.curseq)
             self.player.update_player()
-            self.curseq = self.player.curseq
             # self.curseq.update_length()
-            # debug("voici player tracks: {}".format(len(track_lst)))
-            self.msg_app = "Undo {}".format(curtitle)
         else:
             self.msg_app = "No Undo available"
         self.notify(self.msg_app)
@@ -796,21 +943,48 @@ class InterfaceApp(object):
         from Interface App object
         """
 
-        (title, player) = self.undoman.next_undo()
-        if player:
-            # copy player to not modify the saved
-            new_player = self.tools.duplicate_player_obj(player)
-            self.player = new_player
+        old_index = self.undoman.index
+        (title, item) = self.undoman.next_undo()
+        if item:
+            # commands are replayed, and for snapshots, only changed tracks are rebuilt
+            if self.tools.restore_undo(self.curseq, self.undoman, old_index):
+                self.msg_app = "Redo {}".format(title)
+            else:
+                self.msg_app = "Redo not available"
+            midto.get_recorder().set_sequence(self.curseq)
             self.player.update_player()
-            self.curseq = self.player.curseq
             # self.curseq.update_length()
-            self.msg_app = "Redo {}".format(title)
         else:
             self.msg_app = "No Redo available"
         self.notify(self.msg_app)
 
     #-------------------------------------------
 
+    def print_undo_mem(self, size=None, *args, **kwargs):
+        """
+        print undo history memory use,
+        and sets the memory budget in MB whether size is given
+        from InterfaceApp object
+        """
+
+        undoman = self.undoman
+        if size:
+            try:
+                undoman.max_bytes = int(float(size) * (1 << 20))
+            except ValueError:
+                self.msg_app = f"Error: invalid size: {size}"
+                self.notify(self.msg_app)
+                return
+            undoman.check_budget()
+        info = undoman.get_mem_info()
+        mb = 1 << 20
+        self.msg_app = (f"Undo: {info['count']} items, memory: {info['mem_bytes'] / mb:.2f} MB "
+                f"of {info['max_bytes'] / mb:.2f} MB, spilled: {info['spilled']} items "
+                f"({info['disk_bytes'] / mb:.2f} MB on disk), evicted: {info['evicted']}")
+        self.notify(self.msg_app)
+
+    #-------------------------------------------
+
     def delete_event(self):
         """
         delete events
@@ -922,7 +1096,27 @@ class InterfaceApp(object):
         
         self.msg_app = "Quantize: {}".format(reso)
         self.notify(self.msg_app)
-        self.player.quantize_track(type, tracknum, reso)
+        if self.curseq.quantize_track(type, tracknum, reso) and type == 0:
+            self.make_undo("Quantize track", delta=1)
+
+    #-------------------------------------------
+
+    def quantize_all(self, reso=None, strength=None, swing=None, *args, **kwargs):
+        """
+        quantize all tracks, with resolution, strength and swing in percent
+        from InterfaceApp object
+        """
+
+        try:
+            reso = int(reso) if reso is not None else self.curseq.quan_res
+            strength = int(strength) if strength is not None else -1
+            swing = int(swing) if swing is not None else -1
+        except ValueError:
+            return
+        count = self.curseq.quantize_tracks(None, reso, strength, swing)
+        if count: self.make_undo("Quantize tracks", delta=1)
+        self.msg_app = f"Quantize: {reso}, {count} tracks modified"
+        self.notify(self.msg_app)
 
     #-------------------------------------------
 
@@ -1364,7 +1558,7 @@ class InterfaceApp(object):
             (l_loc, r_loc) = self.curseq.get_locators()
             self.clip.cut_to_clip(tracks_sel, l_loc, r_loc)
             title = "Cut tracks"
-            self.make_undo(title)
+            self.make_undo(title, delta=1)
             l_loc = self.format2bar(l_loc)
             r_loc = self.format2bar(r_loc)
             msg = "Cutting tracks from {}, to {}".format(l_loc, r_loc)
@@ -1386,7 +1580,7 @@ class InterfaceApp(object):
             (l_loc, r_loc) = self.curseq.get_locators()
             self.clip.erase_to_clip(tracks_sel, l_loc, r_loc)
             title = "Erase tracks"
-            self.make_undo(title)
+            self.make_undo(title, delta=1)
             l_loc = self.format2bar(l_loc)
             r_loc = self.format2bar(r_loc)
             msg = "Erasing track from {}, to {}".format(l_loc, r_loc)
@@ -1404,7 +1598,7 @@ class InterfaceApp(object):
         pos = self.curseq.get_position()
         self.clip.paste_replace(pos)
         title = "Paste replace tracks"
-        self.make_undo(title)
+        self.make_undo(title, delta=1)
         pos = self.format2bar(pos)
         msg = "Paste replace tracks at  {}".format(pos)
         self.msg_app = msg
@@ -1421,7 +1615,7 @@ class InterfaceApp(object):
         pos = self.curseq.get_position()
         self.clip.paste_merge(pos)
         title = "Paste merge tracks"
-        self.make_undo(title)
+        self.make_undo(title, delta=1)
         pos = self.format2bar(pos)
         msg = "Paste merge tracks at  {}".format(pos)
         self.msg_app = msg
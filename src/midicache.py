@@ -0,0 +1,260 @@
+#!/usr/bin/python3
+"""
+    File: midicache.py:
+    Module for caching parsed midi files on disk, to reopen known files without parsing them
+    Date: Sun, 18/10/2026
+    Author: Coolbrother
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+import mido
+from mido.midifiles.meta import build_meta_message
+import midistore as mst
+import midifile as midfile
+
+_cache_dir = os.path.expanduser("~/.cache/zikdrum")
+_cache_version =1
+
+#-----------------------------------------
+
+def hash_file(filename):
+    """
+    returns the content hash of a file
+    """
+
+    with open(filename, 'rb') as infile:
+        return hashlib.blake2b(infile.read(), digest_size=16).hexdigest()
+
+#-----------------------------------------
+
+def encode_meta(meta_lst):
+    """
+    returns a tuple of bytes array, offsets and ticks arrays from meta and sysex messages
+    """
+
+    buf = bytearray()
+    offsets = [0]
+    ticks = []
+    for msg in meta_lst:
+        buf.extend(msg.bytes())
+        offsets.append(len(buf))
+        ticks.append(msg.time)
+
+    return (np.frombuffer(bytes(buf), dtype=np.uint8),
+            np.array(offsets, dtype=np.int64), np.array(ticks, dtype=np.int64))
+
+#-----------------------------------------
+
+def decode_meta(buf, offsets, ticks):
+    """
+    returns a list of meta and sysex messages from encoded arrays
+    """
+
+    meta_lst = []
+    data = buf.tobytes()
+    offsets = offsets.tolist()
+    for (i, tick) in enumerate(ticks.tolist()):
+        raw = data[offsets[i]:offsets[i+1]]
+        if raw[0] == 0xff:
+            (length, pos) = midfile.read_varlen(raw, 2)
+            msg = build_meta_message(raw[1], list(raw[pos:pos+length]), tick)
+        else: # sysex
+            msg = mido.Message.from_bytes(raw, time=tick)
+        meta_lst.append(msg)
+
+    return meta_lst
+
+#-----------------------------------------
+
+class MidiFileCache(object):
+    """
+    Disk cache of parsed midi files
+    One npz file by midi file, keyed by path, and validated by mtime, size and content hash
+    The least recently used files are removed when the cache exceeds max_size
+    """
+    def __init__(self, cache_dir=_cache_dir, max_size=128 << 20):
+        self.cache_dir = cache_dir
+        self.max_size = max_size # in bytes
+        self.hit_count =0
+        self.miss_count =0
+
+    #-----------------------------------------
+
+    def get_cache_filename(self, filename):
+        """
+        returns the cache file name for a midi file
+        from MidiFileCache object
+        """
+
+        key = hashlib.blake2b(os.path.abspath(filename).encode(), digest_size=16).hexdigest()
+
+        return os.path.join(self.cache_dir, key + ".npz")
+
+    #-----------------------------------------
+
+    def load(self, filename):
+        """
+        returns the cached entry dictionnary for a midi file, or None when missing or outdated
+        entry contains header dictionnary, stores list, and timeline store or None
+        from MidiFileCache object
+        """
+
+        cache_filename = self.get_cache_filename(filename)
+        try:
+            stat = os.stat(filename)
+            with np.load(cache_filename, allow_pickle=False) as npz:
+                header = json.loads(str(npz['header']))
+                if header.get('version') != _cache_version\
+                        or header['path'] != os.path.abspath(filename):
+                    raise ValueError("bad cache header")
+                touched = header['mtime'] != stat.st_mtime_ns or header['size'] != stat.st_size
+                if touched:
+                    # file touched, checking its content
+                    if header['hash'] != hash_file(filename):
+                        raise ValueError("outdated cache")
+                arrays = dict(npz.items())
+        except (OSError, ValueError, KeyError):
+            self.miss_count +=1
+            return None
+        if touched:
+            # same content, updating the header, to not hash the file at each opening
+            header.update(mtime=stat.st_mtime_ns, size=stat.st_size)
+            arrays['header'] = np.array(json.dumps(header))
+            try:
+                self.write_arrays(cache_filename, arrays)
+            except OSError:
+                pass
+
+        meta_lst = decode_meta(arrays['meta_data'], arrays['meta_offsets'], arrays['meta_ticks'])
+        data = arrays['rows']
+        row_offsets = arrays['row_offsets'].tolist()
+        meta_counts = arrays['meta_counts'].tolist()
+        store_lst = []
+        meta_start =0
+        for (i, count) in enumerate(meta_counts):
+            store = mst.MidiEventStore(data[row_offsets[i]:row_offsets[i+1]].copy(),
+                    meta_lst[meta_start:meta_start+count])
+            store_lst.append(store)
+            meta_start += count
+        tim_store = None
+        if 'timeline' in arrays:
+            # timeline meta index refers to the meta messages of all tracks
+            tim_store = mst.MidiEventStore(arrays['timeline'], meta_lst)
+        # most recently used
+        os.utime(cache_filename)
+        self.hit_count +=1
+
+        return {'header': header, 'stores': store_lst, 'timeline': tim_store}
+
+    #-----------------------------------------
+
+    def save(self, filename, header, store_lst, tim_store=None):
+        """
+        save the stores of a midi file in the cache
+        returns True whether saved
+        from MidiFileCache object
+        """
+
+        try:
+            stat = os.stat(filename)
+            header = dict(header, version=_cache_version, path=os.path.abspath(filename),
+                    mtime=stat.st_mtime_ns, size=stat.st_size, hash=hash_file(filename))
+            meta_lst = []
+            for store in store_lst: meta_lst.extend(store.meta_lst)
+            (meta_data, meta_offsets, meta_ticks) = encode_meta(meta_lst)
+            arrays = {
+                    'header': np.array(json.dumps(header)),
+                    'rows': np.concatenate([store.data for store in store_lst])\
+                            if store_lst else np.zeros(0, dtype=mst.ev_dtype),
+                    'row_offsets': np.cumsum([0] + [len(store) for store in store_lst]),
+                    'meta_counts': np.array([len(store.meta_lst) for store in store_lst], dtype=np.int64),
+                    'meta_data': meta_data,
+                    'meta_offsets': meta_offsets,
+                    'meta_ticks': meta_ticks,
+                    }
+            if tim_store is not None:
+                arrays['timeline'] = tim_store.data
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.write_arrays(self.get_cache_filename(filename), arrays)
+        except (OSError, ValueError):
+            return False
+        self.evict()
+
+        return True
+
+    #-----------------------------------------
+
+    def write_arrays(self, cache_filename, arrays):
+        """
+        write the arrays dictionnary in a cache file
+        from MidiFileCache object
+        """
+
+        # writing in a temporary file, to never leave a partial cache file
+        tmp_filename = cache_filename + ".tmp"
+        with open(tmp_filename, 'wb') as outfile:
+            np.savez(outfile, **arrays)
+        os.replace(tmp_filename, cache_filename)
+
+    #-----------------------------------------
+
+    def evict(self):
+        """
+        remove the least recently used cache files, until the cache size is under max_size
+        returns the number of removed files
+        from MidiFileCache object
+        """
+
+        count =0
+        try:
+            lst = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".npz"):
+                    stat = entry.stat()
+                    lst.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return 0
+        lst.sort()
+        total = sum(item[1] for item in lst)
+        # keeping at least the most recent file
+        for (_, size, path) in lst[:-1]:
+            if total <= self.max_size: break
+            try:
+                os.remove(path)
+                total -= size
+                count +=1
+            except OSError:
+                pass
+
+        return count
+
+    #-----------------------------------------
+
+    def clear(self):
+        """
+        remove all cache files
+        from MidiFileCache object
+        """
+
+        count =0
+        try:
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".npz"):
+                    os.remove(entry.path)
+                    count +=1
+        except OSError:
+            pass
+
+        return count
+
+    #-----------------------------------------
+
+#========================================
+
+if __name__ == "__main__":
+    cache = MidiFileCache()
+    input("It's OK")
+#-----------------------------------------
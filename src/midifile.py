@@ -0,0 +1,409 @@
+#!/usr/bin/python3
+"""
+    File: midifile.py:
+    Module for reading and writing Standard Midi Files, parsing chunks from a memoryview with struct,
+    without building a mido object graph
+    Date: Sun, 18/10/2026
+    Author: Coolbrother
+"""
+
+import mmap
+import struct
+import heapq
+from operator import itemgetter
+import mido
+from mido.midifiles.meta import build_meta_message
+import midistore as mst
+
+# data length by status command
+_data_len = {
+        0x80: 2, 0x90: 2, 0xa0: 2, 0xb0: 2,
+        0xc0: 1, 0xd0: 1, 0xe0: 2,
+        }
+
+# type code in MidiEventStore by status command
+_status_codes = {
+        0x80: mst.TYPE_NOTE_OFF, 0x90: mst.TYPE_NOTE_ON,
+        0xa0: mst.TYPE_POLYTOUCH, 0xb0: mst.TYPE_CONTROL_CHANGE,
+        0xc0: mst.TYPE_PROGRAM_CHANGE, 0xd0: mst.TYPE_AFTERTOUCH,
+        0xe0: mst.TYPE_PITCHWHEEL,
+        }
+
+# status command by type code in MidiEventStore
+_code_status = dict((code, cmd) for (cmd, code) in _status_codes.items())
+
+_new_message = mido.Message.__new__
+
+#-----------------------------------------
+
+def read_varlen(data, pos):
+    """
+    returns a tuple of variable length value and the next position
+    """
+
+    byte = data[pos]
+    pos +=1
+    val = byte & 0x7f
+    while byte & 0x80:
+        byte = data[pos]
+        pos +=1
+        val = (val << 7) | (byte & 0x7f)
+
+    return (val, pos)
+
+#-----------------------------------------
+
+def write_varlen(buf, val):
+    """
+    append a variable length value to the buffer
+    """
+
+    if val < 0x80:
+        buf.append(val)
+        return
+    lst = [val & 0x7f]
+    val >>= 7
+    while val:
+        lst.append((val & 0x7f) | 0x80)
+        val >>= 7
+    lst.reverse()
+    buf.extend(lst)
+
+#-----------------------------------------
+
+def iter_events(data):
+    """
+    generator of raw events in a track chunk, with absolute tick,
+    handling running status
+    yields tuple of tick, status, data1, data2 and message
+    message is a mido message for meta and sysex events, None for channel events
+    Note: note_on with velocity 0 is returned as note_off
+    """
+
+    pos =0
+    end = len(data)
+    tick =0
+    last_status =0
+    try:
+        while pos < end:
+            # variable length delta time
+            byte = data[pos]
+            pos +=1
+            delta = byte & 0x7f
+            while byte & 0x80:
+                byte = data[pos]
+                pos +=1
+                delta = (delta << 7) | (byte & 0x7f)
+            tick += delta
+            status = data[pos]
+            if status < 0x80:
+                # running status, the byte is the first data byte
+                if not last_status:
+                    raise OSError("running status without last status")
+                status = last_status
+            else:
+                pos +=1
+
+            if status < 0xf0:
+                last_status = status
+                cmd = status & 0xf0
+                data1 = data[pos]
+                if _data_len[cmd] == 2:
+                    data2 = data[pos +1]
+                    pos +=2
+                else:
+                    data2 =0
+                    pos +=1
+                if data1 > 127 or data2 > 127:
+                    raise OSError("data byte must be in range 0..127")
+                if cmd == 0x90 and data2 == 0:
+                    status = 0x80 | (status & 0x0f)
+                yield (tick, status, data1, data2, None)
+
+            elif status == 0xff:
+                # meta messages do not set running status
+                meta_type = data[pos]
+                (length, pos) = read_varlen(data, pos +1)
+                msg = build_meta_message(meta_type, list(data[pos:pos+length]), tick)
+                pos += length
+                yield (tick, status, meta_type, 0, msg)
+
+            elif status == 0xf0 or status == 0xf7:
+                # sysex messages cancel running status
+                last_status =0
+                (length, pos) = read_varlen(data, pos)
+                sysex = list(data[pos:pos+length])
+                pos += length
+                # strip start and end bytes
+                if sysex and sysex[0] == 0xf0: sysex = sysex[1:]
+                if sysex and sysex[-1] == 0xf7: sysex = sysex[:-1]
+                msg = mido.Message('sysex', data=sysex, time=tick)
+                yield (tick, status, 0, 0, msg)
+
+            else:
+                raise OSError(f"undefined status byte 0x{status:02x}")
+
+    except IndexError:
+        raise EOFError("unexpected end of track")
+
+#-----------------------------------------
+
+def make_message(status, data1, data2, tick):
+    """
+    returns a new mido channel message from raw data, without checking
+    """
+
+    cmd = status & 0xf0
+    msg = _new_message(mido.Message)
+    if cmd == 0x90:
+        dic = {'type': 'note_on', 'note': data1, 'velocity': data2}
+    elif cmd == 0x80:
+        dic = {'type': 'note_off', 'note': data1, 'velocity': data2}
+    elif cmd == 0xb0:
+        dic = {'type': 'control_change', 'control': data1, 'value': data2}
+    elif cmd == 0xc0:
+        dic = {'type': 'program_change', 'program': data1}
+    elif cmd == 0xe0:
+        dic = {'type': 'pitchwheel', 'pitch': (data1 | (data2 << 7)) - 8192}
+    elif cmd == 0xa0:
+        dic = {'type': 'polytouch', 'note': data1, 'value': data2}
+    else:
+        dic = {'type': 'aftertouch', 'value': data1}
+    dic['channel'] = status & 0x0f
+    dic['time'] = tick
+    vars(msg).update(dic)
+
+    return msg
+
+#-----------------------------------------
+
+def make_row(status, data1, data2, tick, tracknum):
+    """
+    returns a row tuple for MidiEventStore, from raw data
+    """
+
+    cmd = status & 0xf0
+    if cmd == 0xe0:
+        data1 = (data1 | (data2 << 7)) - 8192
+        data2 =0
+
+    return (tick, _status_codes[cmd], status & 0x0f, data1, data2, tracknum)
+
+#-----------------------------------------
+
+class SmfTrack(object):
+    """
+    Track chunk, parsed on demand
+    """
+    def __init__(self, data):
+        self.data = data # memoryview on the chunk data
+
+    #-----------------------------------------
+
+    def iter_events(self):
+        """
+        returns generator of raw events
+        from SmfTrack object
+        """
+
+        return iter_events(self.data)
+
+    #-----------------------------------------
+
+    def __iter__(self):
+        """
+        returns generator of mido messages with absolute tick
+        from SmfTrack object
+        """
+
+        for (tick, status, data1, data2, msg) in iter_events(self.data):
+            if msg is None: msg = make_message(status, data1, data2, tick)
+            yield msg
+
+    #-----------------------------------------
+
+    def __len__(self):
+        return sum(1 for _ in iter_events(self.data))
+
+    #-----------------------------------------
+
+#========================================
+
+class SmfFile(object):
+    """
+    Standard Midi File reader
+    """
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.type =0
+        self.ticks_per_beat =0
+        self.tracks = []
+        if filename: self.load(filename)
+
+    #-----------------------------------------
+
+    def load(self, filename):
+        """
+        map the file and split its track chunks, without parsing them
+        from SmfFile object
+        """
+
+        with open(filename, 'rb') as infile:
+            try:
+                # the mapping stays valid after closing the file
+                data = memoryview(mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ))
+            except ValueError: # empty file
+                data = memoryview(b"")
+        if len(data) < 14:
+            raise EOFError("file too short for a midi file")
+        (name, size) = struct.unpack_from('>4sL', data, 0)
+        if name != b'MThd':
+            raise OSError('MThd not found. Probably not a MIDI file')
+        (self.type, num_tracks, self.ticks_per_beat) = struct.unpack_from('>hhh', data, 8)
+        self.filename = filename
+        self.tracks = []
+        pos = 8 + size
+        end = len(data)
+        while pos + 8 <= end and len(self.tracks) < num_tracks:
+            (name, size) = struct.unpack_from('>4sL', data, pos)
+            pos += 8
+            # unknown chunks are skipped
+            if name == b'MTrk':
+                self.tracks.append(SmfTrack(data[pos:pos+size]))
+            pos += size
+        if len(self.tracks) < num_tracks:
+            raise EOFError("missing track chunks")
+
+        return self
+
+    #-----------------------------------------
+
+#========================================
+
+class SmfWriter(object):
+    """
+    Standard Midi File writer
+    Serializes the tracks in a single pass, without copying the messages
+    """
+    def __init__(self, running_status=True):
+        self.running_status = running_status
+
+    #-----------------------------------------
+
+    def get_raw_events(self, track):
+        """
+        returns a list of raw events for MidiTrack object,
+        as tuples of tick, status, data1, data2 and message
+        message is the meta or sysex message, None for channel events
+        from SmfWriter object
+        """
+
+        store = track.get_store()
+        if store is None:
+            meta_lst = []
+            row_lst = [mst.msg2row(ev.msg, ev.msg.time, 0, meta_lst) for ev in track.get_list()]
+            if not row_lst: return []
+            col_lst = list(zip(*row_lst))
+        else:
+            data = store.data
+            meta_lst = store.meta_lst
+            col_lst = [data[name].tolist() for name in ('tick', 'type', 'channel', 'data1', 'data2')]
+        
+        res = []
+        type_meta = mst.TYPE_META
+        code_status = _code_status
+        for (tick, code, chan, data1, data2) in zip(*col_lst[:5]):
+            if code == type_meta:
+                res.append((tick, 0xff, 0, 0, meta_lst[data1]))
+            else:
+                res.append((tick, code_status[code] | chan, data1, data2, None))
+
+        return res
+
+    #-----------------------------------------
+
+    def encode_track(self, raw_lst):
+        """
+        returns track chunk data in bytearray, from raw events sorted by tick
+        end_of_track messages are removed, and only one is added at the end
+        from SmfWriter object
+        """
+
+        buf = bytearray()
+        append = buf.append
+        extend = buf.extend
+        running_status = self.running_status
+        last_status =0
+        last_tick =0
+        end_tick =0
+        for (tick, status, data1, data2, msg) in raw_lst:
+            if msg is not None and msg.type == 'end_of_track':
+                if tick > end_tick: end_tick = tick
+                continue
+            delta = tick - last_tick
+            last_tick = tick
+            # variable length delta time
+            if delta < 0x80: append(delta)
+            else: write_varlen(buf, delta)
+            if msg is None:
+                if status != last_status or not running_status:
+                    append(status)
+                    last_status = status
+                cmd = status & 0xf0
+                if cmd == 0xe0:
+                    data1 += 8192
+                    append(data1 & 0x7f)
+                    append(data1 >> 7)
+                elif cmd == 0xc0 or cmd == 0xd0:
+                    append(data1)
+                else:
+                    append(data1)
+                    append(data2)
+            elif msg.type == 'sysex':
+                # meta and sysex cancel running status
+                last_status =0
+                append(0xf0)
+                write_varlen(buf, len(msg.data) +1)
+                extend(msg.data)
+                append(0xf7)
+            else:
+                last_status =0
+                extend(msg.bytes())
+
+        # end of track
+        write_varlen(buf, max(end_tick - last_tick, 0))
+        extend(b'\xff\x2f\x00')
+
+        return buf
+
+    #-----------------------------------------
+
+    def write(self, filename, track_lst, ppq, format_type=1):
+        """
+        save MidiTrack objects to a midi file
+        format 0 merges all tracks in one track chunk
+        returns the number of track chunks written
+        from SmfWriter object
+        """
+
+        raw_lst = [self.get_raw_events(track) for track in track_lst]
+        if format_type == 0:
+            # merge is stable, so events at the same tick keep the track order
+            raw_lst = [list(heapq.merge(*raw_lst, key=itemgetter(0)))]
+        with open(filename, 'wb', buffering=1 << 16) as outfile:
+            outfile.write(struct.pack('>4sLhhh', b'MThd', 6, format_type, len(raw_lst), ppq))
+            for raw_evs in raw_lst:
+                buf = self.encode_track(raw_evs)
+                outfile.write(struct.pack('>4sL', b'MTrk', len(buf)))
+                outfile.write(buf)
+
+        return len(raw_lst)
+
+    #-----------------------------------------
+
+#========================================
+
+if __name__ == "__main__":
+    smf = SmfFile()
+    input("It's OK")
+#-----------------------------------------
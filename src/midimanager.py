@@ -8,16 +8,28 @@
 
 import time
 from collections import deque
+from functools import partial
 import fluidsynth
 import mido
 from constants import * # for patch_lst
 
+# status command by message type, for the dispatch tables
+_type_status = {
+        'note_off': 0x80, 'note_on': 0x90, 'polytouch': 0xa0, 'control_change': 0xb0,
+        'program_change': 0xc0, 'aftertouch': 0xd0, 'pitchwheel': 0xe0,
+        }
 
 class MidiFluid(object):
     """ fluidsynth manager """
     def __init__(self):
         self.fs = None
         self.sfid = None
+        self._dispatch = None # handlers indexed by status command
+        self._raw_dispatch = None # handlers for raw bytes, indexed by status command
+        self.seq = None # FluidSynth sequencer, to schedule messages ahead
+        self._seq_dest =-1 # synth client id in the sequencer
+        self._seq_tick =0 # sequencer time in msec, at the last synchronisation
+        self._seq_perf =0 # perf_counter time in sec, at the last synchronisation
 
     #-----------------------------------------
     
@@ -47,6 +59,52 @@ class MidiFluid(object):
         # bank select 128 for percussion
         self.fs.program_select(0, self.sfid, 0, 0)
         # self.fs.bank_select(0, 128)
+        self.init_dispatch()
+
+    #-----------------------------------------
+
+    def init_dispatch(self):
+        """
+        init the dispatch table, with the FluidSynth functions bound to the synth
+        the table is indexed by the status command, from 0x80 to 0xe0, shifted by 4 bits
+        each handler takes the channel and the message
+        from MidiFluid object
+        """
+
+        synth = self.fs.synth
+        noteon = partial(fluidsynth.fluid_synth_noteon, synth)
+        noteoff = partial(fluidsynth.fluid_synth_noteoff, synth)
+        cc = partial(fluidsynth.fluid_synth_cc, synth)
+        program_change = partial(fluidsynth.fluid_synth_program_change, synth)
+        pitch_bend = partial(fluidsynth.fluid_synth_pitch_bend, synth)
+        # pressure functions are missing in FluidSynth 1.x
+        if fluidsynth.fluid_synth_key_pressure:
+            key_pressure = partial(fluidsynth.fluid_synth_key_pressure, synth)
+        else:
+            key_pressure = lambda chan, key, val: None
+        if fluidsynth.fluid_synth_channel_pressure:
+            channel_pressure = partial(fluidsynth.fluid_synth_channel_pressure, synth)
+        else:
+            channel_pressure = lambda chan, val: None
+        self._dispatch = [
+                lambda chan, msg: noteoff(chan, msg.note), # 0x80
+                lambda chan, msg: noteon(chan, msg.note, msg.velocity), # 0x90
+                lambda chan, msg: key_pressure(chan, msg.note, msg.value), # 0xa0
+                lambda chan, msg: cc(chan, msg.control, msg.value), # 0xb0
+                lambda chan, msg: program_change(chan, msg.program), # 0xc0
+                lambda chan, msg: channel_pressure(chan, msg.value), # 0xd0
+                lambda chan, msg: pitch_bend(chan, msg.pitch + 8192), # 0xe0
+                ]
+        # handlers taking the channel and the raw bytes
+        self._raw_dispatch = [
+                lambda chan, data: noteoff(chan, data[1]),
+                lambda chan, data: noteon(chan, data[1], data[2]),
+                lambda chan, data: key_pressure(chan, data[1], data[2]),
+                lambda chan, data: cc(chan, data[1], data[2]),
+                lambda chan, data: program_change(chan, data[1]),
+                lambda chan, data: channel_pressure(chan, data[1]),
+                lambda chan, data: pitch_bend(chan, data[1] | (data[2] << 7)),
+                ]
 
     #-----------------------------------------
 
@@ -56,6 +114,7 @@ class MidiFluid(object):
         from MidiFluid object
         """
 
+        self.close_sequencer()
         if self.fs:
             print("Warning: Deleting FluidSynth")
             self.fs.delete()
@@ -80,57 +139,145 @@ class MidiFluid(object):
         """
         
         if self.fs is None: return
-        type = msg.type
-        bank =0
-        chan =0
-        fs = self.fs
-        if type in ['note_on', 'note_off']:
-            chan = msg.channel
-            
-            note = msg.note
-            msg.velocity =100
-            vel = msg.velocity
-            args = [chan, note, vel]
-        if type == "note_on":
-            fs.noteon(chan, msg.note, msg.velocity)
-        elif type == "note_off":
-            fs.noteoff(chan, msg.note)
-        elif type == "program_change":
-            fs.program_change(chan, msg.program)
-        elif type == "control_change":
-            fs.cc(chan, msg.control, msg.value)
-        elif type == "pitchwheel":
-            fs.pitch_bend(chan, msg.pitch)
+        self.send_imm(msg)
 
     #-----------------------------------------
 
     def send_imm(self, msg):
         """
         send incomming message immediately without test, to fluidsynth
+        Note: sysex and meta messages are ignored
         from MidiFluid object
         """
         
+        status = _type_status.get(msg.type)
+        if status is None: return
+        self._dispatch[(status >> 4) & 7](msg.channel, msg)
+
+    #-----------------------------------------
+
+    def send_batch(self, msg_lst):
+        """
+        send a group of messages immediately without test, to fluidsynth
+        from MidiFluid object
+        """
+
+        dispatch = self._dispatch
+        get_status = _type_status.get
+        for msg in msg_lst:
+            status = get_status(msg.type)
+            if status is not None:
+                dispatch[(status >> 4) & 7](msg.channel, msg)
+
+    #-----------------------------------------
+
+    def send_raw_batch(self, raw_lst):
+        """
+        send a group of raw midi bytes immediately without test, to fluidsynth
+        Note: system messages are ignored
+        from MidiFluid object
+        """
+
+        dispatch = self._raw_dispatch
+        for data in raw_lst:
+            status = data[0]
+            if status < 0xf0:
+                dispatch[(status >> 4) & 7](status & 0x0f, data)
+
+    #-----------------------------------------
+
+    def open_sequencer(self):
+        """
+        create the FluidSynth sequencer, with the synth as destination
+        returns True whether the sequencer is available
+        from MidiFluid object
+        """
+
+        if self.fs is None: return False
+        if self.seq is not None: return True
+        try:
+            # time scale in msec, and advancing with the system timer
+            seq = fluidsynth.Sequencer(time_scale=1000, use_system_timer=True)
+            self._seq_dest = seq.register_fluidsynth(self.fs)
+        except (fluidsynth.Error, TypeError) as err:
+            # TypeError for functions missing in the FluidSynth library
+            print(f"Error: unable to open the FluidSynth sequencer: {err}")
+            return False
+        self.seq = seq
+        self.sync_sequencer()
+
+        return True
+
+    #-----------------------------------------
+
+    def close_sequencer(self):
+        """
+        delete the FluidSynth sequencer, with its scheduled events
+        from MidiFluid object
+        """
+
+        if self.seq:
+            self.seq.remove_events()
+            self.seq.delete()
+            self.seq = None
+            self._seq_dest =-1
+
+    #-----------------------------------------
+
+    def sync_sequencer(self):
+        """
+        synchronise the sequencer clock with the perf_counter clock
+        from MidiFluid object
+        """
+
+        if self.seq is None: return
+        self._seq_tick = self.seq.get_tick()
+        self._seq_perf = time.perf_counter()
+
+    #-----------------------------------------
+
+    def schedule_msg(self, msg, due_time):
+        """
+        schedule message in the FluidSynth sequencer, with its own timestamp
+        due_time: send time on the perf_counter clock, in seconds
+        from MidiFluid object
+        """
+
+        seq = self.seq
+        if seq is None: return
+        # absolute sequencer time in msec
+        tick = self._seq_tick + round((due_time - self._seq_perf) * 1000)
+        if tick < self._seq_tick: tick = self._seq_tick
+        dest = self._seq_dest
         type = msg.type
-        bank =0
-        chan =0
-        fs = self.fs
-        if type in ['note_on', 'note_off']:
-            chan = msg.channel
-            
-            note = msg.note
-            msg.velocity =100
-            vel = msg.velocity
-            args = [chan, note, vel]
         if type == "note_on":
-            fs.noteon(chan, msg.note, msg.velocity)
+            if msg.velocity:
+                seq.note_on(tick, msg.channel, msg.note, msg.velocity, dest=dest)
+            else:
+                seq.note_off(tick, msg.channel, msg.note, dest=dest)
         elif type == "note_off":
-            fs.noteoff(chan, msg.note)
-        elif type == "program_change":
-            fs.program_change(chan, msg.program)
+            seq.note_off(tick, msg.channel, msg.note, dest=dest)
         elif type == "control_change":
-            fs.cc(chan, msg.control, msg.value)
+            seq.control_change(tick, msg.channel, msg.control, msg.value, dest=dest)
+        elif type == "program_change":
+            seq.program_change(tick, msg.channel, msg.program, dest=dest)
         elif type == "pitchwheel":
-            fs.pitch_bend(chan, msg.pitch)
+            seq.pitch_bend(tick, msg.channel, msg.pitch, dest=dest)
+        elif type == "aftertouch":
+            seq.channel_pressure(tick, msg.channel, msg.value, dest=dest)
+        elif type == "polytouch":
+            seq.key_pressure(tick, msg.channel, msg.note, msg.value, dest=dest)
+
+    #-----------------------------------------
+
+    def cancel_scheduled(self):
+        """
+        remove the scheduled events not yet played
+        from MidiFluid object
+        """
+
+        if self.seq is None: return
+        self.seq.remove_events()
 
     #-----------------------------------------
 
@@ -231,6 +378,7 @@ class MiniSynth(object):
         self._chan =0
         self._midi_out = None
         self._outport_num =0
+        self._send_raw = None # sending raw bytes to the output port
 
     #-----------------------------------------
     
@@ -253,6 +401,7 @@ class MiniSynth(object):
         """
         
         self._midi_out = None
+        self._send_raw = None
 
     #-----------------------------------------
 
@@ -272,7 +421,18 @@ class MiniSynth(object):
         except IndexError:
             print(f"Error opening midi output Port {port_num}")
             self._midi_out = None
+            self._send_raw = None
+            return None
         
+        port = self._midi_out
+        if mido.backend.name == 'mido.backends.rtmidi':
+            # mido has no public api to send raw bytes,
+            # so with the rtmidi backend, the bytes are sent to the rtmidi port held by the mido port,
+            # without building messages
+            self._send_raw = port._rt.send_message
+        else:
+            self._send_raw = lambda data: port.send(mido.Message.from_bytes(data))
+
         return self._midi_out
 
     #-----------------------------------------
@@ -287,6 +447,17 @@ class MiniSynth(object):
 
     #-----------------------------------------
 
+    def open_sequencer(self):
+        """
+        no sequencer for external synth
+        returns False
+        from MiniSynth object
+        """
+
+        return False
+
+    #-----------------------------------------
+
     def send_msg(self, msg):
         """
         send incomming message with test, to Midi Out
@@ -308,6 +479,30 @@ class MiniSynth(object):
 
     #-----------------------------------------
 
+    def send_batch(self, msg_lst):
+        """
+        send a group of messages immediately without test, to Midi Out
+        from MiniSynth object
+        """
+
+        send = self._midi_out.send
+        for msg in msg_lst:
+            send(msg)
+
+    #-----------------------------------------
+
+    def send_raw_batch(self, raw_lst):
+        """
+        send a group of raw midi bytes immediately without test, to Midi Out
+        from MiniSynth object
+        """
+
+        send_raw = self._send_raw
+        for data in raw_lst:
+            send_raw(data)
+
+    #-----------------------------------------
+
 
     def note_on(self, chan, note, vel):
         """
@@ -437,6 +632,105 @@ class MiniSynth(object):
 
 #========================================
 
+class MidiActiveNotes(object):
+    """
+    Active notes bitmap, with one integer of 128 bits by channel
+    Updated by the output stage, to send only the necessary note off messages
+    """
+    def __init__(self):
+        self.note_lst = [0] * 16
+
+    #-----------------------------------------
+
+    def update(self, msg):
+        """
+        update the bitmap with an outgoing message
+        from MidiActiveNotes object
+        """
+
+        type = msg.type
+        if type == 'note_on':
+            if msg.velocity:
+                self.note_lst[msg.channel] |= 1 << msg.note
+            else:
+                self.note_lst[msg.channel] &= ~(1 << msg.note)
+        elif type == 'note_off':
+            self.note_lst[msg.channel] &= ~(1 << msg.note)
+
+    #-----------------------------------------
+
+    def update_raw(self, data):
+        """
+        update the bitmap with outgoing raw midi bytes
+        from MidiActiveNotes object
+        """
+
+        status = data[0]
+        cmd = status & 0xf0
+        if cmd == 0x90 and data[2]:
+            self.note_lst[status & 0x0f] |= 1 << data[1]
+        elif cmd == 0x80 or cmd == 0x90:
+            self.note_lst[status & 0x0f] &= ~(1 << data[1])
+
+    #-----------------------------------------
+
+    def set_note(self, chan, note, active):
+        """
+        sets the note state on the channel
+        from MidiActiveNotes object
+        """
+
+        if active:
+            self.note_lst[chan] |= 1 << note
+        else:
+            self.note_lst[chan] &= ~(1 << note)
+
+    #-----------------------------------------
+
+    def clear(self, chan=-1):
+        """
+        clear active notes on the channel, or on all channels
+        from MidiActiveNotes object
+        """
+
+        if chan == -1:
+            self.note_lst = [0] * 16
+        else:
+            self.note_lst[chan] =0
+
+    #-----------------------------------------
+
+    def get_notes(self, chan=-1):
+        """
+        returns list of tuple channel and note for active notes
+        from MidiActiveNotes object
+        """
+
+        res = []
+        chan_lst = range(16) if chan == -1 else [chan]
+        for chan in chan_lst:
+            bits = self.note_lst[chan]
+            while bits:
+                low = bits & -bits
+                res.append((chan, low.bit_length() -1))
+                bits ^= low
+
+        return res
+
+    #-----------------------------------------
+
+    def count(self):
+        """
+        returns the number of active notes
+        from MidiActiveNotes object
+        """
+
+        return sum(bin(bits).count("1") for bits in self.note_lst)
+
+    #-----------------------------------------
+
+#========================================
+
 
 class MidiManager(object):
     """ Midi manager from mido module """
@@ -457,7 +751,9 @@ class MidiManager(object):
         self._bpm =100
         self._tempo = 60 / self._bpm # time in sec
         self._out_queue = deque()
-
+        self._timing_log = None # MidiTimingLog object for instrumentation
+        self._active_notes = MidiActiveNotes()
+        self._scheduled = deque() # scheduled notes not yet played, as tuple due_time, channel, note, active
 
     #-----------------------------------------
 
@@ -698,6 +994,7 @@ class MidiManager(object):
         from MidiManager object
         """
         
+        self._active_notes.update(msg)
         self._synth_obj.send_imm(msg)
 
     #-----------------------------------------
@@ -733,12 +1030,27 @@ class MidiManager(object):
         from MidiManager object
         """
         
+        _update = self._active_notes.update
         for msg in msg_lst:
-            self._synth_obj.send_imm(msg)
+            _update(msg)
+        self._synth_obj.send_batch(msg_lst)
 
     #-----------------------------------------
 
 
+    def send_raw(self, *raw_lst):
+        """
+        Send immediately raw midi bytes without test
+        from MidiManager object
+        """
+
+        _update = self._active_notes.update_raw
+        for data in raw_lst:
+            _update(data)
+        self._synth_obj.send_raw_batch(raw_lst)
+
+    #-----------------------------------------
+
     def input_callback(self, msg):
         """
         incomming messages callback
@@ -782,6 +1094,7 @@ class MidiManager(object):
 
         if self._synth_obj:
             self._synth_obj.note_on(chan, key, vel)
+            self._active_notes.set_note(chan, key, vel >0)
             self._notify(f"noteon, key: {key}, vel: {vel}, chan: {chan}")
 
     #-----------------------------------------
@@ -794,6 +1107,7 @@ class MidiManager(object):
 
         if self._synth_obj:
             self._synth_obj.note_off(chan, key)
+            self._active_notes.set_note(chan, key, 0)
             self._notify(f"noteoff, key: {key}, chan: {chan}")
 
     #-----------------------------------------
@@ -857,6 +1171,7 @@ class MidiManager(object):
 
         if self._synth_obj is None: return
         self._synth_obj.panic(chan)
+        self._active_notes.clear(chan)
         
         """
         control = 123 # all notes off
@@ -885,6 +1200,113 @@ class MidiManager(object):
 
     #-----------------------------------------
 
+    def notes_off(self, chan=-1):
+        """
+        send note off only for the active notes on the channel, or on all channels
+        returns the number of sent messages
+        from MidiManager object
+        """
+
+        if self._synth_obj is None: return 0
+        self.update_scheduled()
+        note_lst = self._active_notes.get_notes(chan)
+        for (chan_num, note) in note_lst:
+            msg = mido.Message('note_off', channel=chan_num, note=note)
+            self._synth_obj.send_imm(msg)
+        self._active_notes.clear(chan)
+
+        return len(note_lst)
+
+    #-----------------------------------------
+
+    def open_sequencer(self):
+        """
+        open the synth sequencer, to schedule messages ahead with their own timestamps
+        returns True whether the synth has a sequencer
+        from MidiManager object
+        """
+
+        if self._synth_obj is None: return False
+
+        return self._synth_obj.open_sequencer()
+
+    #-----------------------------------------
+
+    def sync_sequencer(self):
+        """
+        synchronise the synth sequencer clock with the perf_counter clock
+        from MidiManager object
+        """
+
+        if self._synth_obj is None: return
+        self._synth_obj.sync_sequencer()
+
+    #-----------------------------------------
+
+    def schedule(self, *msg_lst, due_time=0):
+        """
+        schedule messages in the synth sequencer
+        due_time: send time on the perf_counter clock, in seconds
+        Note: the active notes are updated when the notes are played, not at scheduling time
+        from MidiManager object
+        """
+
+        self.update_scheduled()
+        _append = self._scheduled.append
+        _schedule_msg = self._synth_obj.schedule_msg
+        for msg in msg_lst:
+            type = msg.type
+            if type == 'note_on':
+                _append((due_time, msg.channel, msg.note, msg.velocity >0))
+            elif type == 'note_off':
+                _append((due_time, msg.channel, msg.note, 0))
+            _schedule_msg(msg, due_time)
+
+    #-----------------------------------------
+
+    def update_scheduled(self):
+        """
+        update the active notes with the scheduled notes already played by the synth sequencer
+        Note: messages are scheduled in time order
+        from MidiManager object
+        """
+
+        scheduled = self._scheduled
+        if not scheduled: return
+        now = time.perf_counter()
+        set_note = self._active_notes.set_note
+        while scheduled and scheduled[0][0] <= now:
+            (_, chan, note, active) = scheduled.popleft()
+            set_note(chan, note, active)
+
+    #-----------------------------------------
+
+    def cancel_scheduled(self):
+        """
+        remove the scheduled messages not yet played, and stop the sounding notes
+        from MidiManager object
+        """
+
+        if self._synth_obj is None: return
+        self._synth_obj.cancel_scheduled()
+        # the notes due after the cancelling are removed, so never played
+        self.update_scheduled()
+        self._scheduled.clear()
+        self.notes_off()
+
+    #-----------------------------------------
+
+    def get_active_notes(self):
+        """
+        returns list of tuple channel and note for active notes
+        from MidiManager object
+        """
+
+        self.update_scheduled()
+        return self._active_notes.get_notes()
+
+    #-----------------------------------------
+
     def play_notes(self):
         """
         Test notes
@@ -922,6 +1344,7 @@ class MidiManager(object):
 
         if self._synth_obj is None: return
         self._synth_obj.reset()
+        self._active_notes.clear()
         self._chan =0
         self._prog =0
         self._notify("reset All Notes Off and Programs on all channels")
@@ -999,18 +1422,45 @@ class MidiManager(object):
 
     #-----------------------------------------
 
-    def poll_out(self, extra_proc=None):
+    def set_timing_log(self, timing_log):
+        """
+        sets the timing log, to record send time of messages
+        from MidiManager object
+        """
+
+        self._timing_log = timing_log
+
+    #-----------------------------------------
+
+    def poll_out(self, extra_proc=None, due_time=None, raw=0):
         """
         Poll out the _out_queue
+        due_time: intended send time on the perf_counter clock, to record lateness
+        raw: whether the queue contains raw midi bytes, instead of messages
         from MidiManager object
         """
         
         if self._synth_obj is None: return
         # managing extra processor function
         if extra_proc: pass # Note: TODO
-        while self._out_queue: # _out_queue has item
-            msg_ev = self._out_queue.popleft()
-            self._synth_obj.send_imm(msg_ev)
+        _timing_log = self._timing_log if due_time is not None else None
+        # the whole group is sent in one call
+        msg_lst = list(self._out_queue)
+        self._out_queue.clear()
+        if raw:
+            _update = self._active_notes.update_raw
+            for data in msg_lst:
+                _update(data)
+            self._synth_obj.send_raw_batch(msg_lst)
+        else:
+            _update = self._active_notes.update
+            for msg_ev in msg_lst:
+                _update(msg_ev)
+            self._synth_obj.send_batch(msg_lst)
+        if _timing_log is not None:
+            actual = time.perf_counter()
+            for _ in msg_lst:
+                _timing_log.add(due_time, actual)
 
     #-----------------------------------------
 
@@ -7,11 +7,14 @@
 """
 
 import time
+from collections import deque
 import miditools as midto
 import midisequence as midseq
 import midisched as midsch
 import logger as log
 import eventqueue as evq
+import miditiming as midtim
+import midicache as midcache
 
 log.set_level(log._OFF)
 # log.set_level(log._DEBUG)
@@ -82,6 +85,16 @@ class MidiPlayer(object):
         self._loop_count =0
         self._bpm =0
         self._delay_time = 0.010
+        self.sched_mode =1 # 0: polling with fixed delay, 1: sleeping until the next event, 2: lookahead, 3: synth sequencer
+        self.spin_time = 0.0005 # in sec, final spin window before the next event
+        self._max_wait = 0.1 # in sec, longest sleep before checking the player state
+        self.timing_log = midtim.MidiTimingLog()
+        self.lookahead_time = 0.05 # in sec, data computed ahead by the producer, in lookahead mode
+        self._lookahead = midsch.MidiLookahead(self.lookahead_time)
+        self.seq_ahead_time = 0.2 # in sec, messages scheduled ahead in the synth sequencer, in sequencer mode
+        self._sched_lst = deque() # due time and tick of the messages scheduled in the synth sequencer
+        self._scheduling =0 # whether messages may be waiting in the synth sequencer
+        self.raw_output =1 # whether the precompiled schedule is sent as raw midi bytes
 
 
     #-----------------------------------------
@@ -129,12 +142,14 @@ class MidiPlayer(object):
         self.curseq = midseq.MidiSequence(self)
         if self.curseq:
             self._base = self.curseq.base
+            self.curseq.file_cache = midcache.MidiFileCache()
             # self.curseq.gen_default_data()
             self.curseq.init_sequencer(self.midi_man)
             # self.click_track = self.curseq.click_track
         self._midi_sched = midsch.MidiSched()
         self._midi_sched.init(self.midi_man)
         self._midi_sched.set_player(self)
+        self.midi_man.set_timing_log(self.timing_log)
         # generate data for tempo track
         # pass the midi driver to all tracks
         # click on recording
@@ -186,9 +201,12 @@ class MidiPlayer(object):
            
         if self.curseq is None: return
         if not self._playing:
+            # compiling the render list before playing, whether necessary
+            if self.curseq.rendering: self.curseq.get_render()
             self._playing =1
             self._start_playing =1
             self._paused =0
+            self._midi_sched.wake()
             if not self.is_running():
                 # self.start_midi_engine()
                 print(f"Midi Engine is not Running.")
@@ -205,16 +223,24 @@ class MidiPlayer(object):
         self._playing =0
         self._start_playing =0
         self._paused =1
+        self._midi_sched.wake()
         if self._recording:
             self.stop_record()
         # self.stop_midi_engine()
-        self.midi_man.panic()
         self.init_click()
         # check whether recording data is waiting before generate the track line
         self.check_rec_data()
         
         # Updating tracks with the current position
         self.curseq.update_tracks_position(-1)
+        if self.sched_mode >= 2:
+            # waiting the dispatcher going out, before moving back the cursors
+            time.sleep(self._delay_time)
+            self.cancel_scheduled()
+            self.stop_lookahead()
+        # only the sounding notes are stopped,
+        # after cancelling the scheduled messages, to not leave hanging notes
+        self.midi_man.notes_off()
        
     #-----------------------------------------
 
@@ -236,7 +262,8 @@ class MidiPlayer(object):
         self._start_playing =0
         self._paused =0
         self._recording =0
-        self.midi_man.panic()
+        self._midi_sched.wake()
+        self.midi_man.notes_off()
         self.check_rec_data()
         self.set_position(0)
         debug()
@@ -287,21 +314,28 @@ class MidiPlayer(object):
         if pos == -1: pos = self.get_position()
         if played:
             self._playing =0
+            # stopping the producer, the cursors are moved below
+            self._lookahead.stop()
             # self.stop_engine()
-            # Note: Panic function is very important, to pause the Midi system
-            self.midi_man.panic()
+            # Note: stopping the sounding notes is very important, to pause the Midi system
+            self.midi_man.notes_off()
         if clicked:
             self.stop_click()
         if played or clicked:
             ### Note: Delay is necessary to pause the loop callback, and go out
+            self._midi_sched.wake()
             time.sleep(self._delay_time)
+        self.cancel_scheduled()
 
         self.init_pos()
         self.curseq.set_position(pos)
+        # restoring programs and controllers at the new position, before the first note
+        self.chase_position()
         
         if played:
             self._playing =1
             self._start_playing =1
+            self._midi_sched.wake()
             # self.start_engine()
             # time.sleep(0.1)
         if clicked:
@@ -310,6 +344,21 @@ class MidiPlayer(object):
         return pos
     #-----------------------------------------
 
+    def chase_position(self, pos=-1):
+        """
+        send in one burst the programs, controllers and pitch bend in effect at position
+        returns the number of sent messages
+        from MidiPlayer object
+        """
+
+        if self.curseq is None or not self.curseq.chasing: return 0
+        msg_lst = self.curseq.get_chase_data(pos)
+        if msg_lst: self.midi_man.send_imm(*msg_lst)
+
+        return len(msg_lst)
+
+    #-----------------------------------------
+
     def get_length(self):
         """
         returns length player
@@ -591,6 +640,8 @@ class MidiPlayer(object):
             ev_lst = rec_track.get_list()
             ev_lst.sort(key=lambda x: x.msg.time)
             # self.gen_time_set()
+            # marks the recorded range to update in the timeline
+            self.curseq.touch_track(tracknum, self.start_recpos, self.end_recpos)
             # there is data recorded in waiting
             self.rec_waiting =1
             self.incoming =0
@@ -610,7 +661,7 @@ class MidiPlayer(object):
         if self.incoming:
             self.arrange_rec_data()
         if self.rec_waiting:
-            self.gen_trackline()
+            self.curseq.update_timeline()
             # log.debug("je suis la")
 
     #-----------------------------------------
@@ -716,18 +767,18 @@ class MidiPlayer(object):
         else:
             self.last_time = pos
 
-        self.start_time = time.time()
+        self.start_time = time.perf_counter()
         
         return self.last_time
     #-----------------------------------------
 
     def init_start_time(self):
         """
-        init start_time
+        init start_time, with a monotonic clock
         from MidiPlayer object
         """
         
-        self.start_time = time.time()
+        self.start_time = time.perf_counter()
 
     #-----------------------------------------
 
@@ -737,7 +788,7 @@ class MidiPlayer(object):
         from MidiPlayer object
         """
 
-        return (time.time() - self.start_time) + self.last_time
+        return (time.perf_counter() - self.start_time) + self.last_time
 
     #-----------------------------------------
     def set_last_time(self, _time):
@@ -774,7 +825,7 @@ class MidiPlayer(object):
         self.last_time = self.curseq.base.tick2sec(curpos)
         seq_len = self.curseq.get_length()
         # start_time = time.time() # self.init_clock()
-        self.start_time = time.time() # self.init_time()
+        self.init_start_time()
 
         log.debug("")
         while self._playing and _is_running():
@@ -803,6 +854,8 @@ class MidiPlayer(object):
                  
                 # whether is looping
                 if self.curseq.loop_manager():
+                    # notes sounding at the loop end are stopped
+                    self.midi_man.notes_off()
                     start_time = time.time() # self.init_clock()
                     # self._player.check_rec_data()
                     msg_ev = None
@@ -926,6 +979,16 @@ class MidiPlayer(object):
         _get_click_data = self.curseq.get_click_data
         _timeline = self.curseq._timeline
         _send_imm = self.midi_man.send_imm
+        _render = None
+        _raw =0
+        if self.curseq.rendering:
+            # precompiled schedule, compiled only after edits or tempo changes
+            _render = self.curseq.get_render()
+            _get_playable_data = _render.get_data
+            if self.raw_output:
+                # bytes encoded at compile time
+                _get_playable_data = _render.get_raw
+                _raw =1
 
         _out_queue = self.midi_man.get_out_queue()
         _deq_push_item = self.midi_man.push_item
@@ -936,6 +999,11 @@ class MidiPlayer(object):
         # debug(f"is_clicking: {self._clicking}")
         if not (_is_running()): return
         if not (self._playing or self._clicking): return
+        # the data are computed by the producer thread
+        if self.sched_mode == 2 and self._playing:
+            return self._dispatch_callback()
+        if self.sched_mode == 3 and self._playing:
+            return self._schedule_callback()
        
         seq_pos = self.get_position()
         seq_len = self.get_length()
@@ -944,8 +1012,10 @@ class MidiPlayer(object):
         next_tick =0
         next_time =0
         reltime =0 # relative clock timing
-        _bpm_changed =0
         _delay_time = self._delay_time
+        _sched_mode = self.sched_mode
+        _sleep_until = self._sleep_until
+        _timing_log = self.timing_log
         _play_mode =0
 
         if self.last_time == -1:
@@ -958,6 +1028,7 @@ class MidiPlayer(object):
             self._loop_count =0
             self._start_playing =0
             self._bpm_changed =0
+            _timing_log.reset()
 
         if self._clicking:        
             self.init_start_time() # time.time()
@@ -1022,24 +1093,6 @@ class MidiPlayer(object):
                     # debug(f"After retrieve data, curtick: {curtick},  _deq_data count: {_deq_count()}")
                     msg_timing =1
 
-                    # """
-                    if _evq_instance.is_pending():
-                        evmsg = _evq_instance.pop_event()
-                        if evmsg.type == evq.EVENT_BPM_CHANGED: # and evmsg.value <= 83:
-                            self._bpm_changed =1
-                            self._bpm = evmsg.value
-                            # curtime = _tick2sec(curtick)
-
-                            """
-                            debug(f"Bpm Changed: {evmsg.value:.3f}, at curtick: {curtick},\n"
-                                    f"    cur_reltime: {reltime:.3f}, curtime: {curtime:.3f}") 
-                            """
-
-                            _bpm_changed =1
-                            # self._playing =0
-                            # break
-                    # """
-
                     """
                     if not _out_queue:
                         self._count += 1
@@ -1056,14 +1109,20 @@ class MidiPlayer(object):
                     # Sending ev
                     # log.debug(f"Sending message, and Drain out _deq_data with count: {_deq_count()}, at reltime: {reltime:.3f},\n" 
                     #        f"    curtick: {curtick}, curtime: {curtime:.3f}\n", bell=0)
-                    if _out_queue: _deq_poll_out(extra_proc=None)
+                    _timing_log.set_queue_depth(len(_out_queue))
+                    # intended time on the perf_counter clock, to record lateness
+                    due_time = self.start_time + curtime - self.last_time
+                    if _out_queue: _deq_poll_out(extra_proc=None, due_time=due_time, raw=_raw)
                     msg_timing =0
                 
                 # Manage next events
                 if not msg_timing and not _out_queue:
                     # log.debug(f"Now _deq_data is empty at curtick: {curtick}, next_tick:  {next_tick}", bell=0)
                     # Getting next tick
-                    next_tick = _timeline.next_ev_time()
+                    if _render is not None:
+                        (next_tick, next_time) = _render.next_time()
+                    else:
+                        next_tick = _timeline.next_ev_time()
                     # Better to use when we have allready a list of grouping time
                     # Returns a tuple of index and time on the track
                     # (_, next_tick) = _timeline.next_group_time()
@@ -1083,19 +1142,9 @@ class MidiPlayer(object):
                         self._playing =0
                         return -1
                         
-                    next_time = _tick2sec(next_tick)
+                    # tick2sec uses the tempo map, so no time jump on tempo changes
+                    if _render is None: next_time = _tick2sec(next_tick)
                     # log.debug(f"After forward timeline, next_tick: {next_tick}, next_time: {next_time:.3f}", bell=0)
-                    if _bpm_changed:
-                        old_reltime = reltime
-                        jumptime = _tick2sec(curtick)
-                        reltime = self.set_reltime(jumptime)
-                        _bpm_changed =0
-                        
-                        """
-                        debug(f"After Tempo changed: old_reltime: {old_reltime:.3f}, curtick: {curtick}, curtime: {curtime:.3f},\n"
-                                f"    new reltime: {reltime:.3f}, next_tick: {next_tick}, next_time: {next_time}")
-                        """
-
                     curtick = next_tick
                     curtime = next_time
                     # Saving the player position
@@ -1126,7 +1175,12 @@ class MidiPlayer(object):
         
 
             self._loop_count +=1
-            time.sleep(_delay_time)
+            _timing_log.loop_count +=1
+            if _sched_mode == 1 and _play_mode == 0:
+                # sleeping until the next event, without sleeping whether there is nothing to wait
+                if msg_timing: _sleep_until(curtime)
+            else:
+                time.sleep(_delay_time)
 
         # Out of loop
         log.debug(f"\nOut of loop, clearing _deq_data with count: {_deq_count()}")
@@ -1140,9 +1194,335 @@ class MidiPlayer(object):
         log.debug(f"After the loop, last_tick: {last_tick}, next_tick: {next_tick},\n" 
                 f"    curtime: {curtime:.3f}, reltime: {reltime:.3f}, last_time: {last_time:.3f}")
     #-----------------------------------------
+
+    def _produce_callback(self):
+        """
+        filling the lookahead buffer with time-stamped messages,
+        until lookahead_time ahead of the clock
+        Note: called by the producer thread, in lookahead and sequencer mode
+        from MidiPlayer object
+        """
+
+        if self.sched_mode not in (2, 3): return
+        _la = self._lookahead
+        _is_running = self._midi_sched.is_running
+        _wait_producer = self._midi_sched.wait_producer
+        _get_playable_data = self.curseq.get_playable_data
+        _tick2sec = self._base.tick2sec
+        _timeline = self.curseq._timeline
+        _render = None
+        if self.curseq.rendering:
+            _render = self.curseq.get_render()
+            _get_playable_data = _render.get_raw if _la.raw else _render.get_data
+
+        # the dispatcher resets the buffer before producing
+        while _is_running() and self._playing and not self._start_playing:
+            if _la.finished: return
+            generation = _la.generation
+            ahead = _la.get_ahead(self.get_reltime())
+            if ahead >= _la.depth:
+                # sleeping until the buffer goes under the lookahead depth
+                _wait_producer(min(ahead - _la.depth + self.spin_time, self._max_wait))
+                continue
+            tick = _la.next_tick
+            msg_lst = _get_playable_data(tick)
+            if _render is not None:
+                (next_tick, next_time) = _render.next_time()
+            else:
+                next_tick = _timeline.next_ev_time()
+                next_time = _tick2sec(next_tick) if next_tick != -1 else -1
+            if not _la.push(generation, tick, msg_lst, next_tick, next_time): return
+
+    #-----------------------------------------
+
+    def stop_lookahead(self):
+        """
+        stop the producer, and moves back the sequence cursors
+        to the first message computed ahead but not yet sent
+        from MidiPlayer object
+        """
+
+        tick = self._lookahead.stop()
+        if self._sched_lst:
+            # scheduled in the synth sequencer, but not yet played
+            tick = self._sched_lst[0][1]
+            self._sched_lst.clear()
+        if tick == -1: return
+        pos = self.get_position()
+        self.curseq.set_position(tick)
+        # keeping the player position at the last sent message
+        self.set_play_pos(pos)
+
+    #-----------------------------------------
+
+    def _dispatch_callback(self):
+        """
+        sending the due messages from the lookahead buffer, without computing them
+        returns -1 at the end of the sequence
+        Note: called by the scheduler thread, in lookahead mode
+        from MidiPlayer object
+        """
+
+        _la = self._lookahead
+        _is_running = self._midi_sched.is_running
+        _out_queue = self.midi_man.get_out_queue()
+        _deq_push_item = self.midi_man.push_item
+        _deq_poll_out = self.midi_man.poll_out
+        _sleep_until = self._sleep_until
+        _wait = self._midi_sched.wait
+        _timing_log = self.timing_log
+        curtick = self.get_position()
+        reltime =0
+        waiting =0 # whether the buffer was empty, waiting for the producer
+
+        if self._start_playing:
+            curtime = self._base.tick2sec(curtick)
+            if self.last_time == -1:
+                self.set_last_time(curtime)
+            self.init_start_time()
+            _out_queue.clear()
+            self._count =0
+            self._loop_count =0
+            self._bpm_changed =0
+            _timing_log.reset()
+            _la.depth = self.lookahead_time
+            _la.raw = 1 if (self.raw_output and self.curseq.rendering) else 0
+            _la.reset(curtick, curtime)
+            self._start_playing =0
+            self._midi_sched.wake_producer()
+
+        while _is_running() and self._playing:
+            reltime = self.get_reltime()
+            item = _la.peek()
+            if item is None:
+                if _la.finished:
+                    # Saving the player position
+                    self.set_play_pos(curtick)
+                    self._playing =0
+                    return -1
+                waiting =1
+                _wait(self.spin_time)
+                continue
+            (due, tick, msg_lst) = item
+            if reltime < due:
+                _sleep_until(due)
+                continue
+            _la.pop()
+            if waiting:
+                # the producer was late for this item, not counting the first one at start
+                if _la.pop_count >1 and reltime - due > self.spin_time: _la.underrun_count +=1
+                waiting =0
+            curtick = tick
+            self.set_play_pos(curtick)
+            if msg_lst:
+                _deq_push_item(*msg_lst)
+                _timing_log.set_queue_depth(len(_out_queue))
+                # intended time on the perf_counter clock, to record lateness
+                _deq_poll_out(extra_proc=None, due_time=self.start_time + due - self.last_time, raw=_la.raw)
+            self._loop_count +=1
+            _timing_log.loop_count +=1
+
+        # Saving the curtime position
+        if reltime: self.set_last_time(reltime)
+
+        return 0
+
+    #-----------------------------------------
+
+    def _schedule_callback(self):
+        """
+        scheduling the messages from the lookahead buffer ahead in the synth sequencer,
+        with their own timestamps, and waking only a few times per second
+        returns -1 at the end of the sequence
+        Note: called by the scheduler thread, in sequencer mode
+        from MidiPlayer object
+        """
+
+        _la = self._lookahead
+        _sched_lst = self._sched_lst
+        _is_running = self._midi_sched.is_running
+        _schedule = self.midi_man.schedule
+        _wait = self._midi_sched.wait
+        _timing_log = self.timing_log
+        curtick = self.get_position()
+        reltime =0
+
+        if self._start_playing:
+            curtime = self._base.tick2sec(curtick)
+            if self.last_time == -1:
+                self.set_last_time(curtime)
+            self.init_start_time()
+            self.midi_man.sync_sequencer()
+            self._count =0
+            self._loop_count =0
+            self._bpm_changed =0
+            _timing_log.reset()
+            _sched_lst.clear()
+            # the producer keeps the buffer ahead of the scheduled messages
+            _la.depth = self.seq_ahead_time + self.lookahead_time
+            # the synth sequencer schedules messages, not raw bytes
+            _la.raw =0
+            _la.reset(curtick, curtime)
+            self._start_playing =0
+            self._scheduling =1
+            self._midi_sched.wake_producer()
+
+        ahead = self.seq_ahead_time
+        while _is_running() and self._playing:
+            reltime = self.get_reltime()
+            # the player position follows the played messages
+            while _sched_lst and _sched_lst[0][0] <= reltime:
+                curtick = _sched_lst.popleft()[1]
+            self.set_play_pos(curtick)
+            limit = reltime + ahead
+            item = _la.peek()
+            while item is not None and item[0] <= limit:
+                (due, tick, msg_lst) = item
+                _la.pop()
+                # the producer was late for this item, not counting the first one at start
+                if due < reltime and _la.pop_count >1: _la.underrun_count +=1
+                if msg_lst:
+                    _schedule(*msg_lst, due_time=self.start_time + due - self.last_time)
+                _sched_lst.append((due, tick))
+                item = _la.peek()
+            if item is None and _la.finished and not _sched_lst:
+                # Saving the player position
+                self.set_play_pos(curtick)
+                self._playing =0
+                return -1
+            _timing_log.set_queue_depth(len(_sched_lst))
+            self._loop_count +=1
+            _timing_log.loop_count +=1
+            if item is None and not _la.finished:
+                # waiting for the producer
+                _wait(self.spin_time)
+            else:
+                # the synth sequencer plays the messages, until the next refill
+                _wait(min(ahead / 2, self._max_wait))
+
+        # removing the messages not yet played, before saving the position
+        self.cancel_scheduled()
+        reltime = self.get_reltime()
+        self.set_last_time(reltime)
+        while _sched_lst and _sched_lst[0][0] <= reltime:
+            self.set_play_pos(_sched_lst.popleft()[1])
+
+        return 0
+
+    #-----------------------------------------
+
+    def cancel_scheduled(self):
+        """
+        remove the messages scheduled in the synth sequencer, not yet played
+        from MidiPlayer object
+        """
+
+        if not self._scheduling: return
+        self.midi_man.cancel_scheduled()
+        self._scheduling =0
+
+    #-----------------------------------------
    
 
 
+    def _sleep_until(self, deadline):
+        """
+        sleeping until deadline in relative time,
+        spinning in the final window for better accuracy
+        returns 1 whether waked up before the deadline
+        from MidiPlayer object
+        """
+
+        wait = deadline - self.get_reltime() - self.spin_time
+        while wait > 0:
+            if self._midi_sched.wait(min(wait, self._max_wait)): return 1
+            if not self._playing: return 1
+            wait = deadline - self.get_reltime() - self.spin_time
+        while self.get_reltime() < deadline:
+            if not self._playing: return 1
+
+        return 0
+
+    #-----------------------------------------
+
+    def get_timing_stats(self):
+        """
+        returns a dictionnary of timing error statistics in msec,
+        loop rate, out queue depth, lookahead buffer length and underruns
+        from MidiPlayer object
+        """
+
+        stats = self.timing_log.get_stats()
+        stats["lookahead"] = len(self._lookahead)
+        stats["underruns"] = self._lookahead.underrun_count
+
+        return stats
+
+    #-----------------------------------------
+
+    def dump_timing(self, filename):
+        """
+        dump raw timing samples to a file
+        returns the number of samples
+        from MidiPlayer object
+        """
+
+        return self.timing_log.dump(filename)
+
+    #-----------------------------------------
+
+    def set_sched_mode(self, mode, spin_time=-1):
+        """
+        sets scheduler mode, 0: polling with fixed delay, 1: sleeping until the next event,
+        2: lookahead, computing the data in a producer thread,
+        3: synth sequencer, scheduling the data ahead with their own timestamps
+        and the final spin window in seconds
+        returns the current mode, unchanged whether the synth has no sequencer
+        from MidiPlayer object
+        """
+
+        if mode == 3 and not self.midi_man.open_sequencer(): return self.sched_mode
+        self.sched_mode = mode
+        if spin_time >= 0: self.spin_time = spin_time
+        # restarting the playback loop in the new mode
+        if self._playing: self.set_position(-1)
+
+        return self.sched_mode
+
+    #-----------------------------------------
+
+    def set_seq_ahead_time(self, ahead_time):
+        """
+        sets the time in seconds, the messages are scheduled ahead in the synth sequencer
+        returns the scheduling ahead time
+        from MidiPlayer object
+        """
+
+        if ahead_time > 0:
+            self.seq_ahead_time = ahead_time
+            # applied on the next start
+            if self.sched_mode == 3 and self._playing: self.set_position(-1)
+
+        return self.seq_ahead_time
+
+    #-----------------------------------------
+
+    def set_lookahead_time(self, lookahead_time):
+        """
+        sets the lookahead depth in seconds, for the lookahead mode
+        returns the lookahead depth
+        from MidiPlayer object
+        """
+
+        if lookahead_time > 0:
+            self.lookahead_time = lookahead_time
+            # applied on the next start
+            if self.sched_mode >= 2 and self._playing: self.set_position(-1)
+
+        return self.lookahead_time
+
+    #-----------------------------------------
+
     def start_midi_engine(self):
         """
         start the midi engine
@@ -1190,6 +1570,7 @@ class MidiPlayer(object):
         
         self.init_click()
         self._clicking =1
+        self._midi_sched.wake()
             
         return self._clicking
 
@@ -1209,6 +1590,7 @@ class MidiPlayer(object):
         
         # self.init_click()
         self._clicking =0
+        self._midi_sched.wake()
             
         return self._clicking
 
@@ -0,0 +1,228 @@
+#!/usr/bin/python3
+"""
+    File: midirender.py:
+    Module for offline rendering of a sequence to a wav file, faster than realtime,
+    by pulling samples from FluidSynth without audio driver
+    Date: Sun, 18/10/2026
+    Author: Coolbrother
+"""
+
+import sys
+import os.path
+import time
+import wave
+import fluidsynth
+import midisequence as midseq
+
+_bank_filename = "/home/com/banks/sf2/fluidr3_gm.sf2"
+
+class MidiWaveRender(object):
+    """
+    Offline renderer
+    Sends the playable events to FluidSynth on exact sample boundaries,
+    and streams the audio to a wav file, block by block
+    """
+    def __init__(self, samplerate=44100, gain=0.2, block_size=4096):
+        self.samplerate = samplerate
+        self.gain = gain
+        self.block_size = block_size # max frames by block
+        self.tail_time = 2.0 # in sec, rendering after the last event, for release and reverb
+        self.fs = None
+        self.sfid = None
+        self.render_time =0 # in sec, duration of the last rendering
+        self.audio_time =0 # in sec, duration of the last rendered audio
+
+    #-----------------------------------------
+
+    def init_synth(self, bank_filename=""):
+        """
+        init FluidSynth without audio driver
+        returns True whether the sound bank is loaded
+        from MidiWaveRender object
+        """
+
+        if not bank_filename: bank_filename = _bank_filename
+        self.close_synth()
+        self.fs = fluidsynth.Synth(gain=self.gain, samplerate=self.samplerate)
+        self.sfid = self.fs.sfload(bank_filename, update_midi_preset=0)
+        if self.sfid == -1:
+            self.close_synth()
+            return False
+        for chan in range(16):
+            # bank 128 for percussion on drum channel
+            bank = 128 if chan == 9 else 0
+            self.fs.program_select(chan, self.sfid, bank, 0)
+
+        return True
+
+    #-----------------------------------------
+
+    def close_synth(self):
+        """
+        delete the FluidSynth instance
+        from MidiWaveRender object
+        """
+
+        if self.fs:
+            self.fs.delete()
+            self.fs = None
+            self.sfid = None
+
+    #-----------------------------------------
+
+    def send_msg(self, msg):
+        """
+        send message to FluidSynth
+        from MidiWaveRender object
+        """
+
+        fs = self.fs
+        type = msg.type
+        if type == "note_on":
+            fs.noteon(msg.channel, msg.note, msg.velocity)
+        elif type == "note_off":
+            fs.noteoff(msg.channel, msg.note)
+        elif type == "control_change":
+            fs.cc(msg.channel, msg.control, msg.value)
+        elif type == "program_change":
+            fs.program_change(msg.channel, msg.program)
+        elif type == "pitchwheel":
+            fs.pitch_bend(msg.channel, msg.pitch)
+
+    #-----------------------------------------
+
+    def output_message(self, msg):
+        """
+        midi driver interface for the sequence
+        from MidiWaveRender object
+        """
+
+        if self.fs is None: return
+        self.send_msg(msg)
+
+    #-----------------------------------------
+
+    def program_change(self, chan, program):
+        """
+        midi driver interface for the sequence
+        from MidiWaveRender object
+        """
+
+        if self.fs is None: return
+        self.fs.program_change(chan, program)
+
+    #-----------------------------------------
+
+    def bank_change(self, chan, bank):
+        """
+        midi driver interface for the sequence
+        from MidiWaveRender object
+        """
+
+        if self.fs is None: return
+        self.fs.bank_select(chan, bank)
+
+    #-----------------------------------------
+
+    def panic(self, chan=-1):
+        """
+        midi driver interface for the sequence, all notes off
+        from MidiWaveRender object
+        """
+
+        if self.fs is None: return
+        chan_lst = range(16) if chan == -1 else [chan]
+        for chan in chan_lst:
+            self.fs.cc(chan, 123, 0)
+
+    #-----------------------------------------
+
+    def write_frames(self, wav, nb_frames):
+        """
+        render nb_frames from FluidSynth, block by block, and write them to the wav file
+        from MidiWaveRender object
+        """
+
+        block_size = self.block_size
+        get_samples = self.fs.get_samples
+        while nb_frames >0:
+            nb = min(nb_frames, block_size)
+            wav.writeframesraw(get_samples(nb).tobytes())
+            nb_frames -= nb
+
+    #-----------------------------------------
+
+    def render_seq(self, seq, wav_filename):
+        """
+        render the sequence to a wav file
+        returns the number of frames written
+        from MidiWaveRender object
+        """
+
+        if self.fs is None: return 0
+        start_time = time.perf_counter()
+        # own render list, to not moving the player cursor
+        render = midseq.MidiRenderList()
+        render.compile(seq.track_lst, seq.base)
+        render.set_pos(0)
+        samplerate = self.samplerate
+        frame_pos =0
+        with wave.open(wav_filename, "wb") as wav:
+            wav.setnchannels(2)
+            wav.setsampwidth(2)
+            wav.setframerate(samplerate)
+            while 1:
+                (tick, sec) = render.next_time()
+                if tick == -1: break
+                # rendering until the sample of the next group time
+                frame = int(round(sec * samplerate))
+                if frame > frame_pos:
+                    self.write_frames(wav, frame - frame_pos)
+                    frame_pos = frame
+                for msg in render.get_data(tick):
+                    self.send_msg(msg)
+            nb_frames = int(self.tail_time * samplerate)
+            self.write_frames(wav, nb_frames)
+            frame_pos += nb_frames
+        self.fs.system_reset()
+        self.render_time = time.perf_counter() - start_time
+        self.audio_time = frame_pos / samplerate
+
+        return frame_pos
+
+    #-----------------------------------------
+
+    def render_file(self, midi_filename, wav_filename=""):
+        """
+        load a midi file and render it to a wav file, with the same name by default
+        returns the number of frames written
+        from MidiWaveRender object
+        """
+
+        if not wav_filename:
+            wav_filename = os.path.splitext(midi_filename)[0] + ".wav"
+        seq = midseq.MidiSequence()
+        # the renderer is the midi driver, so initial patches go to the offline synth
+        seq.init_sequencer(self)
+        if not seq.load_file(midi_filename): return 0
+
+        return self.render_seq(seq, wav_filename)
+
+    #-----------------------------------------
+
+#========================================
+
+if __name__ == "__main__":
+    # batch rendering: midirender.py bank.sf2 file1.mid [file2.mid ...]
+    if len(sys.argv) < 3:
+        print(f"Usage: {sys.argv[0]} bank.sf2 file.mid [file.mid ...]")
+        sys.exit(1)
+    rend = MidiWaveRender()
+    if not rend.init_synth(sys.argv[1]):
+        print(f"Error: unable to load the sound bank: {sys.argv[1]}")
+        sys.exit(1)
+    for midi_filename in sys.argv[2:]:
+        rend.render_file(midi_filename)
+        print(f"{midi_filename}: {rend.audio_time:.1f} sec rendered in {rend.render_time:.2f} sec")
+    rend.close_synth()
+#-----------------------------------------
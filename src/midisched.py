@@ -9,9 +9,137 @@
 
 import time
 import threading
+from collections import deque
 import eventqueue as evq
 _evq_instance = evq.get_instance()
 
+class MidiLookahead(object):
+    """
+    Time-stamped lookahead buffer, between the producer and the dispatcher threads
+    Each item contains the due time in relative seconds, the tick, and the messages to send
+    The producer fills the buffer until depth seconds ahead of the clock,
+    the dispatcher only pops and sends the due items
+    """
+    def __init__(self, depth=0.05):
+        self.depth = depth # in sec
+        self._buf = deque()
+        self._lock = threading.Lock()
+        self.generation =0 # incremented on reset, to drop items from a previous position
+        self.next_tick =0 # next group time to produce
+        self.next_time =0 # in sec
+        self.end_time =0 # due time of the last pushed item
+        self.finished =0 # whether the producer reached the end of the sequence
+        self.push_count =0
+        self.pop_count =0
+        self.underrun_count =0 # items not buffered at their due time
+        self.raw =0 # whether items contain raw midi bytes instead of messages
+
+    #-----------------------------------------
+
+    def reset(self, tick, sec):
+        """
+        clear the buffer, and sets the next group time to produce
+        from MidiLookahead object
+        """
+
+        with self._lock:
+            self.generation +=1
+            self._buf.clear()
+            self.next_tick = tick
+            self.next_time = sec
+            self.end_time = sec
+            self.finished =0
+            self.push_count =0
+            self.pop_count =0
+
+    #-----------------------------------------
+
+    def stop(self):
+        """
+        clear the buffer, and stop the producer until the next reset
+        returns the first tick not yet sent, or -1 whether all data were sent
+        from MidiLookahead object
+        """
+
+        with self._lock:
+            if self._buf: tick = self._buf[0][1]
+            elif self.finished: tick =-1
+            else: tick = self.next_tick
+            self.generation +=1
+            self._buf.clear()
+            self.finished =1
+
+        return tick
+
+    #-----------------------------------------
+
+    def push(self, generation, tick, msg_lst, next_tick, next_time):
+        """
+        add the messages of the current group time, and sets the next group time
+        next_tick is -1 at the end of the sequence
+        returns False whether the buffer has been reset meanwhile
+        from MidiLookahead object
+        """
+
+        with self._lock:
+            if generation != self.generation: return False
+            self._buf.append((self.next_time, tick, msg_lst))
+            self.end_time = self.next_time
+            self.push_count +=1
+            if next_tick == -1:
+                self.finished =1
+            else:
+                self.next_tick = next_tick
+                self.next_time = next_time
+
+        return True
+
+    #-----------------------------------------
+
+    def peek(self):
+        """
+        returns the oldest item, or None whether the buffer is empty
+        from MidiLookahead object
+        """
+
+        try:
+            return self._buf[0]
+        except IndexError:
+            return None
+
+    #-----------------------------------------
+
+    def pop(self):
+        """
+        remove and returns the oldest item
+        from MidiLookahead object
+        """
+
+        self.pop_count +=1
+
+        return self._buf.popleft()
+
+    #-----------------------------------------
+
+    def get_ahead(self, reltime):
+        """
+        returns the buffered time ahead of reltime, in seconds
+        from MidiLookahead object
+        """
+
+        if not self._buf: return 0
+
+        return max(self.end_time - reltime, 0)
+
+    #-----------------------------------------
+
+    def __len__(self):
+        return len(self._buf)
+
+    #-----------------------------------------
+
+#========================================
+
 class MidiSched(object):
     """ 
     Midi scheduler manager with mido module and time clock system
@@ -46,6 +174,9 @@ class MidiSched(object):
         self.click_playing =0
         self.last_time =0
         self.start_time =0
+        self._wake_event = threading.Event() # to wake up the thread
+        self._produce_thread = None
+        self._produce_event = threading.Event() # to wake up the producer thread
 
     #-------------------------------------------
 
@@ -128,6 +259,68 @@ class MidiSched(object):
 
     #-----------------------------------------
 
+    def wake(self):
+        """
+        wake up the scheduler thread, when waiting
+        from MidiSched object
+        """
+
+        self._wake_event.set()
+        self._produce_event.set()
+
+    #-----------------------------------------
+
+    def wait(self, timeout=None):
+        """
+        waiting until timeout in seconds, or waking up
+        returns True whether waked up
+        from MidiSched object
+        """
+
+        res = self._wake_event.wait(timeout)
+        if res: self._wake_event.clear()
+
+        return res
+
+    #-----------------------------------------
+
+    def wake_producer(self):
+        """
+        wake up the producer thread, when waiting
+        from MidiSched object
+        """
+
+        self._produce_event.set()
+
+    #-----------------------------------------
+
+    def wait_producer(self, timeout=None):
+        """
+        waiting the producer thread until timeout in seconds, or waking up
+        returns True whether waked up
+        from MidiSched object
+        """
+
+        res = self._produce_event.wait(timeout)
+        if res: self._produce_event.clear()
+
+        return res
+
+    #-----------------------------------------
+
+    def produce(self):
+        """
+        filling the lookahead buffer of the player
+        from MidiSched object
+        """
+
+        produce_callback = self._player._produce_callback
+        while self._thread_running:
+            produce_callback()
+            self.wait_producer(0.1)
+
+    #-----------------------------------------
+
     def poll_out(self):
         """
         polling out midi data
@@ -143,8 +336,8 @@ class MidiSched(object):
                 # self._player.pause()
                 pass
             # self._player.check_bpm()
-            # pauses the system, necessary to change position
-            time.sleep(0.1)
+            # pauses the system until waking up by the player, necessary to change position
+            self.wait(0.1)
             # print("\a")
             
     
@@ -165,6 +358,10 @@ class MidiSched(object):
             self._play_thread = threading.Thread(target=self.poll_out, args=())
             self._play_thread.daemon = True
             self._play_thread.start()
+            # the producer thread computes the data ahead, for the lookahead mode
+            self._produce_thread = threading.Thread(target=self.produce, args=())
+            self._produce_thread.daemon = True
+            self._produce_thread.start()
             # debug("Je passe en start_play_thread")
 
     #-----------------------------------------
@@ -178,6 +375,8 @@ class MidiSched(object):
         self._thread_running =0
         self._playing =0
         self._play_thread = None
+        self._produce_thread = None
+        self.wake()
         time.sleep(0.1)
         
 
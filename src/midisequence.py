@@ -8,15 +8,28 @@
     Author: Coolbrother
 """
 import time
+import bisect
+import heapq
 import itertools as itt
+import numpy as np
 import mido
 import miditools as midto
 import constants as cst
 import logger as log
 import eventqueue as evq
+import midistore as mst
+import midifile as midfile
 
 log.set_level(log._DEBUG)
 _evq_instance = evq.get_instance()
+# chase state slots by channel: controllers 0 to 127, program and pitch bend
+_SLOT_PROGRAM =128
+_SLOT_PITCH =129
+_chase_slots =130
+# controllers not chased: data entry, RPN, NRPN, and channel mode messages
+_chase_excluded = set([6, 38, 96, 97, 98, 99, 100, 101] + list(range(120, 128)))
+# default controller values, others are 0
+_cc_defaults = {7: 100, 10: 64, 11: 127}
 
 
 _DEBUG =1
@@ -57,7 +70,78 @@ def limit_value(val, min_val=0, max_val=127):
 
 #-------------------------------------------
 
+def _remap_msg(msg, chan):
+    """ returns a copy of a channel message, on another channel """
 
+    return msg.copy(channel=chan)
+
+#-------------------------------------------
+
+def _remap_raw(data, chan):
+    """ returns raw midi bytes, on another channel """
+
+    return bytes(((data[0] & 0xf0) | chan,)) + data[1:]
+
+#-------------------------------------------
+
+def gen_note_index(ev_lst):
+    """
+    returns a tuple of note spans list and note off dictionnary,
+    built in one pass with a FIFO per channel and note
+    note spans: list of (on index, off index, duration), sorted by on index
+    note off dictionnary: note number: sorted list of note off index
+    Note: note_on with velocity 0 is a note off
+    """
+
+    span_lst = []
+    off_dic = {}
+    pending_dic = {} # (channel, note): list of pending note on index
+    for (i, ev) in enumerate(ev_lst):
+        msg = ev.msg
+        type = msg.type
+        if type == 'note_on' and msg.velocity >0:
+            pending_dic.setdefault((msg.channel, msg.note), []).append(i)
+        elif type == 'note_off' or type == 'note_on':
+            off_dic.setdefault(msg.note, []).append(i)
+            pending = pending_dic.get((msg.channel, msg.note))
+            if pending:
+                on_ind = pending.pop(0)
+                span_lst.append((on_ind, i, msg.time - ev_lst[on_ind].msg.time))
+    span_lst.sort()
+
+    return (span_lst, off_dic)
+
+#-------------------------------------------
+
+def gen_store_note_index(store):
+    """
+    returns a tuple of note spans list and note off dictionnary, 
+    like gen_note_index, reading the columns of a MidiEventStore
+    """
+
+    data = store.data
+    span_lst = []
+    off_dic = {}
+    pending_dic = {}
+    note_on = mst.TYPE_NOTE_ON
+    note_off = mst.TYPE_NOTE_OFF
+    rows = zip(data['type'].tolist(), data['channel'].tolist(), 
+            data['data1'].tolist(), data['data2'].tolist(), data['tick'].tolist())
+    tick_lst = data['tick']
+    for (i, (code, chan, note, vel, tick)) in enumerate(rows):
+        if code == note_on and vel >0:
+            pending_dic.setdefault((chan, note), []).append(i)
+        elif code == note_off or code == note_on:
+            off_dic.setdefault(note, []).append(i)
+            pending = pending_dic.get((chan, note))
+            if pending:
+                on_ind = pending.pop(0)
+                span_lst.append((on_ind, i, tick - int(tick_lst[on_ind])))
+    span_lst.sort()
+
+    return (span_lst, off_dic)
+
+#-------------------------------------------
 
 class CFileInfo(object):
     """ 
@@ -92,14 +176,16 @@ class CChannel(object):
 
 class MidiEvent(object):
     """ Midi event structure """
-    def __init__(self, type='note_on', cat=0):
+    def __init__(self, type='note_on', cat=0, msg=None, tracknum=0):
         self.id =0
-        if cat == 0: # category message
+        if msg is not None: # wrapping an existing message
+            self.msg = msg
+        elif cat == 0: # category message
             self.msg = mido.Message(type)
         elif cat == 1: # metamessage category
             self.msg = mido.MetaMessage(type)
 
-        self.tracknum =0
+        self.tracknum = tracknum
     
     #-----------------------------------------
 
@@ -324,6 +410,16 @@ class MidiTrack(MidiChannel):
     def __init__(self):
         super().__init__()
         self.ev_lst = []
+        self._store = None # MidiEventStore object in columnar mode
+        self._tick_lst = None # sorted tick index for the list mode
+        self._tick_src = None # event list indexed by _tick_lst
+        self._tick_sorted =1
+        self._note_index = None # tuple of note spans and note off dictionnary
+        self._note_on_dic = None # note on index: note off index
+        self._note_src = None # event list or store indexed by _note_index
+        self._note_count =0
+        self._undo_blocks = None # MidiEventBlocks object of the last undo snapshot
+        self._undo_dirty = None # tuple of start and end tick modified since _undo_blocks, or None
         self.group_lst = []
         self.group_index =0
         self.ev_grouping =0
@@ -354,7 +450,12 @@ class MidiTrack(MidiChannel):
         from Mtrack object
         """
         
+        if self._store is not None:
+            self._store = None
+            self.ev_lst = []
         self.ev_lst[:] = lst
+        self.invalidate_ticks()
+        self.touch()
 
     #-----------------------------------------
 
@@ -364,7 +465,302 @@ class MidiTrack(MidiChannel):
         from Miditrack object
         """
         
+        if self._store is not None:
+            self._store = None
+            self.ev_lst = []
         self.ev_lst[:] = []
+        self.invalidate_ticks()
+        self.touch()
+
+    #-----------------------------------------
+
+    def is_packed(self):
+        """
+        returns whether events are stored in columnar mode
+        from MidiTrack object
+        """
+
+        return self._store is not None
+
+    #-----------------------------------------
+
+    def get_store(self):
+        """
+        returns the MidiEventStore object, or None in list mode
+        from MidiTrack object
+        """
+
+        return self._store
+
+    #-----------------------------------------
+
+    def set_store(self, store):
+        """
+        sets the track in columnar mode with the store
+        the event list becomes a lazy view on the store
+        from MidiTrack object
+        """
+
+        self._store = store
+        self.ev_lst = mst.MidiEventView(self, store, MidiEvent)
+
+    #-----------------------------------------
+
+    def pack(self):
+        """
+        convert the event list to columnar storage
+        from MidiTrack object
+        """
+
+        if self._store is not None: return self._store
+        store = mst.MidiEventStore.from_events(self.ev_lst)
+        self.set_store(store)
+
+        return store
+
+    #-----------------------------------------
+
+    def unpack(self):
+        """
+        convert columnar storage to a MidiEvent list, 
+        necessary before editing events in place
+        returns the event list
+        from MidiTrack object
+        """
+
+        if self._store is None: return self.ev_lst
+        store = self._store
+        # rows as python tuples, faster than indexing the array
+        meta_lst = store.meta_lst
+        ev_lst = [MidiEvent(msg=mst.row2msg(row, meta_lst), tracknum=row[5])\
+                for row in store.data.tolist()]
+        self._store = None
+        self.ev_lst = ev_lst
+
+        return ev_lst
+
+    #-----------------------------------------
+
+    def invalidate_ticks(self):
+        """
+        invalidate the tick index, 
+        must be called after changing event times in place
+        from MidiTrack object
+        """
+
+        self._tick_lst = None
+        self._tick_src = None
+        # durations depend on times
+        self.invalidate_notes()
+
+    #-----------------------------------------
+
+    def touch(self, start_tick=0, end_tick=-1):
+        """
+        marks a tick range as modified since the last undo snapshot,
+        end_tick -1 for the end of the track
+        the next snapshot rebuilds only the blocks of this range
+        from MidiTrack object
+        """
+
+        if end_tick != -1 and end_tick < start_tick:
+            (start_tick, end_tick) = (end_tick, start_tick)
+        if self._undo_dirty is not None:
+            (old_start, old_end) = self._undo_dirty
+            start_tick = min(start_tick, old_start)
+            if old_end == -1 or end_tick == -1: end_tick = -1
+            else: end_tick = max(end_tick, old_end)
+        self._undo_dirty = (start_tick, end_tick)
+
+    #-----------------------------------------
+
+    def invalidate_notes(self):
+        """
+        invalidate the note index,
+        must be called after changing notes in place
+        from MidiTrack object
+        """
+
+        self._note_index = None
+        self._note_on_dic = None
+        self._note_src = None
+
+    #-----------------------------------------
+
+    def get_note_index(self):
+        """
+        returns a tuple of note spans list and note off dictionnary,
+        rebuilding it when the events have changed
+        from MidiTrack object
+        """
+
+        src = self._store if self._store is not None else self.ev_lst
+        if self._note_index is None or self._note_src is not src\
+                or self._note_count != len(src):
+            if self._store is not None:
+                self._note_index = gen_store_note_index(self._store)
+            else:
+                self._note_index = gen_note_index(self.ev_lst)
+            self._note_on_dic = None
+            self._note_src = src
+            self._note_count = len(src)
+
+        return self._note_index
+
+    #-----------------------------------------
+
+    def get_note_spans(self, start=0, stop=-1):
+        """
+        returns list of note spans (on index, off index, duration),
+        for note on index between start and stop index
+        from MidiTrack object
+        """
+
+        (span_lst, _) = self.get_note_index()
+        if start == 0 and stop == -1: return span_lst
+        if stop == -1: stop = self._note_count
+        # spans are sorted by note on index
+        start_ind = bisect.bisect_left(span_lst, (start, ))
+        stop_ind = bisect.bisect_left(span_lst, (stop, ))
+
+        return span_lst[start_ind:stop_ind]
+
+    #-----------------------------------------
+
+    def get_noteoff_index(self, on_index):
+        """
+        returns the note off index paired with the note on index, or -1
+        from MidiTrack object
+        """
+
+        self.get_note_index()
+        if self._note_on_dic is None:
+            self._note_on_dic = dict((on_ind, off_ind) for (on_ind, off_ind, _) in self._note_index[0])
+
+        return self._note_on_dic.get(on_index, -1)
+
+    #-----------------------------------------
+
+    def search_noteoff(self, note, start=0, stop=-1):
+        """
+        returns the first note off index for note, between start and stop index, or -1
+        from MidiTrack object
+        """
+
+        (_, off_dic) = self.get_note_index()
+        off_lst = off_dic.get(note)
+        if not off_lst: return -1
+        if stop == -1: stop = self._note_count
+        i = bisect.bisect_left(off_lst, start)
+        if i < len(off_lst) and off_lst[i] < stop:
+            return off_lst[i]
+
+        return -1
+
+    #-----------------------------------------
+
+    def _has_ticks(self, count):
+        """
+        returns whether the tick index is valid for count events
+        from MidiTrack object
+        """
+
+        return self._tick_lst is not None\
+                and self._tick_src is self.ev_lst\
+                and len(self._tick_lst) == count
+
+    #-----------------------------------------
+
+    def get_ticks(self):
+        """
+        returns the tick index of the events,
+        rebuilding it when the event list has changed
+        from MidiTrack object
+        """
+
+        if self._store is not None:
+            return self._store.get_ticks()
+        if not self._has_ticks(len(self.ev_lst)):
+            tick_lst = [ev.msg.time for ev in self.ev_lst]
+            self._tick_sorted = all(a <= b for (a, b) in zip(tick_lst, tick_lst[1:]))
+            self._tick_lst = tick_lst
+            self._tick_src = self.ev_lst
+
+        return self._tick_lst
+
+    #-----------------------------------------
+
+    def _add_ticks(self, index, ev_lst):
+        """
+        update the tick index after inserting events at index
+        from MidiTrack object
+        """
+
+        if not self._has_ticks(len(self.ev_lst) - len(ev_lst)):
+            self.invalidate_ticks()
+            return
+        self._tick_lst[index:index] = [ev.msg.time for ev in ev_lst]
+        self._check_ticks(index, index + len(ev_lst))
+
+    #-----------------------------------------
+
+    def _check_ticks(self, start, stop):
+        """
+        checking the order of the tick index only around start and stop index
+        from MidiTrack object
+        """
+
+        tick_lst = self._tick_lst
+        start = max(start -1, 0)
+        stop = min(stop +1, len(tick_lst))
+        for i in range(start +1, stop):
+            if tick_lst[i-1] > tick_lst[i]:
+                self._tick_sorted =0
+                break
+
+    #-----------------------------------------
+
+    def is_sorted(self):
+        """
+        returns whether the events are sorted by time
+        from MidiTrack object
+        """
+
+        self.get_ticks()
+        if self._store is not None: return True
+
+        return bool(self._tick_sorted)
+
+    #-----------------------------------------
+
+    def _search_tick(self, time, right=0):
+        """
+        returns the insertion index of time in the tick index, 
+        or -1 if the events are not sorted
+        from MidiTrack object
+        """
+
+        ticks = self.get_ticks()
+        if self._store is not None:
+            side = 'right' if right else 'left'
+            return int(np.searchsorted(ticks, time, side=side))
+        if not self._tick_sorted: return -1
+        if right: return bisect.bisect_right(ticks, time)
+
+        return bisect.bisect_left(ticks, time)
+
+    #-----------------------------------------
+
+    def get_time(self, index=-1):
+        """
+        returns event time at index, without creating event object
+        from MidiTrack object
+        """
+
+        if self._store is not None:
+            return self._store.get_tick(index)
+
+        return self.ev_lst[index].msg.time
 
     #-----------------------------------------
 
@@ -376,8 +772,7 @@ class MidiTrack(MidiChannel):
         
         val =0
         if self.ev_lst:
-            ev = self.ev_lst[-1]
-            val = ev.msg.time
+            val = self.get_time(-1)
         
         return val
 
@@ -400,7 +795,9 @@ class MidiTrack(MidiChannel):
         """
 
         if ev:
+            self.unpack()
             self.ev_lst.append(ev)
+            self._add_ticks(len(self.ev_lst) -1, [ev])
     
     #-----------------------------------------
 
@@ -411,7 +808,10 @@ class MidiTrack(MidiChannel):
         """
 
         if ev_lst:
+            self.unpack()
+            index = len(self.ev_lst)
             self.ev_lst.extend(ev_lst)
+            self._add_ticks(index, ev_lst)
     
     #-----------------------------------------
     
@@ -422,7 +822,11 @@ class MidiTrack(MidiChannel):
         """
 
         if ev:
+            self.unpack()
             self.ev_lst.insert(index, ev)
+            # insertion index, like in list insert
+            index = slice(index, index).indices(len(self.ev_lst) -1)[0]
+            self._add_ticks(index, [ev])
     
     #-----------------------------------------
 
@@ -433,13 +837,36 @@ class MidiTrack(MidiChannel):
         """
 
         if ev_lst:
+            self.unpack()
             try:
                 self.ev_lst[index:index] = ev_lst
             except IndexError:
                 pass
+            # insertion index, like in slice assignment
+            index = slice(index, index).indices(len(self.ev_lst) - len(ev_lst))[0]
+            self._add_ticks(index, ev_lst)
     
     #-----------------------------------------
 
+    def replace_evs(self, start, stop, ev_lst):
+        """
+        replace events between start and stop index by the event list,
+        keeping the tick index
+        from MidiTrack object
+        """
+
+        self.unpack()
+        has_ticks = self._has_ticks(len(self.ev_lst))
+        self.ev_lst[start:stop] = ev_lst
+        self.invalidate_notes()
+        if has_ticks:
+            self._tick_lst[start:stop] = [ev.msg.time for ev in ev_lst]
+            self._check_ticks(start, start + len(ev_lst))
+        else:
+            self.invalidate_ticks()
+
+    #-----------------------------------------
+
     def get_list(self):
         """
         returns ev list
@@ -479,6 +906,14 @@ class MidiTrack(MidiChannel):
         """
 
         res = None
+        i = self._search_tick(val)
+        if i >= 0:
+            ticks = self.get_ticks()
+            if i < len(ticks):
+                self.pos = i
+                res = int(ticks[i])
+            return res
+
         for (i, ev) in enumerate(self.ev_lst):
             if ev.msg.time >= val:
                 self.pos = i
@@ -606,6 +1041,13 @@ class MidiTrack(MidiChannel):
         from MidiTrack object
         """
         
+        if self._store is not None and not self.repeating:
+            # no event object needed in columnar mode
+            count = len(self._store)
+            if self.pos < count: self.pos +=1
+            if self.pos >= count: return -1
+            return self._store.get_tick(self.pos)
+
         ev = self.next_ev()
         if ev is None\
             or ev.msg.time > self.ev_lst[-1].msg.time:
@@ -669,6 +1111,10 @@ class MidiTrack(MidiChannel):
         """
 
         
+        if self._store is not None:
+            self.group_lst = self._store.get_group_starts().tolist()
+            return self.group_lst
+
         curtime =-1
         for (pos, ev) in enumerate(self.ev_lst):
             time = ev.msg.time
@@ -710,17 +1156,8 @@ class MidiTrack(MidiChannel):
             # debug("c'est ça papa")
             return
         if self.group_lst:
-            last_pos = self.group_lst[-1]
-            if pos >= last_pos:
-                index = last_pos
-            else:
-                for (ind, group_pos) in enumerate(self.group_lst):
-                    if group_pos == pos:
-                        index = ind
-                        break
-                    elif group_pos > pos:
-                        index = ind -1
-                        break
+            # index of the last group starting at or before pos
+            index = bisect.bisect_right(self.group_lst, pos) -1
 
         if index >= 0:
             self.group_index = index
@@ -865,6 +1302,12 @@ class MidiTrack(MidiChannel):
         # Note: dont forget to reinitialize the group list
         self.group_time_lst = []
         self.group_time_index =0
+        if self._store is not None:
+            starts = self._store.get_group_starts()
+            ticks = self._store.get_ticks()[starts]
+            self.group_time_lst = list(zip(starts.tolist(), ticks.tolist()))
+            return self.group_time_lst
+
         curtime =-1
         for (pos, ev) in enumerate(self.ev_lst):
             evtime = ev.msg.time
@@ -903,17 +1346,9 @@ class MidiTrack(MidiChannel):
         curpos =-1
         # group_time_lst contain a tuple index and time of each group event
         if not self.group_time_lst: return
-        last_pos = self.group_time_lst[-1][0]
-        if pos >= last_pos:
-            index = last_pos
-        else:
-            for (ind, group_pos) in enumerate(self.group_time_lst):
-                if group_pos[pos] == pos:
-                    index = ind
-                    break
-                elif group_pos[0] > pos:
-                    index = ind -1
-                    break
+        # index of the last group starting at or before pos, 
+        # the tuples are compared on index first
+        index = bisect.bisect_right(self.group_time_lst, (pos, float('inf'))) -1
 
         if index >= 0:
             try:
@@ -1022,6 +1457,30 @@ class MidiTrack(MidiChannel):
 
     #-----------------------------------------
     
+    def search_range_group_time(self, time):
+        """
+        returns a tuple of start and stop index for events at exact time,
+        from the current position, without creating event objects
+        used in columnar mode
+        from MidiTrack object
+        """
+
+        ticks = self._store.get_ticks()
+        count = len(ticks)
+        start = self.pos
+        if start >= count: return (count, count)
+        if ticks[start] < time:
+            # skip events before time
+            start = int(np.searchsorted(ticks, time, side='left'))
+        stop = start
+        while stop < count and ticks[stop] == time:
+            stop +=1
+        self.pos = stop
+
+        return (start, stop)
+
+    #-----------------------------------------
+
     def search_ev_group_time(self, time):
         """
         returns event list between last_pos, and exact time, 
@@ -1056,7 +1515,19 @@ class MidiTrack(MidiChannel):
         from MidiTrack object
         """
 
+        self.invalidate_notes()
+        if self._store is not None:
+            # stable sort on tick column
+            data = self._store.data
+            self._store.data = data[np.argsort(data['tick'], kind='stable')]
+            return
+
         self.ev_lst.sort(key=lambda x: x.msg.time)
+        if self._has_ticks(len(self.ev_lst)):
+            self._tick_lst.sort()
+            self._tick_sorted =1
+        else:
+            self.invalidate_ticks()
 
     #-----------------------------------------
 
@@ -1069,6 +1540,12 @@ class MidiTrack(MidiChannel):
 
         lst = []
         curtime =-1
+        if self._store is not None:
+            self.sort()
+            data = self._store.data
+            self._store.data = data[self._store.get_group_starts()]
+            return
+
         self.ev_lst.sort(key=lambda x: x.msg.time)
         # Note: FIXME, Deleting the doublon by time, not ideal but...
         # """
@@ -1078,6 +1555,7 @@ class MidiTrack(MidiChannel):
                 lst.append(ev)
                 curtime = evtime
         self.ev_lst = lst[:] # for a shallow copy
+        self.invalidate_ticks()
         # """
 
 
@@ -1156,6 +1634,11 @@ class MidiTrack(MidiChannel):
         """
 
         index =0
+        i = self._search_tick(time)
+        if i >= 0:
+            if i < len(self.get_ticks()): index = i
+            return index
+
         for (i, ev) in enumerate(self.ev_lst):
             msg = ev.msg
             if msg.time >= time:
@@ -1173,6 +1656,13 @@ class MidiTrack(MidiChannel):
         """
 
         index =0
+        i = self._search_tick(time, right=1)
+        if i >= 0:
+            ticks = self.get_ticks()
+            if i < len(ticks): index = i
+            elif len(ticks) and ticks[-1] == time: index = len(ticks) -1
+            return index
+
         for (i, ev) in enumerate(self.ev_lst):
             msg = ev.msg
             if msg.time == time:
@@ -1185,6 +1675,25 @@ class MidiTrack(MidiChannel):
 
     #-----------------------------------------
 
+    def search_range(self, start_time, end_time=-1):
+        """
+        returns a tuple of start and stop index 
+        for events between start_time and end_time included,
+        end_time -1 for the end of the track
+        from MidiTrack object
+        """
+
+        count = len(self.ev_lst)
+        start = self._search_tick(start_time)
+        # not sorted, so all events
+        if start == -1: return (0, count)
+        if end_time == -1: return (start, count)
+        stop = self._search_tick(end_time, right=1)
+
+        return (start, stop)
+
+    #-----------------------------------------
+
     def search_ev(self, type, time):
         """
         search event by type, and time position in list
@@ -1193,6 +1702,19 @@ class MidiTrack(MidiChannel):
         """
 
         res = None
+        start = self._search_tick(time)
+        if self._store is not None:
+            i = self._store.search_type(type, start)
+            if i >= 0: res = self.ev_lst[i]
+            return res
+        if start >= 0:
+            # events before start are earlier than time
+            for ev in itt.islice(self.ev_lst, start, None):
+                if ev.msg.type == type:
+                    res = ev
+                    break
+            return res
+
         for (i, ev) in enumerate(self.ev_lst):
             msg = ev.msg
             if msg.type == type and msg.time >= time:
@@ -1203,6 +1725,31 @@ class MidiTrack(MidiChannel):
 
     #-----------------------------------------
      
+    def get_tempo_lst(self):
+        """
+        returns a list of tuple tick and tempo for the set_tempo events
+        from MidiTrack object
+        """
+
+        tempo_lst = []
+        type = "set_tempo"
+        if self._store is not None:
+            store = self._store
+            i = store.search_type(type)
+            while i >= 0:
+                tempo_lst.append((store.get_tick(i), store.get_meta(i).tempo))
+                i = store.search_type(type, i +1)
+            return tempo_lst
+
+        for ev in self.ev_lst:
+            msg = ev.msg
+            if msg.type == type:
+                tempo_lst.append((msg.time, msg.tempo))
+
+        return tempo_lst
+
+    #-----------------------------------------
+     
     def is_active(self):
         """
         returns active state of the track
@@ -1360,6 +1907,10 @@ class MidiBase(object):
         self.sec_per_beat = self.tempo / self.micro_sec # in sec
         self.sec_per_tick = self.sec_per_beat / float(self.ppq)
         self.bpm = self._tempo_ref / self.tempo
+        # tempo map, list of tuple: tick, tempo, and seconds at this tick
+        self._tempo_map = [(0, self.tempo, 0.0)]
+        self._tempo_ticks = [0] # for searching by tick
+        self._tempo_secs = [0.0] # for searching by seconds
         self.playable_lst = ['note_off', 'note_on', 'polytouch', 
                 'control_change', 'program_change', 'aftertouch', 
                 'pitchwheel']
@@ -1468,25 +2019,89 @@ class MidiBase(object):
     #-----------------------------------------
 
 
+    def gen_tempo_map(self, tempo_lst):
+        """
+        generate the tempo map from a list of tuple tick and tempo,
+        with the seconds at each tempo change
+        the current tempo is used before the first tempo change
+        from MidiBase object
+        """
+
+        tempo_lst = sorted(tempo_lst, key=lambda x: x[0])
+        if not tempo_lst or tempo_lst[0][0] > 0:
+            tempo_lst.insert(0, (0, self.tempo))
+        tempo_map = []
+        sec =0.0
+        (last_tick, last_tempo) = tempo_lst[0]
+        for (tick, tempo) in tempo_lst:
+            sec += (tick - last_tick) * last_tempo / (self.micro_sec * self.ppq)
+            if tempo_map and tempo_map[-1][0] == tick:
+                # the last tempo at the same tick wins
+                tempo_map[-1] = (tick, tempo, sec)
+            elif not tempo_map or tempo_map[-1][1] != tempo:
+                tempo_map.append((tick, tempo, sec))
+            (last_tick, last_tempo) = (tick, tempo)
+        
+        self._tempo_map = tempo_map
+        self._tempo_ticks = [item[0] for item in tempo_map]
+        self._tempo_secs = [item[2] for item in tempo_map]
+        self.tempo = tempo_map[0][1]
+        self.update_tempo_params()
+
+        return tempo_map
+
+    #-----------------------------------------
+
+    def get_tempo_map(self):
+        """
+        returns the tempo map
+        from MidiBase object
+        """
+
+        return self._tempo_map
+
+    #-----------------------------------------
+
+    def get_tempo(self, nb_tick):
+        """
+        returns the tempo at tick position
+        from MidiBase object
+        """
+
+        index = bisect.bisect_right(self._tempo_ticks, nb_tick) -1
+        if index < 0: index =0
+
+        return self._tempo_map[index][1]
+
+    #-----------------------------------------
+
     def tick2sec(self, nb_tick):
         """
-        convert ticks to seconds
+        convert ticks to seconds, with the tempo map
         from MidiBase object
         """
 
-        # debug(f"nb_tick: {nb_tick}, sec_per_tick: {self.sec_per_tick}")
-        return float(nb_tick * self.sec_per_tick)
+        index = bisect.bisect_right(self._tempo_ticks, nb_tick) -1
+        if index < 0: index =0
+        (tick, tempo, sec) = self._tempo_map[index]
+
+        # debug(f"nb_tick: {nb_tick}, tempo: {tempo}")
+        return float(sec + (nb_tick - tick) * tempo / (self.micro_sec * self.ppq))
 
     #-----------------------------------------
 
     def sec2tick(self, nb_sec):
         """
-        convert seconds to ticks
+        convert seconds to ticks, with the tempo map
         from MidiBase object
         """
 
+        index = bisect.bisect_right(self._tempo_secs, nb_sec) -1
+        if index < 0: index =0
+        (tick, tempo, sec) = self._tempo_map[index]
+
         # We need rounding when passing from sec to ticks, for better playback accuracy
-        return round(nb_sec / self.sec_per_tick)
+        return round(tick + (nb_sec - sec) * self.micro_sec * self.ppq / tempo)
 
     #-----------------------------------------
 
@@ -1534,12 +2149,17 @@ class MidiBase(object):
     def set_bpm(self, bpm):
         """
         sets the bpm bellong the tempo
+        Note: the tempo map is regenerated only without tempo changes,
+        MidiSequence.set_bpm regenerates it from the tempo events of the tracks
         from MidiBase object
         """
         if bpm <= 0: return
         self.tempo = int(self._tempo_ref / bpm)
         self.bpm = bpm
         self.update_tempo_params()
+        if len(self._tempo_map) <= 1:
+            # no tempo changes, the tempo map has just the new tempo
+            self.gen_tempo_map([])
 
     #-----------------------------------------
 
@@ -1837,8 +2457,8 @@ class GroupEvent(object):
                     # getting associated note_off
                     
                     # """
-                    if self._seq:
-                        index2 = self._seq.get_noteoff(-1, ev1.msg.note, index1, -1)
+                    # paired note off from the note index
+                    index2 = trackobj.get_noteoff_index(index1)
                     trackobj.set_pos(index1)
                     if index2 >=0:
                         ev2 = trackobj.get_ev(index2)
@@ -1967,10 +2587,10 @@ class GroupEvent(object):
                     break
                 else:
                     continue
-            for (i, ev1) in enumerate(ev_lst):
-                index1 = track.pos
-                desc = ""
-                if ev1.msg.type == 'note_on':
+            # the group starts at the track position, 
+            # keeping only note on paired in the note index
+            for (i, ev1) in enumerate(ev_lst, track.pos):
+                if track.get_noteoff_index(i) != -1:
                     res_lst.append(ev1)
                
             if res_lst:
@@ -2039,20 +2659,399 @@ class GroupEvent(object):
 
 #========================================
 
-class MidiSequence(object):
+class MidiRenderList(object):
     """
-    sequence manager
+    Precompiled playback schedule, sorted by time
+    Contains for each event the track number, a copied message and its raw midi bytes ready to send,
+    and for each group time, the first event index, the tick and the time in seconds
+    The compiled items are shared with the player, never copied,
+    mute, solo and channel changes are applied through tables indexed by track number
     """
-    def __init__(self, parent=None, *args, **kwargs):
-        # super().__init__()
-        self.parent = parent
-        self.base = MidiBase() # base midi object
-        self.tools = midto.MidiTools()
+    def __init__(self):
+        self.tracknum_lst = []
+        self.msg_lst = []
+        self.raw_lst = [] # messages encoded in bytes
+        self.group_lst = [] # first event index for each group time
+        self.tick_lst = [] # tick for each group time
+        self.sec_lst = [] # seconds for each group time
+        self.pos =0 # index of the next group time to play
+        self.valid =0
+        self.build_time =0 # in sec
+        self.build_count =0 # number of compilations
+        self._track_lst = []
+        self._play_lst = [] # whether each track is audible
+        self._chan_lst = [] # channel of each track since the compilation, or -1 for unchanged
+        self._filtering =0 # whether a track is muted or its channel changed
+
+    #-----------------------------------------
+
+    def count(self):
+        """
+        returns the number of events
+        from MidiRenderList object
+        """
+
+        return len(self.msg_lst)
+
+    #-----------------------------------------
+
+    def invalidate(self):
+        """
+        the render list must be compiled again
+        from MidiRenderList object
+        """
+
+        self.valid =0
+
+    #-----------------------------------------
+
+    def _gen_track_stream(self, tracknum, track, playable_lst):
+        """
+        generator of tuple tick, track number, copied message and raw bytes
+        for the playable events on the track
+        from MidiRenderList object
+        """
+
+        store = track.get_store()
+        if store is not None:
+            meta_lst = store.meta_lst
+            for row in store.data[store.data['type'] != mst.TYPE_META].tolist():
+                yield (row[0], tracknum, mst.row2msg(row, meta_lst), mst.row2bytes(row))
+            return
+
+        for ev in track.ev_lst:
+            msg = ev.msg
+            if msg.type in playable_lst:
+                yield (msg.time, tracknum, msg.copy(), bytes(msg.bytes()))
+
+    #-----------------------------------------
+
+    def compile(self, track_lst, base):
+        """
+        flatten the tracks in a list sorted by time,
+        for the same time, events are in track order, like in get_playable_data
+        from MidiRenderList object
+        """
+
+        start_time = time.perf_counter()
+        tracknum_lst = []
+        msg_lst = []
+        raw_lst = []
+        group_lst = []
+        tick_lst = []
+        curtick =-1
+        playable_lst = set(base.playable_lst)
+        stream_lst = [self._gen_track_stream(tracknum, track, playable_lst)\
+                for (tracknum, track) in enumerate(track_lst)]
+        for (tick, tracknum, msg, raw) in heapq.merge(*stream_lst, key=lambda x: x[0]):
+            if tick != curtick:
+                group_lst.append(len(msg_lst))
+                tick_lst.append(tick)
+                curtick = tick
+            tracknum_lst.append(tracknum)
+            msg_lst.append(msg)
+            raw_lst.append(raw)
+        
+        self.tracknum_lst = tracknum_lst
+        self.msg_lst = msg_lst
+        self.raw_lst = raw_lst
+        self.group_lst = group_lst
+        self.tick_lst = tick_lst
+        # times in seconds, with the tempo map
+        self.sec_lst = [base.tick2sec(tick) for tick in tick_lst]
+        self._track_lst = track_lst
+        self._chan_lst = [-1] * len(track_lst)
+        self.update_tracks()
+        self.pos =0
+        self.valid =1
+        self.build_count +=1
+        self.build_time = time.perf_counter() - start_time
+        log.debug(f"Render list compiled: {len(msg_lst)} events, "
+                f"in {self.build_time * 1000:.3f} msec", bell=0)
+
+    #-----------------------------------------
+
+    def set_pos(self, tick):
+        """
+        sets the cursor at the first group time greater or equal to tick
+        from MidiRenderList object
+        """
+
+        self.pos = bisect.bisect_left(self.tick_lst, tick)
+
+    #-----------------------------------------
+
+    def update_tracks(self):
+        """
+        update the table of audible tracks, after mute or solo changes
+        from MidiRenderList object
+        """
+
+        play_lst = [not (track.muted or track.sysmuted) for track in self._track_lst]
+        self._play_lst = play_lst
+        self._filtering = not all(play_lst) or any(chan != -1 for chan in self._chan_lst)
+
+    #-----------------------------------------
+
+    def set_channel(self, tracknum, chan):
+        """
+        sets the channel of the track events, without compiling again
+        from MidiRenderList object
+        """
+
+        if tracknum >= len(self._chan_lst): return
+        self._chan_lst[tracknum] = chan
+        self.update_tracks()
+
+    #-----------------------------------------
+
+    def get_channel(self, tracknum, chan):
+        """
+        returns the channel of a compiled event on the track
+        from MidiRenderList object
+        """
+
+        track_chan = self._chan_lst[tracknum]
+
+        return chan if track_chan == -1 else track_chan
+
+    #-----------------------------------------
+
+    def _get_group(self, tick, item_lst, remap):
+        """
+        returns items of the group time at tick, for the unmuted tracks,
+        and advance the cursor
+        remap: function returning a new item with another channel
+        from MidiRenderList object
+        """
+
+        pos = self.pos
+        if pos >= len(self.tick_lst) or self.tick_lst[pos] != tick: return []
+        start = self.group_lst[pos]
+        pos +=1
+        stop = self.group_lst[pos] if pos < len(self.group_lst) else len(item_lst)
+        self.pos = pos
+        if not self._filtering:
+            # all tracks play their compiled items
+            return item_lst[start:stop]
+        
+        play_lst = self._play_lst
+        chan_lst = self._chan_lst
+        res = []
+        for (tracknum, item) in zip(self.tracknum_lst[start:stop], item_lst[start:stop]):
+            if not play_lst[tracknum]: continue
+            chan = chan_lst[tracknum]
+            res.append(item if chan == -1 else remap(item, chan))
+
+        return res
+
+    #-----------------------------------------
+
+    def get_data(self, tick):
+        """
+        returns messages of the group time at tick, for the unmuted tracks,
+        and advance the cursor
+        from MidiRenderList object
+        """
+
+        return self._get_group(tick, self.msg_lst, _remap_msg)
+
+    #-----------------------------------------
+
+    def get_raw(self, tick):
+        """
+        returns raw midi bytes of the group time at tick, for the unmuted tracks,
+        and advance the cursor
+        from MidiRenderList object
+        """
+
+        return self._get_group(tick, self.raw_lst, _remap_raw)
+
+    #-----------------------------------------
+
+    def next_time(self):
+        """
+        returns a tuple of tick and seconds for the next group time, 
+        or (-1, -1) at the end
+        from MidiRenderList object
+        """
+
+        pos = self.pos
+        if pos >= len(self.tick_lst): return (-1, -1)
+
+        return (self.tick_lst[pos], self.sec_lst[pos])
+
+    #-----------------------------------------
+
+#========================================
+
+class MidiChaseIndex(object):
+    """
+    Controller state checkpoints, to chase the channel state on seeks
+    Contains the controller, program and pitch bend values of each channel at each checkpoint,
+    and the controller events sorted by time, to replay only the delta after a checkpoint
+    Note: data entry, RPN, NRPN and channel mode controllers are not chased,
+    their effect depends on the message order
+    """
+    def __init__(self):
+        self.interval =0 # in ticks between checkpoints
+        self.tick_arr = np.zeros(0, dtype=np.int64)
+        self.key_arr = np.zeros(0, dtype=np.int64) # channel * _chase_slots + slot
+        self.val_arr = np.zeros(0, dtype=np.int16)
+        self.bound_arr = np.zeros(1, dtype=np.int64) # first event index for each checkpoint
+        self.state_arr = np.full((1, 16 * _chase_slots), -1, dtype=np.int16)
+        self.render_count =-1 # build count of the render list, for the compiled index
+        self.build_time =0 # in sec
+
+    #-----------------------------------------
+
+    def compile(self, render, interval):
+        """
+        extract controller events from the render list, and generate the checkpoints
+        from MidiChaseIndex object
+        """
+
+        start_time = time.perf_counter()
+        tick_lst = []
+        key_lst = []
+        val_lst = []
+        msg_lst = render.msg_lst
+        tracknum_lst = render.tracknum_lst
+        get_channel = render.get_channel
+        group_lst = render.group_lst + [len(msg_lst)]
+        for (pos, tick) in enumerate(render.tick_lst):
+            (start, stop) = (group_lst[pos], group_lst[pos+1])
+            for (tracknum, msg) in zip(tracknum_lst[start:stop], msg_lst[start:stop]):
+                type = msg.type
+                if type == 'control_change':
+                    if msg.control in _chase_excluded: continue
+                    (slot, val) = (msg.control, msg.value)
+                elif type == 'program_change':
+                    (slot, val) = (_SLOT_PROGRAM, msg.program)
+                elif type == 'pitchwheel':
+                    (slot, val) = (_SLOT_PITCH, msg.pitch + 8192)
+                else:
+                    continue
+                tick_lst.append(tick)
+                key_lst.append(get_channel(tracknum, msg.channel) * _chase_slots + slot)
+                val_lst.append(val)
+
+        interval = max(interval, 1)
+        tick_arr = np.array(tick_lst, dtype=np.int64)
+        key_arr = np.array(key_lst, dtype=np.int64)
+        val_arr = np.array(val_lst, dtype=np.int16)
+        # initial state, controllers used in the sequence start at their default value,
+        # and programs at the first program of the channel
+        state = np.full(16 * _chase_slots, -1, dtype=np.int16)
+        (used_arr, first_ind) = np.unique(key_arr, return_index=True)
+        slot_arr = used_arr % _chase_slots
+        state[used_arr] =0
+        for (control, val) in _cc_defaults.items():
+            state[used_arr[slot_arr == control]] = val
+        state[used_arr[slot_arr == _SLOT_PITCH]] = 8192
+        is_program = slot_arr == _SLOT_PROGRAM
+        state[used_arr[is_program]] = val_arr[first_ind[is_program]]
+        
+        # the checkpoint state contains the events before its tick
+        count = int(tick_arr[-1] // interval) +1 if len(tick_arr) else 1
+        bound_arr = np.searchsorted(tick_arr, np.arange(count, dtype=np.int64) * interval, side='left')
+        state_arr = np.empty((count, len(state)), dtype=np.int16)
+        state_arr[0] = state
+        for k in range(1, count):
+            state = state_arr[k-1].copy()
+            self._apply(state, key_arr, val_arr, bound_arr[k-1], bound_arr[k])
+            state_arr[k] = state
+
+        self.interval = interval
+        self.tick_arr = tick_arr
+        self.key_arr = key_arr
+        self.val_arr = val_arr
+        self.bound_arr = bound_arr
+        self.state_arr = state_arr
+        self.render_count = render.build_count
+        self.build_time = time.perf_counter() - start_time
+        log.debug(f"Chase index compiled: {len(tick_arr)} controller events, {count} checkpoints, "
+                f"in {self.build_time * 1000:.3f} msec", bell=0)
+
+    #-----------------------------------------
+
+    @staticmethod
+    def _apply(state, key_arr, val_arr, start, stop):
+        """
+        apply controller events between start and stop index to the state,
+        the last event wins for each key
+        from MidiChaseIndex object
+        """
+
+        if start >= stop: return
+        # first index in reversed order is the last event
+        (keys, rev_ind) = np.unique(key_arr[start:stop][::-1], return_index=True)
+        state[keys] = val_arr[start:stop][::-1][rev_ind]
+
+    #-----------------------------------------
+
+    def get_state(self, tick):
+        """
+        returns the state array before tick, 
+        from the nearest checkpoint and the events after it
+        from MidiChaseIndex object
+        """
+
+        k = min(max(tick, 0) // self.interval, len(self.state_arr) -1) if self.interval else 0
+        state = self.state_arr[k].copy()
+        stop = np.searchsorted(self.tick_arr, tick, side='left')
+        self._apply(state, self.key_arr, self.val_arr, self.bound_arr[k], stop)
+
+        return state
+
+    #-----------------------------------------
+
+    def get_messages(self, tick):
+        """
+        returns the messages to restore the channels state at tick,
+        by channel: bank select, program change, controllers and pitch bend
+        from MidiChaseIndex object
+        """
+
+        msg_lst = []
+        state = self.get_state(tick).reshape(16, _chase_slots)
+        for chan in np.flatnonzero((state >= 0).any(axis=1)).tolist():
+            vals = state[chan].tolist()
+            for control in (0, 32):
+                if vals[control] >= 0:
+                    msg_lst.append(mido.Message('control_change', channel=chan, control=control, value=vals[control]))
+            if vals[_SLOT_PROGRAM] >= 0:
+                msg_lst.append(mido.Message('program_change', channel=chan, program=vals[_SLOT_PROGRAM]))
+            for control in range(1, 128):
+                if control != 32 and vals[control] >= 0:
+                    msg_lst.append(mido.Message('control_change', channel=chan, control=control, value=vals[control]))
+            if vals[_SLOT_PITCH] >= 0:
+                msg_lst.append(mido.Message('pitchwheel', channel=chan, pitch=vals[_SLOT_PITCH] - 8192))
+
+        return msg_lst
+
+    #-----------------------------------------
+
+#========================================
+
+class MidiSequence(object):
+    """
+    sequence manager
+    """
+    def __init__(self, parent=None, *args, **kwargs):
+        # super().__init__()
+        self.parent = parent
+        self.base = MidiBase() # base midi object
+        self.tools = midto.MidiTools()
         self.metronome = MidiMetronome(self) #
         self.midi_man = None
         self.format_type =0
         self.quan_res =0 # quantize resolution: 4th or 16th note of bar
         self.quan_step =0 # quantize step: number of tick per step
+        self.quan_strength =100 # in percent
+        self.quan_swing =0 # in percent
+        self.quan_preserve =1 # whether preserving note length
+        self.quantizer = midto.MidiQuantizer()
         self.track_lst = []
         self.left_loc =0
         self.right_loc =0
@@ -2074,6 +3073,14 @@ class MidiSequence(object):
         self._last_pos =0
         self._timeline = None # A MidiTrack object
         self._bpm_changed =0
+        self.columnar =0 # storing tracks events in numpy arrays
+        self.timeline_build_time =0 # in sec
+        self._dirty_dic = {} # tuple of start and end tick to update in the timeline, by track number
+        self._render = MidiRenderList()
+        self.rendering =1 # playing with the render list
+        self._chase = MidiChaseIndex()
+        self.chasing =1 # restoring controllers state on seeks
+        self.file_cache = None # MidiFileCache object, to reopen known files without parsing
 
     #-----------------------------------------
 
@@ -2148,9 +3155,10 @@ class MidiSequence(object):
 
     #-----------------------------------------
 
-    def gen_timeline(self):
+    def gen_timeline(self, tim_store=None):
         """
         Generate timeline midi track
+        tim_store: allready built timeline store in columnar mode, from the file cache
         from MidiSequence object
         """
         
@@ -2165,41 +3173,201 @@ class MidiSequence(object):
         file_name = self.base.file_name
         debug(f"File_name: {file_name}", writing_file=True)
         total_count =0
+        start_time = time.perf_counter()
+        self._dirty_dic = {}
+        self._render.invalidate()
 
-        for track in self.track_lst:
-            
-            # """
-            curtime =-1
-            for ev in track.ev_lst:
-                evtime = ev.msg.time
-                if evtime != curtime:
-                    tim.ev_lst.append(ev)
-                    curtime = evtime
-                    total_count +=1
-            # """
-  
-            """
-            tim.add_evs(*track.ev_lst)
-            total_count += track.count()
-            """
-        # sorting the timeline in place
-        # tim.sort()
-        tim.sort_uniq_evs()
-        
-        # Cannot make uniq item in the event list, cause groupby function not work with complex object for consecutive item
-        # tim.ev_lst = list(k for k, _ in itt.groupby(sorted(tim.ev_lst, key=lambda x: x.msg.time)))
+        if self.track_lst and all(track.is_packed() for track in self.track_lst):
+            if tim_store is not None:
+                tim.set_store(tim_store)
+            else:
+                # columnar mode: keeping the first row of each group time for all tracks
+                store_lst = []
+                for track in self.track_lst:
+                    store = track.get_store()
+                    if not len(store): continue
+                    starts = store.get_group_starts()
+                    store_lst.append(mst.MidiEventStore(store.data[starts], store.meta_lst))
+                tim.set_store(mst.MidiEventStore.concat(store_lst))
+                tim.sort_uniq_evs()
+            tim.set_pos(0)
+            tim.gen_group_time()
+            self._log_timeline_time(start_time)
+            if debugging: _DEBUG =1
+            return
+
+        # tracks are allready sorted, so merging the first event of each group time for all tracks,
+        # for the same time, the first track wins, like a stable sort
+        ev_lst = []
+        group_time_lst = []
+        curtime =-1
+        stream_lst = [self._gen_group_stream(track) for track in self.track_lst]
+        for (evtime, ev) in heapq.merge(*stream_lst, key=lambda x: x[0]):
+            if evtime != curtime:
+                # Keeping tuple of uniq index and time for group event in the same pass
+                group_time_lst.append((len(ev_lst), evtime))
+                ev_lst.append(ev)
+                curtime = evtime
+            total_count +=1
+        tim.init(ev_lst)
         tim.set_pos(0)
+        tim.group_time_lst = group_time_lst
+        tim.group_time_index =0
+        self._log_timeline_time(start_time)
 
-        # Keeping index of grouping event
-        # generate group position for the timeline
-        # tim.gen_group_pos()
-        # Or generate tuple of uniq index and time for group event
-        tim.gen_group_time()
         # show the results
         if _DEBUG: self.print_timeline_evs()
         if debugging: _DEBUG =1
 
     #-----------------------------------------
+
+    def _gen_group_stream(self, track, start=None, stop=None):
+        """
+        generator of tuple time and first event for each group time on the track,
+        between start and stop index
+        from MidiSequence object
+        """
+        
+        curtime =-1
+        for ev in track.ev_lst[start:stop]:
+            evtime = ev.msg.time
+            if evtime != curtime:
+                yield (evtime, ev)
+                curtime = evtime
+
+    #-----------------------------------------
+
+    def _gen_group_rows(self, track, start, stop, meta_lst):
+        """
+        returns array of the first row of each group time on the track,
+        between start and stop index, 
+        meta rows are indexed in meta_lst, where their messages are appended
+        from MidiSequence object
+        """
+
+        store = track.get_store()
+        if store is None:
+            row_lst = [mst.msg2row(ev.msg, evtime, ev.tracknum, meta_lst)\
+                    for (evtime, ev) in self._gen_group_stream(track, start, stop)]
+            return np.array(row_lst, dtype=mst.ev_dtype)
+        data = store.data[start:stop]
+        data = data[mst.MidiEventStore(data).get_group_starts()]
+        mask = data['type'] == mst.TYPE_META
+        if mask.any():
+            index_lst = data['data1'][mask].tolist()
+            data['data1'][mask] = np.arange(len(meta_lst), len(meta_lst) + len(index_lst))
+            meta_lst.extend(store.meta_lst[i] for i in index_lst)
+
+        return data
+
+    #-----------------------------------------
+
+    def touch_track(self, tracknum=-1, start_tick=0, end_tick=-1):
+        """
+        marks a tick range as modified on the track, 
+        end_tick -1 for the end of the track
+        the timeline will be updated on this range by update_timeline,
+        and the next undo snapshot rebuilds only this range
+        from MidiSequence object
+        """
+
+        if tracknum == -1: tracknum = self.tracknum
+        if end_tick != -1 and end_tick < start_tick:
+            (start_tick, end_tick) = (end_tick, start_tick)
+        track = self.get_track(tracknum)
+        if track is not None: track.touch(start_tick, end_tick)
+        if tracknum in self._dirty_dic:
+            (old_start, old_end) = self._dirty_dic[tracknum]
+            start_tick = min(start_tick, old_start)
+            if old_end == -1 or end_tick == -1: end_tick = -1
+            else: end_tick = max(end_tick, old_end)
+        self._dirty_dic[tracknum] = (start_tick, end_tick)
+
+    #-----------------------------------------
+
+    def update_timeline(self):
+        """
+        update only the modified tick range in the timeline and its group_time list
+        returns 1 for updating, 0 for not
+        from MidiSequence object
+        """
+
+        if not self._dirty_dic: return 0
+        tim = self._timeline
+        if tim is None: return 0
+        if not tim.is_sorted():
+            # the timeline is unsorted when times of shared events changed in place
+            self.gen_timeline()
+            return 1
+        
+        start_time = time.perf_counter()
+        range_lst = list(self._dirty_dic.values())
+        self._dirty_dic = {}
+        self._render.invalidate()
+        start_tick = min(item[0] for item in range_lst)
+        end_tick = -1
+        if all(item[1] != -1 for item in range_lst):
+            end_tick = max(item[1] for item in range_lst)
+
+        (start, stop) = tim.search_range(start_tick, end_tick)
+        if tim.is_packed():
+            # columnar mode: merging the first row of each group time for all tracks on the range only
+            store = tim.get_store()
+            row_lst = []
+            for track in self.track_lst:
+                (ev_start, ev_stop) = track.search_range(start_tick, end_tick)
+                row_lst.append(self._gen_group_rows(track, ev_start, ev_stop, store.meta_lst))
+            rows = np.concatenate(row_lst)
+            # for the same time, the first track wins, like a stable sort
+            rows = rows[np.argsort(rows['tick'], kind='stable')]
+            rows = rows[mst.MidiEventStore(rows).get_group_starts()]
+            store.data = np.concatenate((store.data[:start], rows, store.data[stop:]))
+            tim.set_store(store)
+            count = len(rows)
+        else:
+            # merging the group events of all tracks on the range only
+            stream_lst = []
+            for track in self.track_lst:
+                (ev_start, ev_stop) = track.search_range(start_tick, end_tick)
+                stream_lst.append(self._gen_group_stream(track, ev_start, ev_stop))
+            ev_lst = []
+            curtime =-1
+            for (evtime, ev) in heapq.merge(*stream_lst, key=lambda x: x[0]):
+                if evtime != curtime:
+                    ev_lst.append(ev)
+                    curtime = evtime
+            tim.replace_evs(start, stop, ev_lst)
+            count = len(ev_lst)
+
+        # the timeline has one event by group time, so group index is event index
+        ticks = tim.get_ticks()
+        new_lst = list(zip(range(start, start + count), map(int, ticks[start:start + count])))
+        group_time_lst = tim.group_time_lst
+        shift = count - (stop - start)
+        if shift:
+            # the next indexes are shifted, without reading the ticks
+            new_lst.extend((index + shift, tick) for (index, tick) in group_time_lst[stop:])
+            group_time_lst[start:] = new_lst
+        else:
+            group_time_lst[start:stop] = new_lst
+        tim.update_track_pos(self.curpos)
+        self._log_timeline_time(start_time)
+
+        return 1
+
+    #-----------------------------------------
+
+    def _log_timeline_time(self, start_time):
+        """
+        saving and logging the timeline build time
+        from MidiSequence object
+        """
+
+        self.timeline_build_time = time.perf_counter() - start_time
+        log.debug(f"Timeline generated: {self._timeline.count()} events, "
+                f"in {self.timeline_build_time * 1000:.3f} msec", bell=0)
+
+    #-----------------------------------------
     
     def print_timeline_evs(self):
         """
@@ -2225,6 +3393,26 @@ class MidiSequence(object):
 
     #-----------------------------------------
 
+    def set_columnar(self, columnar):
+        """
+        sets the storage mode for all tracks, list or numpy arrays,
+        and regenerate the timeline
+        from MidiSequence object
+        """
+
+        self.columnar = columnar
+        for track in self.track_lst:
+            if columnar: track.pack()
+            else: track.unpack()
+            track.gen_group_pos()
+        if self._timeline is not None:
+            self.gen_timeline()
+            self.set_position(self.curpos)
+
+        return self.columnar
+
+    #-----------------------------------------
+
     def set_seq_pos(self, pos):
         """
         set the current sequence position without update tracks position
@@ -2268,6 +3456,7 @@ class MidiSequence(object):
         # Sets the timeline position
         tim = self._timeline
         tim.update_track_pos(pos)
+        if self._render.valid: self._render.set_pos(pos)
         self.curpos = pos
         
         """
@@ -2322,6 +3511,8 @@ class MidiSequence(object):
             track.lastpos =-1
             index = track.search_pos(pos)
             track.set_pos(index)
+        # moving back the render cursor too, a group read but not sent is replayed
+        if self._render.valid: self._render.set_pos(pos)
         self.curpos =pos
     #-----------------------------------------
 
@@ -2333,7 +3524,7 @@ class MidiSequence(object):
 
         res =0
         if quan_res >0:
-            self.quan_step = int(self.bar / quan_res)
+            self.quan_step = int(self.base.bar / quan_res)
             self.quan_res = quan_res
             res = self.quan_step
         
@@ -2350,8 +3541,9 @@ class MidiSequence(object):
         from MidiSequence object
         """
         
-        note_lst = []
-        ind_lst = []
+        if type == 0:
+            return self.quantize_tracks([tracknum], quan_res)
+        
         # self.quan_step = self.bar / self.quan_res
         if quan_res == 0:
             quan_step = self.quan_step
@@ -2359,82 +3551,61 @@ class MidiSequence(object):
             quan_step = self.set_quantize_resolution(quan_res)
         if quan_step == 0:
             return
-        if type == 0:
-            track = self.get_track(tracknum)
-            ev_lst = track.get_list()
-        elif type == 1:
+        if type == 1:
             # must be modified in input callback function
-            ev_lst = self.rec_track.get_list()
+            track = self.rec_track
         else:
             # must be modified in rec_lst
-            ev_lst = self.rec_lst
-        
-        # debug("voici list: {}".format(msg_lst))
-        for (i, ev)  in enumerate(ev_lst):
-            msg = ev.msg
-            # debug("msg_time: {}".format(msg.time))
-            if msg.type == 'note_off':
-                continue
-            elif msg.type == 'note_on':
-                # we searching the note_off associated with this note on
-                title = "Note_on"
-                msg_str = "index: {}, note: {}, time: {}".format(i, msg.note, msg.time)
-                # debug(msg_str, title, writing_file=True)
-                note_lst = []
-                for (j, ev1) in enumerate(ev_lst[i:], i):
-                    msg1 = ev1.msg
-                    if msg1.type == 'note_off' and msg1.note == msg.note\
-                            and j not in ind_lst:
-                            note_lst.append((msg, i))
-                            note_lst.append((msg1, j))
-                            ind_lst.append(j)
-                            title = "Note_off"
-                            msg_str = "index: {}, note: {}, time: {}".format(j, msg1.note, msg1.time)
-                            # debug(msg_str, title, writing_file=True)
-                            break
-
-            # calculate quantization step
-            (div, rest) = divmod(msg.time, quan_step)
-            if rest >0:
-                if note_lst:
-                    # (note, note1) = note_lst
-                    (note, ind) = note_lst[0]
-                    (note1, ind1) = note_lst[1]
-                    if rest <= quan_step / 2:
-                        # shift note at the previous step
-                        val = note.time - rest
-                        val1 = note1.time - rest
-                    else: # rest greater than
-                        # shift note at the next step
-                        val = note.time - rest + quan_step
-                        val1 = note1.time - rest + quan_step
-                    note.time = val
-                    note1.time = val1
-                    ev = ev_lst[ind] 
-                    ev1 = ev_lst[ind1] 
-                    # ev.msg = note
-                    # ev1.msg = note1
-                    note_lst = []
-                    # debug("notes found")
-                else: # no note_lst
-                    if rest <= quan_step / 2:
-                        # shift msg at the previous step
-                        val = msg.time - rest
-                    else:
-                        # shift msg at the next step
-                        val = msg.time - rest  + quan_step
-                    msg.time = val
-            else: # no rest
-                pass
-        # re generate trackline
-        self.gen_trackline() 
+            track = MidiTrack()
+            track.ev_lst = self.rec_lst
+        quantizer = self.quantizer
+        quantizer.set_params(quan_step, self.quan_strength, self.quan_swing, self.quan_preserve)
+        quantizer.quantize_tracks([track])
         
+    #-----------------------------------------
+
+    def quantize_tracks(self, tracknum_lst=None, quan_res=0, strength=-1, swing=-1, preserve_len=-1):
         """
-        debug("Liste complete", writing_file=True)
-        for msg in msg_lst:
-            debug("Type: {}, Note: {}, Time: {}".format(msg.type, msg.note, msg.time), writing_file=True)
+        quantize note spans of many tracks, in a single vectorized pass
+        tracknum_lst: None for all tracks
+        strength, swing and preserve_len: -1 for the sequence parameters
+        returns number of modified tracks
+        from MidiSequence object
         """
 
+        if quan_res == 0:
+            quan_step = self.quan_step
+        else:
+            quan_step = self.set_quantize_resolution(quan_res)
+        if quan_step == 0:
+            return 0
+        if strength == -1: strength = self.quan_strength
+        if swing == -1: swing = self.quan_swing
+        if preserve_len == -1: preserve_len = self.quan_preserve
+        if tracknum_lst is None:
+            tracknum_lst = range(len(self.track_lst))
+        sel_lst = []
+        for tracknum in tracknum_lst:
+            if tracknum == -1: tracknum = self.tracknum
+            track = self.get_track(tracknum)
+            if track is not None: sel_lst.append((tracknum, track))
+        # the timeline shares events with the tracks, 
+        # so its tick index must be built before changing times in place
+        if self._timeline is not None: self._timeline.get_ticks()
+        quantizer = self.quantizer
+        quantizer.set_params(quan_step, strength, swing, preserve_len)
+        res_lst = quantizer.quantize_tracks([track for (_, track) in sel_lst])
+        count =0
+        for ((tracknum, _), res) in zip(sel_lst, res_lst):
+            if res is None: continue
+            (start_tick, end_tick) = res
+            self.touch_track(tracknum, start_tick, end_tick)
+            count +=1
+        # update the modified range in the timeline
+        if count: self.update_timeline()
+
+        return count
+
     #-----------------------------------------
 
     def toggle_quantize(self):
@@ -2722,6 +3893,7 @@ class MidiSequence(object):
         track = self.get_track(tracknum)
         
         track.set_muted(muted, track.channel_num)
+        self._render.update_tracks()
         
         return muted
     
@@ -2777,6 +3949,7 @@ class MidiSequence(object):
             if not soloing: # no track is soloing
                 for (i, trk) in enumerate(self.track_lst, 1):
                     trk.set_sysmuted(0, trk.channel_num)
+        self._render.update_tracks()
                 
         return soloed
 
@@ -2858,17 +4031,22 @@ class MidiSequence(object):
             elif start_pos >= end_pos and end_pos != -1:
                 return (res, tracknum)
             
+            recorder = midto.get_recorder()
             if end_pos == -1:
                 # delete all events
+                recorder.record_replace(track, 0, len(ev_lst), [])
                 ev_lst[:] = []
                 res =1
             else:
                 (start_ind, end_ind) = self.tools.get_track_range(track, start_pos, end_pos)
                 if start_ind and end_ind != -1:
-                    ev_lst[start_ind:end_ind] = []
+                    recorder.record_replace(track, start_ind, end_ind, [])
+                    track.replace_evs(start_ind, end_ind, [])
                     debug("voici start_ind: {} et end_ind: {}".format(start_ind, end_ind))
                     res =1
-            
+            if res:
+                self.touch_track(tracknum, start_pos, end_pos)
+                self.update_timeline()
             
         return (res, tracknum)
 
@@ -2904,17 +4082,9 @@ class MidiSequence(object):
         from MidiSequence object
         """
 
-        res = -1
         track = self.get_track(tracknum)
-        ev_lst = track.get_list()
-        if end_ind == -1:
-            end_ind = len(ev_lst) -1
-        for (i, ev) in enumerate(ev_lst[start_ind:end_ind], start_ind):
-            if ev.msg.type == 'note_off' and ev.msg.note == note: 
-                res = i
-                break
 
-        return res
+        return track.search_noteoff(note, start_ind, end_ind)
 
     #-----------------------------------------
 
@@ -2924,22 +4094,10 @@ class MidiSequence(object):
         from MidiSequence object
         """
 
-        note_lst = []
-        tmp_lst = []
         track = self.get_track(tracknum)
-        ev_lst = track.get_list()
-        if end_ind == -1:
-            end_ind = len(ev_lst) -1
-        for (i, ev) in enumerate(ev_lst[start_ind:end_ind], start_ind):
-            if ev.msg.type == 'note_on':
-                for (j, ev1) in enumerate(ev_lst[i:], i):
-                    if ev1.msg.type == 'note_off' and ev.msg.note == ev1.msg.note\
-                        and j not in tmp_lst:
-                        note_lst.append((tracknum, i, j))
-                        tmp_lst.append(j)
-                        break
+        span_lst = track.get_note_spans(start_ind, end_ind)
 
-        return note_lst
+        return [(tracknum, on_ind, off_ind) for (on_ind, off_ind, _) in span_lst]
 
     #-----------------------------------------
 
@@ -2957,25 +4115,23 @@ class MidiSequence(object):
         elif start_pos >= end_pos and end_pos != -1:
             return (res, tracknum)
         
-        if end_pos == -1:
-            # delete all events
-            end_pos = len(ev_lst) -1
-        (start_ind, end_ind) = self.tools.get_track_range(track, start_pos, end_pos)
-        if start_ind and end_ind != -1:
-            # for (i, ev) in enumerate(ev_lst[start_ind:end_ind], start_ind):
-            note_lst = self.get_notes(tracknum, start_ind, end_ind)
-            """
-            for item in note_lst:
-                # getting index of note_on and note_off
-                id1 = item[1]
-                id2 = item[2]
-                ev = ev_lst[id1]
-                if ev.msg.note >= min_note and ev.msg.note <= max_note:
-                    # delete note_on and associated note_off
-                    del ev_lst[id1]
-                    res =1
-    œ       """
-
+        # end_pos -1 for all events
+        (start_ind, end_ind) = track.search_range(start_pos, end_pos)
+        # getting index of note_on and note_off from the note index
+        del_set = set()
+        for (_, id1, id2) in self.get_notes(tracknum, start_ind, end_ind):
+            note = ev_lst[id1].msg.note
+            if note >= min_note and note <= max_note:
+                # delete note_on and associated note_off
+                del_set.add(id1)
+                del_set.add(id2)
+        if del_set:
+            ev_lst = [ev for (i, ev) in enumerate(ev_lst) if i not in del_set]
+            track.replace_evs(0, len(track.get_list()), ev_lst)
+            res =1
+            # note off can be after end_pos
+            self.touch_track(tracknum, start_pos)
+            self.update_timeline()
         
         return (res, tracknum)
 
@@ -3033,6 +4189,7 @@ class MidiSequence(object):
             
             # debug("val: {}, len_lst: {}".format(i, len(ev_lst)))
             i += 1
+        track.touch()
         
         # self.gen_trackline() 
 
@@ -3063,6 +4220,7 @@ class MidiSequence(object):
             
             # debug("val: {}, len_lst: {}".format(i, len(ev_lst)))
             i += 1
+        track.touch()
         # create new track
         new_track = MidiTrack()
         new_track.add_evs(*new_lst)
@@ -3097,10 +4255,25 @@ class MidiSequence(object):
         from MidiSequence object
         """
 
+        if tracknum == -1:
+            tracknum = self.tracknum
         track = self.get_track(tracknum)
-        for (i, ev) in enumerate(track.get_list()):
-            ev.msg.channel = chan
+        midto.get_recorder().record_channel(track, chan)
+        old_chan = track.channel_num
+        if track.is_packed():
+            data = track.get_store().data
+            data['channel'][data['type'] != mst.TYPE_META] = chan
+        else:
+            for (i, ev) in enumerate(track.get_list()):
+                if ev.msg.is_meta or ev.msg.type == 'sysex': continue
+                ev.msg.channel = chan
         track.channel_num = chan
+        if self._render.valid:
+            # the compiled events are remapped when playing, without compiling them again
+            self._render.set_channel(tracknum, chan)
+            # the chase index must use the new channel
+            self._chase.render_count =-1
+            if old_chan != chan: track.midi_man.panic(old_chan)
 
     #-----------------------------------------
 
@@ -3111,9 +4284,12 @@ class MidiSequence(object):
         """
 
         track = self.get_track(tracknum)
+        track.unpack()
         ev = track.search_ev(type, pos)
         if ev:
             ev.msg.program = val
+            track.touch(ev.msg.time, ev.msg.time)
+            self._render.invalidate()
 
     #-----------------------------------------
 
@@ -3125,17 +4301,20 @@ class MidiSequence(object):
 
         track = self.get_track(tracknum)
         if track is None: return
+        track.unpack()
         type = "set_tempo"
         ev = track.search_ev(type, time)
         if ev:
             ev.msg.tempo = int(val)
-            pass
+            track.touch(ev.msg.time, ev.msg.time)
         else:
             # debug("event tempo not found")
             ev = MidiEvent(type=type, cat=1)
             ev.msg.tempo = int(val)
             ev.msg.time =0
             track.insert(0, ev)
+            self.touch_track(tracknum, 0, 0)
+            self.update_timeline()
 
     #-----------------------------------------
 
@@ -3159,7 +4338,9 @@ class MidiSequence(object):
                 res = ev1
                 if evobj.ev2: # note_off
                     debug("noteoff found at index: {}".format(evobj.index2))
+                    track.touch(ev1.msg.time, ev_lst[evobj.index2].msg.time)
                     del ev_lst[evobj.index2]
+                track.touch(ev1.msg.time, ev1.msg.time)
                 del ev_lst[evobj.index1]
             except IndexError:
                 debug("Error on deleting event, track: {}, index: {}, ev: {}".format(evobj.ev.tracknum, evobj.index, evobj.ev.msg))
@@ -3194,12 +4375,124 @@ class MidiSequence(object):
         """
         
         for (i, track) in enumerate(self.track_lst):
+            if track.is_packed():
+                track.get_store().data['tracknum'] = i
+                continue
             ev_lst = track.get_list()
             for ev in ev_lst:
                 ev.tracknum = i
 
     #-----------------------------------------
     
+    def new_loaded_track(self, channel_num=-1, bank_num=-1, preset_num=-1, patch_num=-1,
+            track_name="", instrument_name=""):
+        """
+        returns a new track with the params found in the midi file
+        from MidiSequence object
+        """
+
+        track = MidiTrack()
+        track.midi_man = self.midi_man
+        if channel_num != -1:
+            track.channel_num = channel_num
+        if bank_num != -1:
+            track.select_bank(bank_num)
+        if preset_num != -1:
+            track.select_preset(preset_num)
+        if patch_num != -1:
+            track.select_patch(patch_num)
+        track.track_name = track_name
+        track.instrument_name = instrument_name
+
+        return track
+
+    #-----------------------------------------
+
+    def finish_loading(self, tim_store=None):
+        """
+        init the tempo map, the click and the timeline after loading tracks
+        from MidiSequence object
+        """
+
+        if self.columnar:
+            for track in self.track_lst: track.pack()
+        else:
+            for track in self.track_lst: track.unpack()
+        self.gen_tempo_map()
+        bpm = self.base.tempo2bpm(self.base.tempo)
+        self.click_track = self.metronome.init_click(bpm)
+        self.gen_timeline(tim_store if self.columnar else None)
+        # self.set_bpm(bpm)
+        # self.base.update_tempo_params()
+        # self.gen_tempo_track()
+        # dont loop
+        self.set_looping(0)
+        # Not needing with timeline track
+        # self.tools.adjust_tracks(self.track_lst)
+
+    #-----------------------------------------
+
+    def load_cached_file(self, filename):
+        """
+        load tracks from the file cache
+        returns 1 whether the file is in the cache
+        from MidiSequence object
+        """
+
+        entry = self.file_cache.load(filename)
+        if entry is None: return 0
+        header = entry['header']
+        self.format_type = header['format_type']
+        self.base.ppq = header['ppq']
+        self.base.file_name = filename
+        if header['tempo']: self.base.tempo = header['tempo']
+        if header['numerator']:
+            self.numerator = header['numerator']
+            self.denominator = header['denominator']
+        self.track_names = header['track_names']
+        self.track_lst = []
+        for (info, store) in zip(header['tracks'], entry['stores']):
+            # info is None for the created tempo track
+            if info is None:
+                track = MidiTrack()
+                track.set_store(store)
+            else:
+                track = self.new_loaded_track(*info)
+                track.set_store(store)
+                track.gen_group_pos()
+            self.track_lst.append(track)
+        self.finish_loading(entry['timeline'])
+
+        return 1
+
+    #-----------------------------------------
+
+    def save_cached_file(self, filename, info_lst, tempo, numerator, denominator):
+        """
+        save the loaded tracks in the file cache
+        from MidiSequence object
+        """
+
+        header = {
+                'format_type': self.format_type,
+                'ppq': self.base.ppq,
+                'tempo': tempo,
+                'numerator': numerator,
+                'denominator': denominator,
+                'track_names': self.track_names,
+                'tracks': info_lst,
+                }
+        store_lst = []
+        for track in self.track_lst:
+            store = track.get_store()
+            if store is None: store = mst.MidiEventStore.from_events(track.get_list())
+            store_lst.append(store)
+        tim_store = self._timeline.get_store() if self.columnar else None
+
+        return self.file_cache.save(filename, header, store_lst, tim_store)
+
+    #-----------------------------------------
+
     def load_file(self, filename):
         """
         load file name
@@ -3208,9 +4501,11 @@ class MidiSequence(object):
 
         res =0
         ev_lst = []
+        if self.file_cache is not None and self.load_cached_file(filename):
+            return 1
         self.track_lst = []
-        # from mido import MidiFile
-        self.mid = mido.MidiFile(filename)
+        # parsing chunks directly, without mido object graph
+        self.mid = midfile.SmfFile(filename)
         # print(mid.ticks_per_beat)
 
         track_count =0
@@ -3218,11 +4513,15 @@ class MidiSequence(object):
         instrument_name = ""
         self.track_names = [] # list containing track and instrument name
         tempo =0
+        numerator =0
+        denominator =0
+        info_lst = [] # track params, for the file cache
         track_tempo = None
-        bpm =0
         channel_num =0
-        channeling =0
         patch_num =0
+        columnar = self.columnar
+        make_message = midfile.make_message
+        make_row = midfile.make_row
 
         # create tempo track 0 when  it missing
         if len(self.mid.tracks) == 1:
@@ -3232,22 +4531,40 @@ class MidiSequence(object):
             track_count +=1
             names = ["", ""] # for name and instrument list of tracks
             self.track_names.append(names)
+            info_lst.append(None)
 
         self.format_type = int(self.mid.type)
         self.base.ppq = int(self.mid.ticks_per_beat)
         self.base.file_name = filename
         for (tracknum, trackobj) in enumerate(self.mid.tracks):
-            abstick =0
             channel_num = -1
             bank_num =-1
             preset_num =-1
             patch_num =-1
-            channeling =0
             track_name = ""
             instrument_name = ""
             names = ["", ""] # for name and instrument list of tracks
             ev_lst = []
-            for msg in trackobj:
+            row_lst = [] # rows for the store in columnar mode
+            meta_lst = []
+            ev_tracknum = track_count + tracknum
+            # events with absolute tick, and note_on with velocity 0 as note_off
+            for (abstick, status, data1, data2, msg) in trackobj.iter_events():
+                if msg is None: # channel message
+                    cmd = status & 0xf0
+                    channel_num = status & 0x0f
+                    if cmd == 0xb0:
+                        if data1 == 0 or data1 == 32:
+                            bank_num = data1
+                            preset_num = data2
+                    elif cmd == 0xc0:
+                        patch_num = data1
+                    if columnar:
+                        row_lst.append(make_row(status, data1, data2, abstick, ev_tracknum))
+                    else:
+                        ev_lst.append(MidiEvent(msg=make_message(status, data1, data2, abstick), tracknum=ev_tracknum))
+                    continue
+
                 evt = None
                 evt0 = None
                 if msg.type == 'set_tempo':
@@ -3258,8 +4575,8 @@ class MidiSequence(object):
                     else:
                         evt = MidiEvent()
                         evt.msg = msg
-                    if msg.time == 0:
-                        self.base.tempo = int(msg.tempo)
+                    if abstick == 0:
+                        self.base.tempo = tempo = int(msg.tempo)
                     # print(f"voici tempo: {msg.tempo}, time: {msg.time}")
                     # print("ticks_per_beat or ppq: {}".format(self.ppq))
                     # print(f"track: {tracknum}, Tempo: {msg.tempo}")
@@ -3281,9 +4598,9 @@ class MidiSequence(object):
                     else:
                         evt = MidiEvent()
                         evt.msg = msg
-                    if msg.time == 0:
-                        self.numerator = msg.numerator
-                        self.denominator = msg.denominator
+                    if abstick == 0:
+                        self.numerator = numerator = msg.numerator
+                        self.denominator = denominator = msg.denominator
                     # print(msg)
                 elif msg.type in ('sequence_number', 'text', 'copyright', 'lyrics', 'key_signature',\
                     'marker', 'cue_marker', 'midi_port', 'smpte_offset', 'end_of_track'):
@@ -3292,67 +4609,26 @@ class MidiSequence(object):
                 elif msg.type == 'sysex':
                     evt = MidiEvent()
                     evt.msg = msg
-                    pass
-                elif not isinstance(msg, mido.MetaMessage):
-                    channeling =1
-                    evt = MidiEvent(type='note_on')
-                    evt.msg = msg
-                    if msg.type == 'note_on': 
-                        if msg.velocity == 0:
-                            evt = MidiEvent(type='note_off')
-                            evt.msg.note = msg.note
-                            evt.msg.velocity = msg.velocity
-                            evt.msg.channel = msg.channel
-                        
-                        else: # velocity != 0
-                            evt = MidiEvent(type='note_on')
-                            evt.msg = msg
-                    elif msg.type == 'control_change':
-                        evt.msg = msg
-                        if msg.control == 0 or msg.control == 32:
-                            bank_num = msg.control
-                            preset_num = msg.value
-                        # print("control {}".format(msg.control))
-                    elif msg.type == 'program_change': 
-                        evt.msg = msg
-                        patch_num = msg.program
-                    elif msg.type == 'polytouch':
-                        evt.msg = msg
-                    elif msg.type == 'aftertouch':
-                        evt.msg = msg
-                    elif msg.type == 'pitchwheel':
-                        evt.msg = msg
 
                 if evt:
-                    evt.tracknum = track_count + tracknum
-                    # evt.msg is a mido message
-                    # print("voici: ",msg.type)
-                    if channeling:
-                        evt.msg.channel = msg.channel
-                        channel_num = evt.msg.channel
-                        channeling =0
-
-                    abstick  += msg.time
-                    evt.msg.time = abstick
-                    ev_lst.append(evt)
+                    # evt.msg is a mido message with absolute tick
+                    if columnar:
+                        row_lst.append(mst.msg2row(msg, abstick, ev_tracknum, meta_lst))
+                    else:
+                        evt.tracknum = ev_tracknum
+                        ev_lst.append(evt)
                     # print("type: {}, note: {}, vel: {}".format(msg.type, msg.note, msg.velocity))
 
-
-
-            track = MidiTrack()
-            track.midi_man = self.midi_man
-            if channel_num != -1:
-                track.channel_num = channel_num
-            if bank_num != -1:
-                track.select_bank(bank_num)
-            if preset_num != -1:
-                track.select_preset(preset_num)
-            if patch_num != -1:
-                track.select_patch(patch_num)
-            track.track_name = track_name
-            track.instrument_name = instrument_name
+            info = [channel_num, bank_num, preset_num, patch_num, track_name, instrument_name]
+            track = self.new_loaded_track(*info)
+            info_lst.append(info)
             # print(track_name, instrument_name)
-            if ev_lst:
+            if row_lst:
+                # emitting rows directly in the store
+                track.set_store(mst.MidiEventStore(np.array(row_lst, dtype=mst.ev_dtype), meta_lst))
+                track.gen_group_pos()
+                res =1
+            elif ev_lst:
                 track.add_evs(*ev_lst)
                 track.gen_group_pos()
                 res =1
@@ -3360,54 +4636,24 @@ class MidiSequence(object):
             self.track_names.append(names)
             
         if res:
-            bpm = self.base.tempo2bpm(self.base.tempo)
-            self.click_track = self.metronome.init_click(bpm)
-            self.gen_timeline()
-            # self.set_bpm(bpm)
-            # self.base.update_tempo_params()
-            # self.gen_tempo_track()
-            # dont loop
-            self.set_looping(0)
-            # Not needing with timeline track
-            # self.tools.adjust_tracks(self.track_lst)
+            self.finish_loading()
+            if self.file_cache is not None:
+                self.save_cached_file(filename, info_lst, tempo, numerator, denominator)
  
         # debug(f"voici patch_num: {patch_num}, channel_num: {channel_num}")
         return res
 
     #-----------------------------------------
      
-    def save_midi_file(self, filename, format_type=1):
+    def save_midi_file(self, filename, format_type=1, running_status=True):
         """
         save midi file
         from MidiSequence object
         """
 
-        ev_lst = []
-        res =0
-        with mido.MidiFile() as mid:
-            # debug("save file")
-            # print(mid.ticks_per_beat)
-            mid.type = format_type
-            mid.ticks_per_beat = self.base.ppq
-
-            for (i, trackobj) in enumerate(self.track_lst):
-                # creating Mido track
-                track = mido.MidiTrack()
-                ev_lst = trackobj.get_list()
-                for (j, ev) in enumerate(ev_lst):
-                    msg = ev.msg.copy()
-                    """
-                    if msg.type == 'set_tempo':
-                        debug("bingo, set_tempo")
-                    """
-                    if j >0:
-                        evprec = ev_lst[j-1]
-                        msg.time = msg.time - evprec.msg.time 
-                    track.append(msg)
-                mid.tracks.append(track)
-            
-            mid.save(filename)
-            res =1
+        writer = midfile.SmfWriter(running_status)
+        writer.write(filename, self.track_lst, self.base.ppq, format_type)
+        res =1
 
         return res
 
@@ -3500,11 +4746,11 @@ class MidiSequence(object):
 
     def get_bpm(self):
         """
-        returns the bpm (beat per minute)
+        returns the bpm (beat per minute) at the current position
         from MidiSequence object
         """
         
-        return self.base.bpm
+        return self.base.tempo2bpm(self.base.get_tempo(self.curpos))
 
     #-----------------------------------------
 
@@ -3524,6 +4770,7 @@ class MidiSequence(object):
             # no necessary to regenerate the tempo track
             # self.gen_tempo_track()
             self.base.update_tempo_params()
+            self.gen_tempo_map()
 
     #-----------------------------------------
 
@@ -3580,7 +4827,8 @@ class MidiSequence(object):
                 newev = MidiEvent()
                 newev.msg = msg.copy()
                 newev.tracknum = tracknum
-                newev.msg.time = self.base.tick2sec(click_pos)
+                # the metronome has a constant tempo, without the tempo map
+                newev.msg.time = float(click_pos * self.base.sec_per_tick)
                 # debug("time: {}".format(msg.time))
                 ev_lst.append(newev.msg)
 
@@ -3659,38 +4907,51 @@ class MidiSequence(object):
 
     #-----------------------------------------
 
-    def adjust_tempo(self, new_tempo, curtick):
+    def gen_tempo_map(self):
         """
-        Adjust the base tempo whether is necessary
-        Returns 1 for change, 0 for not
+        generate the tempo map from the tempo events of all tracks
         from MidiSequence object
         """
-        ret =0        
 
-        old_tempo = self.base.tempo
-        # debug(f"old_tempo: {old_tempo}, new_tempo: {new_tempo}, curtick: {curtick}")
-        if old_tempo == new_tempo: return ret
+        tempo_lst = []
+        for track in self.track_lst:
+            tempo_lst.extend(track.get_tempo_lst())
+        # seconds in the render list depend on the tempo map
+        self._render.invalidate()
+        
+        return self.base.gen_tempo_map(tempo_lst)
 
+    #-----------------------------------------
+
+    def get_render(self):
+        """
+        returns the render list, compiling it whether necessary
+        from MidiSequence object
         """
-        # old_bpm = self.base.tempo2bpm(old_tempo)
-        # new_bpm = self.base.tempo2bpm(new_tempo)
-        diff_tempo =\
-                ( abs(old_tempo - new_tempo) ) / ( (old_tempo + new_tempo) / 2) * 100
 
-        # if curtick == 0 or abs(old_bpm - new_bpm) >= 10:
-        # if curtick == 0 or diff_tempo >= 5:
+        render = self._render
+        if not render.valid:
+            render.compile(self.track_lst, self.base)
+            render.set_pos(self.curpos)
+
+        return render
+
+    #-----------------------------------------
+
+    def get_chase_data(self, tick=-1):
+        """
+        returns the messages to restore programs, controllers and pitch bend at tick,
+        the checkpoints are compiled with the render list
+        from MidiSequence object
         """
 
-        self.base.tempo = new_tempo
-        # Updating the tempo and bpm
-        self.base.update_tempo_params()
-        # debug(f"[Tempo_change]: {new_tempo}, new_bpm: {new_bpm:.3f}, at tick: {curtick}")
-        type = evq.EVENT_BPM_CHANGED
-        value = self.base.bpm
-        _evq_instance.push_event(type, value)
-        ret =1
-    
-        return ret
+        if tick == -1: tick = self.curpos
+        render = self.get_render()
+        chase = self._chase
+        if chase.render_count != render.build_count:
+            chase.compile(render, self.base.bar)
+
+        return chase.get_messages(tick)
 
     #-----------------------------------------
 
@@ -3707,6 +4968,17 @@ class MidiSequence(object):
         # if self._playing and _is_running():
         
         for (tracknum, track) in enumerate(self.track_lst):
+            store = track.get_store()
+            if store is not None:
+                # columnar mode: reading rows, without event objects
+                (start, stop) = track.search_range_group_time(curtick)
+                if track.muted or track.sysmuted or start == stop: continue
+                meta_lst = store.meta_lst
+                for row in store.data[start:stop].tolist():
+                    if row[1] != mst.TYPE_META:
+                        msg_lst.append(mst.row2msg(row, meta_lst))
+                continue
+
             # Note: search_ev_group_time func is used, when we have a list of group time, for playing in realtime
             ev_lst = track.search_ev_group_time(curtick)
             # ev_lst = track.search_ev_group(curtick)
@@ -3729,14 +5001,6 @@ class MidiSequence(object):
                     break
                 """
                 
-                # """
-                if ev.msg.type == "set_tempo": 
-                    if curtick == 0 or abs(curtick - self._last_pos) >= self.base.ppq: # Check tempo change at each beat
-                        if self.adjust_tempo(ev.msg.tempo, curtick):
-                            # self.set_position(curtick)
-                            self._last_pos = curtick
-                # """
-
                 if ev.msg.type in self.base.playable_lst:
                     """
                     # Threre is no need to pass a MidiEvent, but only a MidiMessage
@@ -3751,8 +5015,8 @@ class MidiSequence(object):
                     # msg_lst.append(newev)
                     """
 
-                    msg = ev.msg.copy()
-                    msg_lst.append(msg)
+                    # the message is shared, the player never modifies it
+                    msg_lst.append(ev.msg)
              
         if not msg_lst:
             log.debug(f"No msg_lst, at curtick: {curtick}\n", bell=0)
@@ -0,0 +1,369 @@
+#!/usr/bin/python3
+"""
+    File: midistore.py:
+    Module for columnar storage of midi events, with numpy structured arrays
+    Date: Sun, 18/10/2026
+    Author: Coolbrother
+"""
+
+import numpy as np
+import mido
+
+### Enum message type, in the same order as playable_lst in MidiBase object
+TYPE_NOTE_OFF =0
+TYPE_NOTE_ON =1
+TYPE_POLYTOUCH =2
+TYPE_CONTROL_CHANGE =3
+TYPE_PROGRAM_CHANGE =4
+TYPE_AFTERTOUCH =5
+TYPE_PITCHWHEEL =6
+TYPE_META =7 # meta messages and sysex, kept in the meta list
+
+_type_names = [
+        'note_off', 'note_on', 'polytouch',
+        'control_change', 'program_change', 'aftertouch',
+        'pitchwheel',
+        ]
+_type_codes = dict((name, code) for (code, name) in enumerate(_type_names))
+# status command by type code
+_type_status = [0x80, 0x90, 0xa0, 0xb0, 0xc0, 0xd0, 0xe0]
+_new_message = mido.Message.__new__
+
+# one row per event
+# data1: note, control, program, value, pitch, or index in meta list for meta events
+# data2: velocity, or value
+ev_dtype = np.dtype([
+        ('tick', np.int32),
+        ('type', np.uint8),
+        ('channel', np.uint8),
+        ('data1', np.int32),
+        ('data2', np.int16),
+        ('tracknum', np.int16),
+        ])
+
+#-----------------------------------------
+
+def msg2row(msg, tick, tracknum, meta_lst):
+    """
+    convert a mido message to a tuple row
+    meta messages are appended to meta_lst
+    """
+
+    code = _type_codes.get(msg.type, TYPE_META)
+    if code == TYPE_NOTE_OFF or code == TYPE_NOTE_ON:
+        return (tick, code, msg.channel, msg.note, msg.velocity, tracknum)
+    elif code == TYPE_CONTROL_CHANGE:
+        return (tick, code, msg.channel, msg.control, msg.value, tracknum)
+    elif code == TYPE_PROGRAM_CHANGE:
+        return (tick, code, msg.channel, msg.program, 0, tracknum)
+    elif code == TYPE_PITCHWHEEL:
+        return (tick, code, msg.channel, msg.pitch, 0, tracknum)
+    elif code == TYPE_POLYTOUCH:
+        return (tick, code, msg.channel, msg.note, msg.value, tracknum)
+    elif code == TYPE_AFTERTOUCH:
+        return (tick, code, msg.channel, msg.value, 0, tracknum)
+
+    meta_lst.append(msg)
+    return (tick, TYPE_META, 0, len(meta_lst) -1, 0, tracknum)
+
+#-----------------------------------------
+
+def row2msg(row, meta_lst):
+    """
+    convert a row to a new mido message, with time in absolute tick
+    Note: rows are valid by construction, so channel messages are built without checking
+    """
+
+    (tick, code, chan, data1, data2, _) = row
+    tick = int(tick); chan = int(chan)
+    data1 = int(data1); data2 = int(data2)
+    if code == TYPE_NOTE_ON:
+        dic = {'type': 'note_on', 'channel': chan, 'note': data1, 'velocity': data2, 'time': tick}
+    elif code == TYPE_NOTE_OFF:
+        dic = {'type': 'note_off', 'channel': chan, 'note': data1, 'velocity': data2, 'time': tick}
+    elif code == TYPE_CONTROL_CHANGE:
+        dic = {'type': 'control_change', 'channel': chan, 'control': data1, 'value': data2, 'time': tick}
+    elif code == TYPE_PROGRAM_CHANGE:
+        dic = {'type': 'program_change', 'channel': chan, 'program': data1, 'time': tick}
+    elif code == TYPE_PITCHWHEEL:
+        dic = {'type': 'pitchwheel', 'channel': chan, 'pitch': data1, 'time': tick}
+    elif code == TYPE_POLYTOUCH:
+        dic = {'type': 'polytouch', 'channel': chan, 'note': data1, 'value': data2, 'time': tick}
+    elif code == TYPE_AFTERTOUCH:
+        dic = {'type': 'aftertouch', 'channel': chan, 'value': data1, 'time': tick}
+    else:
+        dic = None
+    if dic is not None:
+        msg = _new_message(mido.Message)
+        vars(msg).update(dic)
+        return msg
+
+    # copy the meta message, to not modify the stored one
+    return meta_lst[data1].copy(time=tick)
+
+#-----------------------------------------
+
+def row2bytes(row):
+    """
+    returns the raw midi bytes of a channel message row
+    """
+
+    (_, code, chan, data1, data2, _) = row
+    status = _type_status[code] | chan
+    if code == TYPE_PITCHWHEEL:
+        data1 += 8192
+        return bytes((status, data1 & 0x7f, data1 >> 7))
+    if code == TYPE_PROGRAM_CHANGE or code == TYPE_AFTERTOUCH:
+        return bytes((status, data1))
+
+    return bytes((status, data1, data2))
+
+#-----------------------------------------
+
+class MidiEventStore(object):
+    """
+    Columnar event storage
+    Contains a structured array sorted by tick, and a list for meta messages
+    """
+    def __init__(self, data=None, meta_lst=None):
+        if data is None:
+            data = np.zeros(0, dtype=ev_dtype)
+        self.data = data
+        self.meta_lst = meta_lst if meta_lst is not None else []
+
+    #-----------------------------------------
+
+    def __len__(self):
+        return len(self.data)
+
+    #-----------------------------------------
+
+    @staticmethod
+    def from_events(ev_lst):
+        """
+        create a store from a MidiEvent list
+        from MidiEventStore object
+        """
+
+        meta_lst = []
+        rows = [msg2row(ev.msg, ev.msg.time, ev.tracknum, meta_lst) for ev in ev_lst]
+        data = np.array(rows, dtype=ev_dtype)
+
+        return MidiEventStore(data, meta_lst)
+
+    #-----------------------------------------
+
+    @staticmethod
+    def concat(store_lst):
+        """
+        concatenate stores, and shift the meta index of each store
+        Note: the result is not sorted
+        from MidiEventStore object
+        """
+
+        data_lst = []
+        meta_lst = []
+        for store in store_lst:
+            data = store.data.copy()
+            if meta_lst:
+                mask = data['type'] == TYPE_META
+                data['data1'][mask] += len(meta_lst)
+            data_lst.append(data)
+            meta_lst.extend(store.meta_lst)
+        if not data_lst:
+            return MidiEventStore()
+
+        return MidiEventStore(np.concatenate(data_lst), meta_lst)
+
+    #-----------------------------------------
+
+    def copy(self):
+        """
+        returns a copy of the store
+        from MidiEventStore object
+        """
+
+        return MidiEventStore(self.data.copy(), self.meta_lst[:])
+
+    #-----------------------------------------
+
+    def get_ticks(self):
+        """
+        returns tick column
+        from MidiEventStore object
+        """
+
+        return self.data['tick']
+
+    #-----------------------------------------
+
+    def get_tick(self, index):
+        """
+        returns tick at index
+        from MidiEventStore object
+        """
+
+        return int(self.data['tick'][index])
+
+    #-----------------------------------------
+
+    def get_msg(self, index):
+        """
+        returns a new mido message at index
+        from MidiEventStore object
+        """
+
+        return row2msg(self.data[index], self.meta_lst)
+
+    #-----------------------------------------
+
+    def get_meta(self, index):
+        """
+        returns the stored meta message at index, or None
+        from MidiEventStore object
+        """
+
+        row = self.data[index]
+        if row['type'] != TYPE_META: return
+
+        return self.meta_lst[row['data1']]
+
+    #-----------------------------------------
+
+    def search_type(self, type, start=0):
+        """
+        returns index of the first event with message type, from start index, or -1
+        from MidiEventStore object
+        """
+
+        code = _type_codes.get(type, TYPE_META)
+        data = self.data
+        for i in np.flatnonzero(data['type'][start:] == code):
+            i = int(i) + start
+            if code != TYPE_META or self.meta_lst[data['data1'][i]].type == type:
+                return i
+
+        return -1
+
+    #-----------------------------------------
+
+    def get_group_starts(self):
+        """
+        returns array of first index for each unique tick
+        from MidiEventStore object
+        """
+
+        ticks = self.data['tick']
+        if not len(ticks): return np.zeros(0, dtype=np.int64)
+        mask = np.empty(len(ticks), dtype=bool)
+        mask[0] = True
+        np.not_equal(ticks[1:], ticks[:-1], out=mask[1:])
+
+        return np.flatnonzero(mask)
+
+    #-----------------------------------------
+
+    def nbytes(self):
+        """
+        returns the size in bytes of the data array
+        from MidiEventStore object
+        """
+
+        return self.data.nbytes
+
+    #-----------------------------------------
+
+#========================================
+
+class MidiEventView(object):
+    """
+    Lazy read only view on a MidiEventStore, returning MidiEvent objects
+    Mutating methods unpack the owner track before delegating to its list
+    """
+    def __init__(self, track, store, make_ev):
+        self._track = track
+        self._store = store
+        self._make_ev = make_ev
+        self._lst = None # list after unpacking
+
+    #-----------------------------------------
+
+    def _get_ev(self, index):
+        store = self._store
+        row = store.data[index]
+        return self._make_ev(msg=row2msg(row, store.meta_lst), tracknum=int(row['tracknum']))
+
+    #-----------------------------------------
+
+    def _unpack(self):
+        if self._lst is None:
+            self._lst = self._track.unpack()
+        return self._lst
+
+    #-----------------------------------------
+
+    def __len__(self):
+        if self._lst is not None: return len(self._lst)
+        return len(self._store)
+
+    #-----------------------------------------
+
+    def __bool__(self):
+        return len(self) >0
+
+    #-----------------------------------------
+
+    def __getitem__(self, index):
+        if self._lst is not None: return self._lst[index]
+        if isinstance(index, slice):
+            return [self._get_ev(i) for i in range(*index.indices(len(self._store)))]
+        if index < 0: index += len(self._store)
+        if index < 0 or index >= len(self._store):
+            raise IndexError("event index out of range")
+
+        return self._get_ev(index)
+
+    #-----------------------------------------
+
+    def __iter__(self):
+        if self._lst is not None: return iter(self._lst)
+        return (self._get_ev(i) for i in range(len(self._store)))
+
+    #-----------------------------------------
+
+    def __setitem__(self, index, val):
+        self._unpack()[index] = val
+
+    #-----------------------------------------
+
+    def __delitem__(self, index):
+        del self._unpack()[index]
+
+    #-----------------------------------------
+
+    def append(self, ev):
+        self._unpack().append(ev)
+
+    #-----------------------------------------
+
+    def extend(self, ev_lst):
+        self._unpack().extend(ev_lst)
+
+    #-----------------------------------------
+
+    def insert(self, index, ev):
+        self._unpack().insert(index, ev)
+
+    #-----------------------------------------
+
+    def sort(self, *args, **kwargs):
+        self._unpack().sort(*args, **kwargs)
+
+    #-----------------------------------------
+
+#========================================
+
+if __name__ == "__main__":
+    store = MidiEventStore()
+    input("It's OK")
+#-----------------------------------------
@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+"""
+    File: miditiming.py:
+    Module for timing instrumentation, recording intended and actual send time of midi events
+    Date: Sun, 18/10/2026
+    Author: Coolbrother
+"""
+
+import time
+import numpy as np
+
+class MidiTimingLog(object):
+    """
+    Fixed size ring buffer of timing samples
+    Each sample contains intended and actual send time in seconds, on the perf_counter clock
+    """
+    def __init__(self, size=8192):
+        self.size = size
+        self._intended = np.zeros(size, dtype=np.float64)
+        self._actual = np.zeros(size, dtype=np.float64)
+        self._index =0 # next position to write
+        self.count =0 # total samples since the last reset
+        self.queue_depth =0 # last out queue depth
+        self.queue_max =0
+        self.loop_count =0
+        self.start_time = time.perf_counter()
+
+    #-----------------------------------------
+
+    def reset(self):
+        """
+        clear samples and counters
+        from MidiTimingLog object
+        """
+
+        self._index =0
+        self.count =0
+        self.queue_depth =0
+        self.queue_max =0
+        self.loop_count =0
+        self.start_time = time.perf_counter()
+
+    #-----------------------------------------
+
+    def add(self, intended, actual):
+        """
+        adding a sample, overwriting the oldest one when full
+        from MidiTimingLog object
+        """
+
+        i = self._index
+        self._intended[i] = intended
+        self._actual[i] = actual
+        self._index = (i + 1) % self.size
+        self.count +=1
+
+    #-----------------------------------------
+
+    def set_queue_depth(self, depth):
+        """
+        sets the out queue depth
+        from MidiTimingLog object
+        """
+
+        self.queue_depth = depth
+        if depth > self.queue_max: self.queue_max = depth
+
+    #-----------------------------------------
+
+    def get_samples(self):
+        """
+        returns a tuple of intended and actual time arrays, from the oldest sample
+        from MidiTimingLog object
+        """
+
+        if self.count < self.size:
+            return (self._intended[:self.count].copy(), self._actual[:self.count].copy())
+        i = self._index
+
+        return (np.roll(self._intended, -i), np.roll(self._actual, -i))
+
+    #-----------------------------------------
+
+    def get_stats(self):
+        """
+        returns a dictionnary of rolling lateness statistics in msec,
+        loop rate in iterations per second, and out queue depth
+        from MidiTimingLog object
+        """
+
+        nb = min(self.count, self.size)
+        elapsed = time.perf_counter() - self.start_time
+        stats = {
+                "count": self.count,
+                "p50": 0, "p99": 0, "max": 0, "mean": 0, "last": 0,
+                "loop_rate": self.loop_count / elapsed if elapsed >0 else 0,
+                "queue_depth": self.queue_depth,
+                "queue_max": self.queue_max,
+                }
+        if not nb: return stats
+        late = (self._actual[:nb] - self._intended[:nb]) * 1000
+        (p50, p99) = np.percentile(late, [50, 99])
+        stats["p50"] = float(p50)
+        stats["p99"] = float(p99)
+        stats["max"] = float(late.max())
+        stats["mean"] = float(late.mean())
+        last = (self._index -1) % self.size
+        stats["last"] = float(late[last])
+
+        return stats
+
+    #-----------------------------------------
+
+    def dump(self, filename):
+        """
+        writing raw samples to a csv file, for offline analysis
+        returns the number of samples written
+        from MidiTimingLog object
+        """
+
+        (intended, actual) = self.get_samples()
+        late = (actual - intended) * 1000
+        data = np.column_stack((intended, actual, late))
+        np.savetxt(filename, data, fmt="%.6f", delimiter=",",
+                header="intended,actual,late_ms", comments="")
+
+        return len(data)
+
+    #-----------------------------------------
+
+#========================================
+
+if __name__ == "__main__":
+    timing_log = MidiTimingLog()
+    input("It's OK")
+#-----------------------------------------
@@ -6,9 +6,15 @@
     Date: Mon, 04/07/2022
     Author: Coolbrother
 """
+import os
 import copy
+import pickle
+import tempfile
+import zlib
+import numpy as np
 import midiplayer as midplay
 import midisequence as midseq
+import midistore as mst
 
 def merge_dict(dic1, dic2):
     """
@@ -22,6 +28,73 @@ def merge_dict(dic1, dic2):
 
 #------------------------------------------------------------------------------
 
+def block_nbytes(block):
+    """
+    returns the approximate size in bytes of an event block, 
+    a tuple of rows and meta list
+    """
+
+    return block[0].nbytes + len(block[1]) * _meta_nbytes
+
+#------------------------------------------------------------------------------
+
+def evs2block(ev_lst):
+    """
+    returns an event block from a MidiEvent list,
+    a tuple of rows and copy of meta messages, with meta index local to the block
+    """
+
+    store = mst.MidiEventStore.from_events(ev_lst)
+    store.data['tracknum'] =0
+
+    return (store.data, [msg.copy() for msg in store.meta_lst])
+
+#------------------------------------------------------------------------------
+
+def track2block(track, start, stop):
+    """
+    returns an event block from the events of a track between start and stop index
+    """
+
+    store = track.get_store()
+    if store is None:
+        return evs2block(track.get_list()[start:stop])
+    rows = store.data[start:stop].copy()
+    rows['tracknum'] =0
+    mask = rows['type'] == mst.TYPE_META
+    meta_lst = []
+    if mask.any():
+        meta_lst = [store.meta_lst[i].copy() for i in rows['data1'][mask].tolist()]
+        rows['data1'][mask] = np.arange(len(meta_lst))
+
+    return (rows, meta_lst)
+
+#------------------------------------------------------------------------------
+
+def block2evs(block, tracknum=0):
+    """
+    returns a new MidiEvent list from an event block
+    """
+
+    (rows, meta_lst) = block
+
+    return [midseq.MidiEvent(msg=mst.row2msg(row, meta_lst), tracknum=tracknum)\
+            for row in rows.tolist()]
+
+#------------------------------------------------------------------------------
+
+def block_equal(block1, block2):
+    """
+    returns whether two event blocks contain the same events
+    """
+
+    # meta times are in rows
+    return block1[0].tobytes() == block2[0].tobytes()\
+            and [dict(vars(msg), time=0) for msg in block1[1]]\
+            == [dict(vars(msg), time=0) for msg in block2[1]]
+
+#------------------------------------------------------------------------------
+
 
 
 class Singleton(object):
@@ -38,15 +111,23 @@ class Singleton(object):
 
 class UndoManager(object):
     """ undo manager """
-    def __init__(self):
+    def __init__(self, max_bytes=64 << 20, spilling=1):
         """
         Undo manager object
+        max_bytes: memory budget for the items in memory
+        spilling: whether old items are spilled to compressed files, or evicted
         """
 
         self.items = []
         self.index =0
         self.level =0 # undo level
         self.title = "" # current title
+        self.max_bytes = max_bytes
+        self.spilling = spilling
+        self.spill_dir = "" # temporary directory, created at the first spilling
+        self.spill_num =0 # for spill file names
+        self.evict_count =0
+        self.delta_max =32 # max commands after a snapshot
 
     #-----------------------------------------
 
@@ -56,10 +137,12 @@ class UndoManager(object):
         from UndoManager object
         """
     
+        self.remove_spilled(self.items)
         self.items = []
         self.level =0
         self.index =0
         self.title = ""
+        self.evict_count =0
     
     #-----------------------------------------
 
@@ -73,6 +156,143 @@ class UndoManager(object):
     
     #-----------------------------------------
 
+    def get_mem_size(self):
+        """
+        returns the size in bytes of the items in memory,
+        blocks shared by several items are counted once
+        from UndoManager object
+        """
+
+        total =0
+        id_set = set()
+        for (_, item) in self.items:
+            if item.is_spilled(): continue
+            for block in item.get_blocks():
+                if id(block) in id_set: continue
+                id_set.add(id(block))
+                total += block_nbytes(block)
+
+        return total
+
+    #-----------------------------------------
+
+    def get_mem_info(self):
+        """
+        returns a dictionnary of memory use
+        from UndoManager object
+        """
+
+        spilled_lst = [item for (_, item) in self.items if item.is_spilled()]
+
+        return {
+                "count": len(self.items),
+                "mem_bytes": self.get_mem_size(),
+                "max_bytes": self.max_bytes,
+                "spilled": len(spilled_lst),
+                "disk_bytes": sum(item.spill_size for item in spilled_lst),
+                "evicted": self.evict_count,
+                }
+
+    #-----------------------------------------
+
+    def check_budget(self, keep=None):
+        """
+        spill or evict the oldest items until the memory size is under the budget,
+        the current item and keep item are always kept in memory
+        only snapshots are spilled, commands are small
+        returns the number of spilled or evicted items
+        from UndoManager object
+        """
+
+        count =0
+        while self.get_mem_size() > self.max_bytes:
+            if self.spilling:
+                lst = [item for (i, (_, item)) in enumerate(self.items)\
+                        if i != self.index and item is not keep\
+                        and isinstance(item, MidiSnapshot) and not item.is_spilled()]
+                if not lst or not self.spill_item(lst[0]): break
+            else:
+                # only older items can be evicted,
+                # and the first item must be a snapshot, to restore the next commands
+                if self.index == 0: break
+                del self.items[0]
+                self.index -=1
+                self.level -=1
+                self.evict_count +=1
+                while self.index > 0 and not isinstance(self.items[0][1], MidiSnapshot):
+                    del self.items[0]
+                    self.index -=1
+                    self.level -=1
+                    self.evict_count +=1
+            count +=1
+
+        return count
+
+    #-----------------------------------------
+
+    def spill_item(self, item):
+        """
+        write the item events to a compressed file
+        returns True whether spilled
+        from UndoManager object
+        """
+
+        try:
+            if not self.spill_dir:
+                self.spill_dir = tempfile.mkdtemp(prefix="zikdrum_undo_")
+            self.spill_num +=1
+            item.spill(os.path.join(self.spill_dir, f"undo_{self.spill_num}.z"))
+        except OSError:
+            # keeping it in memory
+            self.spilling =0
+            return False
+
+        return True
+
+    #-----------------------------------------
+
+    def remove_spilled(self, items):
+        """
+        remove the spill files of items
+        from UndoManager object
+        """
+
+        for (_, item) in items:
+            if item.is_spilled():
+                try:
+                    os.remove(item.spill_filename)
+                except OSError:
+                    pass
+
+    #-----------------------------------------
+
+    def load_item(self, item):
+        """
+        reload the item whether it is spilled
+        from UndoManager object
+        """
+
+        if item is not None and item.is_spilled():
+            item.unspill()
+            self.check_budget(keep=item)
+
+    #-----------------------------------------
+
+    def get_delta_count(self):
+        """
+        returns the number of commands after the last snapshot, until the current item
+        from UndoManager object
+        """
+
+        count =0
+        for (_, item) in reversed(self.items[:self.index+1]):
+            if isinstance(item, MidiSnapshot): break
+            count +=1
+
+        return count
+
+    #-----------------------------------------
+
     def set_prev(self):
         """
         set previous item in the list
@@ -121,6 +341,7 @@ class UndoManager(object):
         
         count = self.get_count()
         if self.index < count -1:
+            self.remove_spilled(self.items[self.index+1:])
             self.items = self.items[:self.index+1]
             # debug("voici len list: %d" %(len(lst)))
         
@@ -128,6 +349,7 @@ class UndoManager(object):
         self.index = self.get_count() -1
         self.level = self.get_count() # length of the object list
         self.title = title
+        self.check_budget()
         # debug("voici undo_count: %d, index: %d" %(self.level, self.index))
 
     #-----------------------------------------
@@ -147,6 +369,7 @@ class UndoManager(object):
             if player:
                 self.level -=1
                 self.title = title
+                self.load_item(player)
         # debug("voici undo_count: %d, index: %d" %(self._level, self.item_index))
 
         return (title, player)
@@ -168,6 +391,7 @@ class UndoManager(object):
             if player:
                 self.level += 1
                 self.title = title
+                self.load_item(player)
         # debug("voici undo_count: %d, index: %d" %(self._level, self.item_index))
 
         return (title, player)
@@ -176,6 +400,650 @@ class UndoManager(object):
 
 #========================================
 
+_meta_nbytes = 256 # approximate size of a meta message object
+
+# track attributes holding events and indexes, not saved in undo snapshot attributes
+_track_data_attrs = set([
+        'ev_lst', '_store', '_tick_lst', '_tick_src', '_tick_sorted',
+        '_note_index', '_note_on_dic', '_note_src', '_note_count',
+        'group_lst', 'group_time_lst', '_undo_blocks', '_undo_dirty',
+        ])
+
+class MidiEventBlocks(object):
+    """
+    Frozen events of a track for undo, in rows split in blocks by tick range
+    Unchanged blocks are shared with the previous snapshot of the same track,
+    so a snapshot only copies the touched tick ranges
+    """
+    def __init__(self, keys=None, blocks=None, block_ticks=0):
+        self.keys = keys if keys is not None else [] # block number by tick range
+        self.blocks = blocks if blocks is not None else [] # tuples of rows and meta list
+        self.block_ticks = block_ticks
+
+    #-------------------------------------------
+
+    def __len__(self):
+        return sum(len(rows) for (rows, _) in self.blocks)
+
+    #-------------------------------------------
+
+    @staticmethod
+    def from_track(track, prev=None, block_ticks=7680, dirty=(0, -1)):
+        """
+        returns frozen events of a track, sharing unchanged blocks with prev blocks,
+        or prev itself when nothing has changed
+        dirty: tuple of start and end tick modified since prev, end -1 for the end of the track,
+        or None whether unchanged, only the blocks of this range are rebuilt
+        from MidiEventBlocks object
+        """
+
+        if prev is not None and prev.block_ticks != block_ticks: prev = None
+        if prev is not None and dirty is None: return prev
+        # keys range to rebuild, -1 for the last key
+        (start_key, end_key) = (0, -1)
+        partial = prev is not None and (not prev.keys or prev.keys[0] != -1) and track.is_sorted()
+        if partial:
+            (start_tick, end_tick) = dirty
+            start_key = start_tick // block_ticks
+            if end_tick != -1: end_key = end_tick // block_ticks
+        if end_key == -1:
+            (start, stop) = track.search_range(start_key * block_ticks)
+        else:
+            (start, stop) = track.search_range(start_key * block_ticks, (end_key +1) * block_ticks -1)
+
+        store = track.get_store()
+        if store is None:
+            store = mst.MidiEventStore.from_events(track.get_list()[start:stop])
+            data = store.data
+        else:
+            # working copy
+            data = store.data[start:stop].copy()
+        # tracknum is set at restoring
+        data['tracknum'] =0
+        ticks = data['tick']
+        count = len(data)
+        if not count:
+            (keys, bounds) = ([], [0])
+        elif np.all(ticks[1:] >= ticks[:-1]):
+            key_arr = ticks // block_ticks
+            bounds = [0] + (np.flatnonzero(np.diff(key_arr)) +1).tolist() + [count]
+            keys = key_arr[bounds[:-1]].tolist()
+        else:
+            # unsorted events, in one block
+            (keys, bounds) = ([-1], [0, count])
+
+        prev_dic = dict(zip(prev.keys, prev.blocks)) if prev is not None else {}
+        meta_lst = store.meta_lst
+        blocks = []
+        shared =0
+        for (i, key) in enumerate(keys):
+            rows = data[bounds[i]:bounds[i+1]]
+            mask = rows['type'] == mst.TYPE_META
+            block_meta = []
+            if mask.any():
+                # meta index local to the block
+                block_meta = [meta_lst[j] for j in rows['data1'][mask].tolist()]
+                rows['data1'][mask] = np.arange(len(block_meta))
+            block = prev_dic.get(key)
+            if block is not None and block[0].tobytes() == rows.tobytes()\
+                    and [vars(msg) for msg in block[1]] == [vars(msg) for msg in block_meta]:
+                shared +=1
+            else:
+                block = (rows.copy(), [msg.copy() for msg in block_meta])
+            blocks.append(block)
+        if partial:
+            # blocks out of the range are unchanged
+            head_lst = [item for item in zip(prev.keys, prev.blocks) if item[0] < start_key]
+            tail_lst = [item for item in zip(prev.keys, prev.blocks) if end_key != -1 and item[0] > end_key]
+            if shared == len(keys) == len(prev.keys) - len(head_lst) - len(tail_lst):
+                return prev
+            keys = [key for (key, _) in head_lst] + keys + [key for (key, _) in tail_lst]
+            blocks = [block for (_, block) in head_lst] + blocks + [block for (_, block) in tail_lst]
+        elif prev is not None and shared == len(keys) == len(prev.keys):
+            return prev
+
+        return MidiEventBlocks(keys, blocks, block_ticks)
+
+    #-------------------------------------------
+
+    def to_store(self):
+        """
+        returns a new MidiEventStore with a copy of the events
+        from MidiEventBlocks object
+        """
+
+        data_lst = []
+        meta_lst = []
+        for (rows, block_meta) in self.blocks:
+            rows = rows.copy()
+            if block_meta:
+                mask = rows['type'] == mst.TYPE_META
+                rows['data1'][mask] += len(meta_lst)
+                meta_lst.extend(msg.copy() for msg in block_meta)
+            data_lst.append(rows)
+        if not data_lst:
+            return mst.MidiEventStore()
+
+        return mst.MidiEventStore(np.concatenate(data_lst), meta_lst)
+
+    #-------------------------------------------
+
+    def nbytes(self):
+        """
+        returns the approximate size in bytes
+        from MidiEventBlocks object
+        """
+
+        return sum(block_nbytes(block) for block in self.blocks)
+
+    #-------------------------------------------
+
+#========================================
+
+class MidiSnapshot(object):
+    """
+    Undo snapshot of a sequence
+    Contains sequence attributes, and for each track, its attributes and frozen events
+    """
+    def __init__(self, seq_attrs, base, track_lst):
+        self.seq_attrs = seq_attrs
+        self.base = base
+        self.track_lst = track_lst # list of tuple track attributes and MidiEventBlocks object
+        self.spill_filename = "" # compressed file containing the events when spilled
+        self.spill_size =0
+
+    #-------------------------------------------
+
+    def is_spilled(self):
+        """
+        returns whether the events are in a spill file
+        from MidiSnapshot object
+        """
+
+        return self.spill_filename != ""
+
+    #-------------------------------------------
+
+    def get_blocks(self):
+        """
+        returns a list of event blocks of all tracks
+        from MidiSnapshot object
+        """
+
+        lst = []
+        for (_, blocks) in self.track_lst:
+            if blocks is not None: lst.extend(blocks.blocks)
+
+        return lst
+
+    #-------------------------------------------
+
+    def spill(self, filename):
+        """
+        write the events to a compressed file, and release them
+        from MidiSnapshot object
+        """
+
+        blocks_lst = [blocks for (_, blocks) in self.track_lst]
+        data = zlib.compress(pickle.dumps(blocks_lst, pickle.HIGHEST_PROTOCOL), 1)
+        with open(filename, 'wb') as outfile:
+            outfile.write(data)
+        self.track_lst = [(attrs, None) for (attrs, _) in self.track_lst]
+        self.spill_filename = filename
+        self.spill_size = len(data)
+
+    #-------------------------------------------
+
+    def unspill(self):
+        """
+        reload the events from the spill file, and remove it
+        Note: reloaded blocks are no more shared with other snapshots
+        from MidiSnapshot object
+        """
+
+        with open(self.spill_filename, 'rb') as infile:
+            blocks_lst = pickle.loads(zlib.decompress(infile.read()))
+        self.track_lst = [(attrs, blocks) for ((attrs, _), blocks) in zip(self.track_lst, blocks_lst)]
+        try:
+            os.remove(self.spill_filename)
+        except OSError:
+            pass
+        self.spill_filename = ""
+        self.spill_size =0
+
+    #-------------------------------------------
+
+#========================================
+
+class MidiReplaceOp(object):
+    """
+    Undo operation: a range of events replaced by other events
+    """
+    def __init__(self, tracknum, start, old_block, new_block):
+        self.tracknum = tracknum
+        self.start = start
+        self.old_block = old_block
+        self.new_block = new_block
+
+    #-------------------------------------------
+
+    def apply(self, seq, cur_block, block):
+        """
+        replace the events of cur_block by the events of block
+        returns a tuple of first and last modified ticks
+        from MidiReplaceOp object
+        """
+
+        track = seq.track_lst[self.tracknum]
+        stop = self.start + len(cur_block[0])
+        # the track must be in the state left by the operation
+        if not block_equal(track2block(track, self.start, stop), cur_block):
+            raise ValueError("track events changed since the operation")
+        track.replace_evs(self.start, stop, block2evs(block, self.tracknum))
+        tick_lst = [rows['tick'] for (rows, _) in (cur_block, block) if len(rows)]
+        if not tick_lst: return (0, 0)
+
+        return (min(int(ticks.min()) for ticks in tick_lst), max(int(ticks.max()) for ticks in tick_lst))
+
+    #-------------------------------------------
+
+    def undo(self, seq):
+        return self.apply(seq, self.new_block, self.old_block)
+
+    #-------------------------------------------
+
+    def redo(self, seq):
+        return self.apply(seq, self.old_block, self.new_block)
+
+    #-------------------------------------------
+
+#========================================
+
+class MidiShiftOp(object):
+    """
+    Undo operation: events shifted in time from an index to the end of the track
+    """
+    def __init__(self, tracknum, start, step):
+        self.tracknum = tracknum
+        self.start = start
+        self.step = step
+
+    #-------------------------------------------
+
+    def apply(self, seq, step):
+        """
+        shift the events
+        returns a tuple of first and last modified ticks, -1 for the end of the track
+        from MidiShiftOp object
+        """
+
+        track = seq.track_lst[self.tracknum]
+        ev_lst = track.unpack()
+        for ev in ev_lst[self.start:]:
+            ev.msg.time += step
+        track.invalidate_ticks()
+        if self.start >= len(ev_lst): return (0, 0)
+        tick = ev_lst[self.start].msg.time
+
+        return (min(tick, tick - step), -1)
+
+    #-------------------------------------------
+
+    def undo(self, seq):
+        return self.apply(seq, -self.step)
+
+    #-------------------------------------------
+
+    def redo(self, seq):
+        return self.apply(seq, self.step)
+
+    #-------------------------------------------
+
+#========================================
+
+class MidiTimeOp(object):
+    """
+    Undo operation: time of one event changed
+    """
+    def __init__(self, tracknum, index, old_time, new_time):
+        self.tracknum = tracknum
+        self.index = index
+        self.old_time = old_time
+        self.new_time = new_time
+
+    #-------------------------------------------
+
+    def apply(self, seq, val):
+        """
+        sets the event time
+        returns a tuple of first and last modified ticks
+        from MidiTimeOp object
+        """
+
+        track = seq.track_lst[self.tracknum]
+        track.unpack()[self.index].msg.time = val
+        track.invalidate_ticks()
+
+        return (min(self.old_time, self.new_time), max(self.old_time, self.new_time))
+
+    #-------------------------------------------
+
+    def undo(self, seq):
+        return self.apply(seq, self.old_time)
+
+    #-------------------------------------------
+
+    def redo(self, seq):
+        return self.apply(seq, self.new_time)
+
+    #-------------------------------------------
+
+#========================================
+
+class MidiChannelOp(object):
+    """
+    Undo operation: channel of all events changed on a track
+    """
+    def __init__(self, tracknum, old_chans, old_track_chan, new_chan):
+        self.tracknum = tracknum
+        self.old_chans = old_chans # channel array by event, -1 for meta events
+        self.old_track_chan = old_track_chan
+        self.new_chan = new_chan
+
+    #-------------------------------------------
+
+    def apply(self, seq, chans, track_chan):
+        """
+        sets the channel of events, from an array or a value
+        returns a tuple of first and last modified ticks, -1 for the end of the track
+        from MidiChannelOp object
+        """
+
+        track = seq.track_lst[self.tracknum]
+        store = track.get_store()
+        if store is not None:
+            data = store.data
+            mask = data['type'] != mst.TYPE_META
+            if isinstance(chans, np.ndarray): chans = chans[mask]
+            data['channel'][mask] = chans
+        else:
+            is_array = isinstance(chans, np.ndarray)
+            for (i, ev) in enumerate(track.get_list()):
+                if ev.msg.is_meta or ev.msg.type == 'sysex': continue
+                ev.msg.channel = int(chans[i]) if is_array else chans
+        track.channel_num = track_chan
+        seq._render.invalidate()
+
+        return (0, -1)
+
+    #-------------------------------------------
+
+    def undo(self, seq):
+        return self.apply(seq, self.old_chans, self.old_track_chan)
+
+    #-------------------------------------------
+
+    def redo(self, seq):
+        return self.apply(seq, self.new_chan, self.new_chan)
+
+    #-------------------------------------------
+
+#========================================
+
+class MidiUndoCommand(object):
+    """
+    Undo item containing the operations of an editing action,
+    undo replays the inverse operations in reverse order
+    """
+    def __init__(self, op_lst):
+        self.op_lst = op_lst
+
+    #-------------------------------------------
+
+    def is_spilled(self):
+        return False
+
+    #-------------------------------------------
+
+    def get_blocks(self):
+        """
+        returns the event blocks of the operations
+        from MidiUndoCommand object
+        """
+
+        lst = []
+        for op in self.op_lst:
+            if isinstance(op, MidiReplaceOp):
+                lst.extend((op.old_block, op.new_block))
+
+        return lst
+
+    #-------------------------------------------
+
+    def replay(self, seq, op_lst, undoing):
+        """
+        replay operations, and update the timeline on the modified ranges only
+        from MidiUndoCommand object
+        """
+
+        # the timeline shares events with the tracks, 
+        # so its tick index must be built before changing times in place
+        if seq._timeline is not None: seq._timeline.get_ticks()
+        for op in op_lst:
+            (start_tick, end_tick) = op.undo(seq) if undoing else op.redo(seq)
+            seq.touch_track(op.tracknum, start_tick, end_tick)
+        seq.update_length()
+        seq.update_timeline()
+
+    #-------------------------------------------
+
+    def undo(self, seq):
+        self.replay(seq, reversed(self.op_lst), 1)
+
+    #-------------------------------------------
+
+    def redo(self, seq):
+        self.replay(seq, self.op_lst, 0)
+
+    #-------------------------------------------
+
+#========================================
+
+class MidiUndoRecorder(object):
+    """
+    Records undo operations of editing actions on the tracks of the current sequence,
+    tracks out of the sequence, like clipboard tracks, are ignored
+    """
+    def __init__(self):
+        self.seq = None
+        self.op_lst = []
+        self.recording =1
+        self.track_count =0 # commands are not valid after adding or deleting tracks
+
+    #-------------------------------------------
+
+    def set_sequence(self, seq):
+        """
+        sets the recorded sequence
+        from MidiUndoRecorder object
+        """
+
+        self.seq = seq
+        self.clear()
+
+    #-------------------------------------------
+
+    def clear(self):
+        """
+        clear recorded operations
+        from MidiUndoRecorder object
+        """
+
+        self.op_lst = []
+        self.recording =1
+        if self.seq is not None: self.track_count = len(self.seq.track_lst)
+
+    #-------------------------------------------
+
+    def pop_command(self):
+        """
+        returns a command with the recorded operations, 
+        or None whether there is no operation, or the track list has changed
+        from MidiUndoRecorder object
+        """
+
+        cmd = None
+        if self.op_lst and self.seq is not None\
+                and len(self.seq.track_lst) == self.track_count:
+            cmd = MidiUndoCommand(self.op_lst)
+        self.clear()
+
+        return cmd
+
+    #-------------------------------------------
+
+    def get_tracknum(self, track):
+        """
+        returns the track number in the sequence, or -1 whether not recording it
+        from MidiUndoRecorder object
+        """
+
+        if not self.recording or self.seq is None: return -1
+        for (i, trk) in enumerate(self.seq.track_lst):
+            if trk is track: return i
+
+        return -1
+
+    #-------------------------------------------
+
+    def touch_range(self, track, start, stop, new_evs):
+        """
+        marks as modified the tick range of events between start and stop index, and of new_evs
+        from MidiUndoRecorder object
+        """
+
+        if not track.is_sorted():
+            track.touch()
+            return
+        tick_lst = [ev.msg.time for ev in new_evs]
+        if start < stop:
+            tick_lst.extend((track.get_time(start), track.get_time(stop -1)))
+        if tick_lst: track.touch(min(tick_lst), max(tick_lst))
+
+    #-------------------------------------------
+
+    def record_replace(self, track, start, stop, new_evs):
+        """
+        record events between start and stop index, before replacing them by new_evs
+        from MidiUndoRecorder object
+        """
+
+        self.touch_range(track, start, stop, new_evs)
+        tracknum = self.get_tracknum(track)
+        if tracknum == -1: return
+        old_block = track2block(track, start, stop)
+        new_block = evs2block(new_evs)
+        if len(old_block[0]) or len(new_block[0]):
+            self.op_lst.append(MidiReplaceOp(tracknum, start, old_block, new_block))
+
+    #-------------------------------------------
+
+    def record_shift(self, track, start, step):
+        """
+        record a time shift from start index to the end of the track
+        from MidiUndoRecorder object
+        """
+
+        if step and start < len(track.get_list()):
+            track.touch(max(track.get_time(start) - abs(step), 0))
+        tracknum = self.get_tracknum(track)
+        if tracknum == -1 or not step: return
+        self.op_lst.append(MidiShiftOp(tracknum, start, step))
+
+    #-------------------------------------------
+
+    def record_time(self, track, index, old_time, new_time):
+        """
+        record a time change of one event
+        from MidiUndoRecorder object
+        """
+
+        track.touch(old_time, new_time)
+        tracknum = self.get_tracknum(track)
+        if tracknum == -1 or old_time == new_time: return
+        self.op_lst.append(MidiTimeOp(tracknum, index, old_time, new_time))
+
+    #-------------------------------------------
+
+    def record_channel(self, track, chan):
+        """
+        record channels of all events, before changing them
+        from MidiUndoRecorder object
+        """
+
+        track.touch()
+        tracknum = self.get_tracknum(track)
+        if tracknum == -1: return
+        store = track.get_store()
+        if store is not None:
+            data = store.data
+            chans = np.where(data['type'] != mst.TYPE_META, data['channel'].astype(np.int16), -1)
+        else:
+            chans = np.array([getattr(ev.msg, 'channel', -1) for ev in track.get_list()], dtype=np.int16)
+        self.op_lst.append(MidiChannelOp(tracknum, chans, track.channel_num, chan))
+
+    #-------------------------------------------
+
+    def begin_window(self, track, start_tick, end_tick):
+        """
+        returns the state of events between start_tick and end_tick included, 
+        before an edition which modifies only this tick range
+        from MidiUndoRecorder object
+        """
+
+        # unsorted events can move anywhere after sorting
+        if not track.is_sorted(): (start_tick, end_tick) = (0, -1)
+        track.touch(start_tick, end_tick)
+        tracknum = self.get_tracknum(track)
+        if tracknum == -1: return None
+        (start, stop) = track.search_range(start_tick, end_tick)
+        # the edition is recorded as a whole
+        self.recording =0
+
+        return (tracknum, start_tick, end_tick, start, track2block(track, start, stop))
+
+    #-------------------------------------------
+
+    def end_window(self, track, window):
+        """
+        record the events of the tick range which have changed, after the edition
+        from MidiUndoRecorder object
+        """
+
+        if window is None: return
+        self.recording =1
+        (tracknum, start_tick, end_tick, start, old_block) = window
+        (new_start, stop) = track.search_range(start_tick, end_tick)
+        # events before the range are not modified, so new_start is start
+        new_block = track2block(track, start, stop)
+        if block_equal(old_block, new_block): return
+        self.op_lst.append(MidiReplaceOp(tracknum, start, old_block, new_block))
+
+    #-------------------------------------------
+
+#========================================
+
+_recorder = MidiUndoRecorder()
+
+def get_recorder():
+    """
+    returns the undo recorder instance
+    """
+
+    return _recorder
+
+#------------------------------------------------------------------------------
+
 class MidiTools(Singleton):
     """ Tools midi manager """
     def __init__(self):
@@ -221,6 +1089,11 @@ class MidiTools(Singleton):
             trk.__dict__ = merge_dict(trk.__dict__, track.__dict__)
             # init track parts
             trk.ev_lst = []
+            if track.is_packed():
+                # the store is copied, without creating event objects
+                trk.set_store(track.get_store().copy())
+                new_tracks.append(trk)
+                continue
             ev_lst = track.ev_lst
             new_evs = self.duplicate_evs_obj(ev_lst)
             if new_evs:
@@ -271,6 +1144,125 @@ class MidiTools(Singleton):
 
     #-----------------------------------------
 
+    def make_snapshot(self, seq):
+        """
+        returns an undo snapshot of the sequence,
+        sharing unchanged tracks and blocks with the previous snapshot
+        from MidiTools object
+        """
+
+        if seq is None: return None
+        block_ticks = max(seq.base.bar, 1) * 4
+        track_lst = []
+        for track in seq.track_lst:
+            # only the blocks modified since the last snapshot are rebuilt
+            blocks = MidiEventBlocks.from_track(track, track._undo_blocks, block_ticks, track._undo_dirty)
+            track._undo_blocks = blocks
+            track._undo_dirty = None
+            attrs = dict((key, val) for (key, val) in vars(track).items()\
+                    if key not in _track_data_attrs)
+            track_lst.append((attrs, blocks))
+        seq_attrs = dict(vars(seq))
+        # the storage mode is not part of the undo history
+        for key in ('track_lst', 'base', 'columnar'):
+            del seq_attrs[key]
+
+        return MidiSnapshot(seq_attrs, copy.deepcopy(seq.base), track_lst)
+
+    #-----------------------------------------
+
+    def restore_snapshot(self, seq, snap):
+        """
+        restore the sequence from an undo snapshot,
+        keeping the live tracks whose events are unchanged
+        returns the number of rebuilt tracks
+        from MidiTools object
+        """
+
+        if seq is None or snap is None: return 0
+        # live tracks by their frozen events, unchanged tracks share them with the snapshot
+        live_dic = {}
+        block_ticks = max(seq.base.bar, 1) * 4
+        for track in seq.track_lst:
+            blocks = MidiEventBlocks.from_track(track, track._undo_blocks, block_ticks, track._undo_dirty)
+            track._undo_blocks = blocks
+            track._undo_dirty = None
+            live_dic.setdefault(id(blocks), []).append(track)
+
+        count =0
+        track_lst = []
+        for (attrs, blocks) in snap.track_lst:
+            lst = live_dic.get(id(blocks))
+            if lst:
+                track = lst.pop(0)
+                track.__dict__.update(attrs)
+            else:
+                track = midseq.MidiTrack()
+                track.__dict__.update(attrs)
+                track.set_store(blocks.to_store())
+                if not seq.columnar: track.unpack()
+                track._undo_blocks = blocks
+                track._undo_dirty = None
+                track.gen_group_pos()
+                count +=1
+            track_lst.append(track)
+
+        seq.__dict__.update(snap.seq_attrs)
+        seq.base = copy.deepcopy(snap.base)
+        seq.track_lst = track_lst
+        seq.gen_tracknum()
+        seq.gen_tempo_map()
+        seq.gen_timeline()
+
+        return count
+
+    #-----------------------------------------
+
+    def restore_undo(self, seq, undoman, old_index):
+        """
+        restore the sequence at the current undo item, from the old_index item state,
+        commands are replayed, and snapshots are restored
+        returns True whether restored
+        from MidiTools object
+        """
+
+        index = undoman.index
+        items = undoman.items
+        if seq is None or index == old_index: return False
+        if index > old_index:
+            item = items[index][1]
+        else:
+            item = items[old_index][1]
+        try:
+            if isinstance(item, MidiUndoCommand):
+                if index > old_index: item.redo(seq)
+                else: item.undo(seq)
+                return True
+            elif index > old_index:
+                self.restore_snapshot(seq, item)
+                return True
+        except ValueError:
+            # track changed outside the commands, restoring from a snapshot
+            pass
+
+        # the last snapshot, then replaying the next commands
+        start = index
+        while start >= 0 and not isinstance(items[start][1], MidiSnapshot):
+            start -=1
+        if start < 0: return False
+        snap = items[start][1]
+        undoman.load_item(snap)
+        self.restore_snapshot(seq, snap)
+        try:
+            for (_, cmd) in items[start+1:index+1]:
+                cmd.redo(seq)
+        except ValueError:
+            return False
+
+        return True
+
+    #-----------------------------------------
+
     def get_track_range(self, track, start_pos, end_pos):
         """
         return track range index event between start_pos and end_pos
@@ -364,16 +1356,25 @@ class MidiTools(Singleton):
         """
 
         res =0
+        recorder = get_recorder()
+        type1 = "end_of_track"
+        type2 = "marker"
         for track in track_lst:
-            ev_lst = track.get_list()
+            store = track.get_store()
+            if store is not None:
+                # columnar mode: unpacking the track only whether there is something to clean
+                last = len(store) -1
+                if last == -1 or (store.search_type(type1) == last\
+                        and store.search_type(type2) == -1):
+                    continue
+            ev_lst = track.unpack()
             if ev_lst:
                 last_ev = ev_lst[-1]
-                type1 = "end_of_track"
-                type2 = "marker"
                 msg = last_ev.msg
                 if msg.type != type1:
-                    new_ev = midplay.MidiEvent(type=type1, cat=1)
+                    new_ev = midseq.MidiEvent(type=type1, cat=1)
                     new_ev.msg.time = msg.time
+                    recorder.record_replace(track, len(ev_lst), len(ev_lst), [new_ev])
                     ev_lst.append(new_ev)
                     last_ev = new_ev
                     res =1
@@ -383,10 +1384,12 @@ class MidiTools(Singleton):
                     msg = ev.msg
                     if (msg.type == type1 and i < len(ev_lst) -1) or\
                     (msg.type == type2 and i<len(ev_lst)):
+                        recorder.record_replace(track, i, i+1, [])
                         del ev_lst[i]
                         res =1
                         i -=1
                     i +=1
+                if res: track.invalidate_ticks()
 
         return res
 
@@ -415,12 +1418,14 @@ class MidiTools(Singleton):
                     time_dur = max_len - track_len
                     # debug("voici time_dur: %d" % time_dur)
                     # changing the time of EndOfTrack event
-                    ev_lst = track.get_list()
+                    ev_lst = track.unpack()
                     if ev_lst:
                         last_ev = ev_lst[-1]
                         msg = last_ev.msg
                         if msg.type == "end_of_track":
+                            get_recorder().record_time(track, len(ev_lst) -1, msg.time, msg.time + time_dur)
                             msg.time += time_dur
+                            track.invalidate_ticks()
                             res =1
         return res
 
@@ -438,12 +1443,14 @@ class MidiTools(Singleton):
         # self.clean_tracks(track_lst)
         for (i, track) in enumerate(track_lst):
             # changing the time of EndOfTrack event
-            ev_lst = track.get_list()
+            ev_lst = track.unpack()
             if len(ev_lst) == 1:
                 ev1 = ev_lst[-1]
                 msg1 = ev1.msg
                 if msg1.type == type1 and msg1.time !=0:
+                    get_recorder().record_time(track, 0, msg1.time, 0)
                     msg1.time =0
+                    track.invalidate_ticks()
                     res =1
             # not necessary
             """
@@ -524,9 +1531,11 @@ class MidiTrackEdit(object):
         """
 
         if track:
-            ev_lst = track.get_list()
+            get_recorder().record_shift(track, ev_ind, -step)
+            ev_lst = track.unpack()
             for i in range(ev_ind, len(ev_lst)):
                 ev_lst[i].msg.time  -= step
+            track.invalidate_ticks()
         
     #-------------------------------------------
      
@@ -538,9 +1547,11 @@ class MidiTrackEdit(object):
         """
 
         if track:
-            ev_lst = track.get_list()
+            get_recorder().record_shift(track, ev_ind, step)
+            ev_lst = track.unpack()
             for i in range(ev_ind, len(ev_lst)):
                 ev_lst[i].msg.time  += step
+            track.invalidate_ticks()
         
     #-------------------------------------------
     
@@ -552,11 +1563,12 @@ class MidiTrackEdit(object):
         """
 
         if track:
-            ev_lst = track.get_list()
+            ev_lst = track.unpack()
             step = ev_lst[0].msg.time
             if step > 0:
                 for i in range(len(ev_lst)):
                     ev_lst[i].msg.time  -= step
+                track.invalidate_ticks()
     
     #-------------------------------------------
 
@@ -576,6 +1588,20 @@ class MidiTrackEdit(object):
 
     #-------------------------------------------
 
+    def delete_track_events(self, track, start_ind, end_ind):
+        """
+        delete events in track except end_of_track events, recording them for undo
+        from MidiTrackEdit object
+        """
+
+        ev_lst = track.unpack()
+        type = "end_of_track"
+        kept_lst = [ev for ev in ev_lst[start_ind:end_ind] if ev.msg.type == type]
+        get_recorder().record_replace(track, start_ind, end_ind, kept_lst)
+
+        return self.delete_events(ev_lst, start_ind, end_ind)
+
+    #-------------------------------------------
 
     def add_copy_marks(self, track, start_pos, end_pos):
         """
@@ -584,16 +1610,16 @@ class MidiTrackEdit(object):
         """
         
         if track:
-            ev_lst = track.get_list()
+            ev_lst = track.unpack()
             # if ev_lst:
             type = "marker"
             # debug("event tempo not found")
             # start marker
-            ev1 = midplay.MidiEvent(type=type, cat=1)
+            ev1 = midseq.MidiEvent(type=type, cat=1)
             ev1.msg.text = "MARK_ZZZ"
             ev1.msg.time = start_pos
             # end marker
-            ev2 = midplay.MidiEvent(type=type, cat=1)
+            ev2 = midseq.MidiEvent(type=type, cat=1)
             ev2.msg.text = "MARK_ZZZ"
             ev2.msg.time = end_pos
             ev_lst.insert(0, ev1)
@@ -614,7 +1640,7 @@ class MidiTrackEdit(object):
         ev_lst = self.tools.get_evs_range(track, start_pos, end_pos)
         if ev_lst:
             ev_lst = self.tools.duplicate_evs_obj(ev_lst)
-        new_track = MidiTrack()
+        new_track = midseq.MidiTrack()
         if ev_lst:
             new_track.add_evs(*ev_lst)
         # add markers to the copy to keep the right length selection
@@ -639,7 +1665,7 @@ class MidiTrackEdit(object):
         start_ind =-1
         end_ind =-1
         # get_evs_range function returns only exact index at its time, not index for time between. Due to the midi event time
-        ev_lst = track.get_list()
+        ev_lst = track.unpack()
         (start_ind, end_ind) = self.tools.get_track_range(track, start_pos, end_pos)
         # debug("arrange_parts: start_pos: %d, end_pos: %d" %(start_pos, end_pos))
         # debug("arrange_parts: start_ind: %d, end_ind: %d" %(start_ind, end_ind))
@@ -658,7 +1684,7 @@ class MidiTrackEdit(object):
         if start_ind == end_ind:
             # ev = ev_lst[start_ind]
             # delete event except end_of_track event
-            self.delete_events(ev_lst, start_ind, end_ind+1)
+            self.delete_track_events(track, start_ind, end_ind+1)
             # del ev_lst[start_ind]
             ins_ind = start_ind
 
@@ -666,7 +1692,7 @@ class MidiTrackEdit(object):
         elif start_ind != end_ind:
             ins_ind = start_ind
             # delete events except end_of_track event
-            self.delete_events(ev_lst, start_ind, end_ind+1)
+            self.delete_track_events(track, start_ind, end_ind+1)
             
             """
             try:
@@ -696,7 +1722,7 @@ class MidiTrackEdit(object):
         new_evs = None
 
         # track = self.get_track(tracknum)
-        ev_lst = track.get_list()
+        ev_lst = track.unpack()
         if ev_lst:
             # new_evs is events's track modified
             (ins_ind, new_evs) = self.arrange_events(track, start_pos, end_pos)
@@ -755,6 +1781,8 @@ class MidiTrackEdit(object):
             (ins_ind, track) = self.arrange_track(curtrack, start_pos, end_pos)
             if ins_ind == -1:
                 return
+            # the insertion modifies only the pasted range
+            window = get_recorder().begin_window(track, start_pos, end_pos)
             self.shift_evs_to_right(new_evs, 0, ins_pos)
             if adding_mode:
                 # adding events at the end of track
@@ -764,6 +1792,7 @@ class MidiTrackEdit(object):
                 track.insert_evs(ins_pos, new_evs)
             # sorting events by time
             track.sort()
+            get_recorder().end_window(track, window)
 
     #-------------------------------------------
 
@@ -784,9 +1813,158 @@ class MidiTrackEdit(object):
             self.shift_evs_to_right(new_evs, 0, ins_pos)
             # track = self.get_track(tracknum)
             if curtrack:
+                # the insertion modifies only the pasted range
+                end_pos = max(ev.msg.time for ev in new_evs)
+                window = get_recorder().begin_window(curtrack, ins_pos, end_pos)
                 curtrack.insert_evs(ins_pos, new_evs)
                 # sorting events by time
                 curtrack.sort()
+                get_recorder().end_window(curtrack, window)
+
+    #-------------------------------------------
+
+#========================================
+
+class MidiQuantizer(object):
+    """ 
+    Vectorized quantizer with numpy, 
+    snapping all note spans of many tracks in a single pass
+    """
+    def __init__(self):
+        self.step =0 # grid step in tick
+        self.strength =100 # in percent, 100 to snap on the grid
+        self.swing =0 # in percent, delay of odd grid steps, 100 for half a step
+        self.preserve_len =1 # whether note off is shifted like its note on
+
+    #-------------------------------------------
+
+    def set_params(self, step, strength=100, swing=0, preserve_len=1):
+        """
+        sets quantize parameters
+        from MidiQuantizer object
+        """
+
+        self.step = step
+        self.strength = strength
+        self.swing = swing
+        self.preserve_len = preserve_len
+
+    #-------------------------------------------
+
+    def get_columns(self, track):
+        """
+        returns a tuple of tick array, note off mask, meta mask and paired note on index array
+        from the track events and its note index
+        from MidiQuantizer object
+        """
+
+        store = track.get_store()
+        if store is not None:
+            data = store.data
+            ticks = data['tick'].astype(np.int64)
+            codes = data['type']
+            is_off = (codes == mst.TYPE_NOTE_OFF)\
+                    | ((codes == mst.TYPE_NOTE_ON) & (data['data2'] == 0))
+            is_meta = codes == mst.TYPE_META
+        else:
+            ev_lst = track.get_list()
+            ticks = np.fromiter((ev.msg.time for ev in ev_lst), dtype=np.int64, count=len(ev_lst))
+            is_off = np.fromiter((ev.msg.type == 'note_off'\
+                    or (ev.msg.type == 'note_on' and ev.msg.velocity == 0) for ev in ev_lst), 
+                    dtype=bool, count=len(ev_lst))
+            is_meta = np.fromiter((ev.msg.is_meta or ev.msg.type == 'sysex' for ev in ev_lst),
+                    dtype=bool, count=len(ev_lst))
+        on_ind = np.full(len(ticks), -1, dtype=np.int64)
+        (span_lst, _) = track.get_note_index()
+        if span_lst:
+            spans = np.array(span_lst, dtype=np.int64)
+            on_ind[spans[:, 1]] = spans[:, 0]
+
+        return (ticks, is_off, is_meta, on_ind)
+
+    #-------------------------------------------
+
+    def quantize_ticks(self, ticks, is_off, is_meta, on_ind):
+        """
+        returns new tick array, snapped on the grid
+        meta events are not moved, to keep the tempo map
+        on_ind: paired note on index for note off, -1 for the others
+        from MidiQuantizer object
+        """
+
+        step = self.step
+        if step <= 0 or not len(ticks): return ticks.copy()
+        (div, rest) = np.divmod(ticks, step)
+        # nearest grid step, the previous one for the half step
+        grid = div + (rest > step / 2)
+        target = grid * step
+        if self.swing:
+            target += (grid & 1) * int(round(step * self.swing / 200))
+        delta = np.rint((target - ticks) * (self.strength / 100)).astype(np.int64)
+        delta[is_meta] =0
+        paired = on_ind >= 0
+        if self.preserve_len:
+            # note off follows its note on, unpaired note off is not moved
+            delta[is_off] =0
+            delta[paired] = delta[on_ind[paired]]
+            new_ticks = ticks + delta
+        else:
+            new_ticks = ticks + delta
+            # keeping at least one tick for the note length
+            on_ticks = new_ticks[on_ind[paired]]
+            new_ticks[paired] = np.maximum(new_ticks[paired], on_ticks +1)
+        np.maximum(new_ticks, 0, out=new_ticks)
+
+        return new_ticks
+
+    #-------------------------------------------
+
+    def quantize_tracks(self, track_lst):
+        """
+        quantize tracks in a single vectorized pass, and sort their events
+        returns list of tuples of first and last changed tick, or None for each track
+        from MidiQuantizer object
+        """
+
+        col_lst = [self.get_columns(track) for track in track_lst]
+        if not col_lst: return []
+        # concatenate all tracks, shifting the paired index
+        offset_lst = [0]
+        for (ticks, _, _, _) in col_lst:
+            offset_lst.append(offset_lst[-1] + len(ticks))
+        ticks = np.concatenate([col[0] for col in col_lst])
+        is_off = np.concatenate([col[1] for col in col_lst])
+        is_meta = np.concatenate([col[2] for col in col_lst])
+        on_ind = np.concatenate([np.where(col[3] >= 0, col[3] + offset, -1)\
+                for (col, offset) in zip(col_lst, offset_lst)])
+        new_ticks = self.quantize_ticks(ticks, is_off, is_meta, on_ind)
+
+        res_lst = []
+        for (i, track) in enumerate(track_lst):
+            (start, stop) = (offset_lst[i], offset_lst[i+1])
+            old = ticks[start:stop]
+            new = new_ticks[start:stop]
+            changed = np.flatnonzero(old != new)
+            if not len(changed):
+                res_lst.append(None)
+                continue
+            min_tick = int(min(old[changed].min(), new[changed].min()))
+            max_tick = int(max(old[changed].max(), new[changed].max()))
+            # events out of the changed tick range keep their place
+            window = get_recorder().begin_window(track, min_tick, max_tick)
+            store = track.get_store()
+            if store is not None:
+                store.data['tick'] = new
+            else:
+                ev_lst = track.get_list()
+                for (ind, tick) in zip(changed.tolist(), new[changed].tolist()):
+                    ev_lst[ind].msg.time = tick
+            track.invalidate_ticks()
+            track.sort()
+            get_recorder().end_window(track, window)
+            res_lst.append((min_tick, max_tick))
+
+        return res_lst
 
     #-------------------------------------------
 
@@ -1081,12 +2259,17 @@ class MidiClipboard(object):
                 return
             
             self.copy_to_clip(tracks_sel, start_pos, end_pos)
+            len_lst = self.get_tracks_length()
+            end_tick = end_pos
             for (ind, tracknum) in enumerate(tracks_sel):
                 track = self.curseq.get_track(tracknum)
+                end_tick = max(end_tick, self.get_erased_end(track, end_pos))
                 self.trackedit.erase_events_to_track(track, start_pos, end_pos)
             track_lst = self.curseq.get_tracks()
             self.tools.adjust_tracks(track_lst)
             self.curseq.update_length()
+            # erasing does not shift the next events
+            self.update_timeline(tracks_sel, start_pos, len_lst, end_tick)
 
     #-------------------------------------------
 
@@ -1106,6 +2289,7 @@ class MidiClipboard(object):
             if nb_tracks == len(tracks_sel):
                 all_selected =1
             self.copy_to_clip(tracks_sel, start_pos, end_pos)
+            len_lst = self.get_tracks_length()
             for (ind, tracknum) in enumerate(tracks_sel):
                 track = self.curseq.get_track(tracknum)
                 self.trackedit.cut_events_to_track(track, start_pos, end_pos)
@@ -1114,6 +2298,7 @@ class MidiClipboard(object):
                 self.tools.reduce_tracks(track_lst)
             self.tools.adjust_tracks(track_lst)
             self.curseq.update_length()
+            self.update_timeline(tracks_sel, start_pos, len_lst)
 
     #-------------------------------------------
 
@@ -1130,6 +2315,9 @@ class MidiClipboard(object):
             # calculate the new track index bellong the clip track index
             nb_tracks = self.curseq.get_nb_tracks()
             tracknum = self.curseq.get_tracknum()
+            len_lst = self.get_tracks_length()
+            tracks_sel = []
+            end_tick = ins_pos
             for clip in clip_lst:
                 clip_ind = clip[0]
                 track_obj = clip[1]
@@ -1137,7 +2325,9 @@ class MidiClipboard(object):
                 if tracknum < nb_tracks:
                     # hard copy the clipboard
                     curtrack = self.curseq.get_track(tracknum)
+                    end_tick = max(end_tick, self.get_erased_end(curtrack, ins_pos + track_obj.get_length()))
                     self.trackedit.replace_events_to_track(track_obj, curtrack, ins_pos, copy_mode=1)
+                    tracks_sel.append(tracknum)
                 else:
                     
                     """
@@ -1153,6 +2343,8 @@ class MidiClipboard(object):
             track_lst = self.curseq.get_tracks()
             self.tools.adjust_tracks(track_lst)
             self.curseq.update_length()
+            # pasting modifies only the pasted range
+            self.update_timeline(tracks_sel, ins_pos, len_lst, end_tick)
 
 
     #-------------------------------------------
@@ -1171,6 +2363,9 @@ class MidiClipboard(object):
             # calculate the new track index bellong the clip track index
             nb_tracks = self.curseq.get_nb_tracks()
             tracknum = self.curseq.get_tracknum()
+            len_lst = self.get_tracks_length()
+            tracks_sel = []
+            end_tick = ins_pos
             for clip in clip_lst:
                 clip_ind = clip[0]
                 # track_obj is a track list
@@ -1179,7 +2374,9 @@ class MidiClipboard(object):
                 if tracknum < nb_tracks:
                     # hard copy the clipboard
                     curtrack = self.curseq.get_track(tracknum)
+                    end_tick = max(end_tick, ins_pos + track_obj.get_length())
                     self.trackedit.merge_events_to_track(track_obj, curtrack, ins_pos, copy_mode=1)
+                    tracks_sel.append(tracknum)
                 else:
                     
                     """
@@ -1194,6 +2391,50 @@ class MidiClipboard(object):
             track_lst = self.curseq.get_tracks()
             self.tools.adjust_tracks(track_lst)
             self.curseq.update_length()
+            # pasting modifies only the pasted range
+            self.update_timeline(tracks_sel, ins_pos, len_lst, end_tick)
+
+    #-------------------------------------------
+
+    def get_erased_end(self, track, end_pos):
+        """
+        returns the last tick reached by erasing events until end_pos on the track,
+        the erasing deletes until the first event after end_pos
+        from MidiClipboard object
+        """
+
+        if not track.get_list(): return end_pos
+
+        return max(end_pos, track.get_time(track.search_lastpos(end_pos)))
+
+    #-------------------------------------------
+
+    def get_tracks_length(self):
+        """
+        returns the length list of all tracks in the current sequence
+        from MidiClipboard object
+        """
+
+        return [track.get_length() for track in self.curseq.get_tracks()]
+
+    #-------------------------------------------
+
+    def update_timeline(self, tracks_sel, start_pos, len_lst, end_pos=-1):
+        """
+        update the timeline between start_pos and end_pos for the edited tracks,
+        end_pos -1 for the end of tracks, when the next events are shifted,
+        and around the end of tracks whose length has changed
+        from MidiClipboard object
+        """
+
+        for tracknum in tracks_sel:
+            self.curseq.touch_track(tracknum, start_pos, end_pos)
+        for (tracknum, track) in enumerate(self.curseq.get_tracks()):
+            old_len = len_lst[tracknum] if tracknum < len(len_lst) else 0
+            new_len = track.get_length()
+            if new_len != old_len:
+                self.curseq.touch_track(tracknum, min(old_len, new_len))
+        self.curseq.update_timeline()
 
     #-------------------------------------------
 
@@ -29,6 +29,15 @@ _help = """ Help on Zikdrum
 
   bpm VAL: set bpm
   sta, status: display player status and position in secs
+  sto, store: toggle columnar storage for tracks events
+  sch, sched: toggle deadline scheduler
+  look, lookahead [MSEC]: display lookahead depth and underruns, and sets the depth in msec
+  ahead, seqahead [MSEC]: display and sets the time in msec, messages are scheduled ahead in the synth sequencer
+  timing: display timing error statistics
+  dump FILE: dump raw timing samples to a csv file
+  um, undomem [MB]: display undo memory use, and sets the memory budget
+  wav FILE: render the sequence offline to a wav file
+  qua, quantize RESO STRENGTH SWING: quantize all tracks
   demo, test: testing
 
 """
@@ -82,6 +91,15 @@ class CommandApp(object):
                 ("midout", "midiout"): self.iap.change_midi_out,
                 ("synth", ): self.iap.change_synth,
                 ("bpm", ): self.iap.change_bpm,
+                ("sto", "store"): self.iap.toggle_columnar,
+                ("sch", "sched"): self.iap.toggle_sched_mode,
+                ("look", "lookahead"): self.iap.change_lookahead,
+                ("ahead", "seqahead"): self.iap.change_seq_ahead,
+                ("timing", ): self.iap.print_timing,
+                ("dump", ): self.iap.dump_timing,
+                ("um", "undomem"): self.iap.print_undo_mem,
+                ("wav", "render"): self.iap.render_wav,
+                ("qua", "quantize"): self.iap.quantize_all,
         }
 
         # file dict
@@ -0,0 +1,72 @@
+import os
+import sys
+import glob
+import pytest
+import mido
+
+_src_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, _src_dir)
+media_dir = os.path.join(os.path.dirname(_src_dir), "media")
+media_files = sorted(glob.glob(os.path.join(media_dir, "*.mid")))
+
+import midisequence as midseq
+
+#-----------------------------------------
+
+def get_abs_messages(tracks):
+    """
+    returns a sorted list of absolute tick and message bytes from mido tracks
+    end_of_track are ignored, and note_on with velocity 0 is taken as note_off
+    """
+
+    res = []
+    for track in tracks:
+        tick =0
+        for msg in track:
+            tick += msg.time
+            if msg.type == 'end_of_track': continue
+            if msg.type == 'note_on' and msg.velocity == 0:
+                msg = mido.Message('note_off', channel=msg.channel, note=msg.note, velocity=0)
+            res.append((tick, tuple(msg.bytes())))
+
+    return sorted(res)
+
+#-----------------------------------------
+
+class FakeMidiDriver(object):
+    """
+    midi driver without output, all methods do nothing
+    """
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: 0
+
+#-----------------------------------------
+
+@pytest.fixture
+def load_seq():
+    """
+    returns a function loading a midi file in a new sequence
+    """
+
+    def load(filename, columnar=0, file_cache=None):
+        seq = midseq.MidiSequence(None)
+        seq.file_cache = file_cache
+        seq.init_sequencer(FakeMidiDriver())
+        seq.set_columnar(columnar)
+        assert seq.load_file(filename)
+        return seq
+
+    return load
+
+#-----------------------------------------
+
+def get_seq_messages(seq, filename):
+    """
+    returns the absolute messages of a sequence, saved in filename
+    """
+
+    seq.save_midi_file(filename)
+
+    return get_abs_messages(mido.MidiFile(filename).tracks)
+
+#-----------------------------------------
@@ -0,0 +1,122 @@
+import os
+import shutil
+import pytest
+import numpy as np
+import mido
+
+import midicache as midcache
+from conftest import media_files, get_seq_messages
+
+#-----------------------------------------
+
+@pytest.fixture
+def cache(tmp_path):
+    return midcache.MidiFileCache(cache_dir=str(tmp_path / "cache"))
+
+#-----------------------------------------
+
+@pytest.fixture
+def midi_file(tmp_path):
+    filename = str(tmp_path / "song.mid")
+    shutil.copyfile(media_files[0], filename)
+    return filename
+
+#-----------------------------------------
+
+@pytest.fixture
+def hash_counter(monkeypatch):
+    """
+    counts the calls to hash_file
+    """
+
+    calls = []
+    hash_file = midcache.hash_file
+    def count_hash(filename):
+        calls.append(filename)
+        return hash_file(filename)
+    monkeypatch.setattr(midcache, "hash_file", count_hash)
+
+    return calls
+
+#-----------------------------------------
+
+@pytest.mark.parametrize("columnar", [0, 1])
+@pytest.mark.parametrize("filename", media_files, ids=os.path.basename)
+def test_miss_then_hit(load_seq, tmp_path, cache, filename, columnar):
+    out_name = str(tmp_path / "out.mid")
+    seq = load_seq(filename, columnar, cache)
+    assert (cache.miss_count, cache.hit_count) == (1, 0)
+    expected = get_seq_messages(seq, out_name)
+    seq = load_seq(filename, columnar, cache)
+    assert (cache.miss_count, cache.hit_count) == (1, 1)
+    assert get_seq_messages(seq, out_name) == expected
+    assert seq.format_type == load_seq(filename, columnar).format_type
+
+#-----------------------------------------
+
+def test_touched_file_hashed_once(load_seq, cache, midi_file, hash_counter):
+    load_seq(midi_file, 0, cache)
+    # the hash is computed when saving in the cache
+    assert len(hash_counter) == 1
+    load_seq(midi_file, 0, cache)
+    assert len(hash_counter) == 1
+    stat = os.stat(midi_file)
+    os.utime(midi_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    load_seq(midi_file, 0, cache)
+    assert cache.hit_count == 2
+    assert len(hash_counter) == 2
+    # the cache header is updated with the new mtime
+    load_seq(midi_file, 0, cache)
+    assert cache.hit_count == 3
+    assert len(hash_counter) == 2
+
+#-----------------------------------------
+
+def test_changed_file_invalidates(load_seq, tmp_path, cache, midi_file):
+    out_name = str(tmp_path / "out.mid")
+    load_seq(midi_file, 0, cache)
+    stat = os.stat(midi_file)
+    shutil.copyfile(media_files[1], midi_file)
+    # keeping the same mtime, the size differs
+    os.utime(midi_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    seq = load_seq(midi_file, 0, cache)
+    assert (cache.miss_count, cache.hit_count) == (2, 0)
+    assert get_seq_messages(seq, out_name) == get_seq_messages(load_seq(media_files[1]), out_name)
+    load_seq(midi_file, 0, cache)
+    assert cache.hit_count == 1
+
+#-----------------------------------------
+
+def test_corrupted_cache_is_a_miss(load_seq, cache, midi_file):
+    load_seq(midi_file, 0, cache)
+    with open(cache.get_cache_filename(midi_file), 'wb') as outfile:
+        outfile.write(b"garbage")
+    assert cache.load(midi_file) is None
+    # loading again replaces the bad cache file
+    load_seq(midi_file, 0, cache)
+    assert cache.load(midi_file) is not None
+
+#-----------------------------------------
+
+def test_evict(tmp_path, load_seq):
+    cache = midcache.MidiFileCache(cache_dir=str(tmp_path / "cache"), max_size=1)
+    for filename in media_files:
+        load_seq(filename, 0, cache)
+    # only the most recent file is kept
+    assert len(os.listdir(cache.cache_dir)) == 1
+    assert cache.load(media_files[-1]) is not None
+    assert cache.clear() == 1
+
+#-----------------------------------------
+
+def test_meta_encoding():
+    meta_lst = [
+            mido.MetaMessage('set_tempo', tempo=400000, time=0),
+            mido.Message('sysex', data=[1, 2, 3], time=10),
+            mido.MetaMessage('track_name', name="Piano", time=20),
+            ]
+    (buf, offsets, ticks) = midcache.encode_meta(meta_lst)
+    assert offsets.dtype == np.int64
+    assert midcache.decode_meta(buf, offsets, ticks) == meta_lst
+
+#-----------------------------------------
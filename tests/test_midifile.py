@@ -0,0 +1,187 @@
+import os
+import pytest
+import mido
+
+import midifile as midfile
+from conftest import media_files, get_abs_messages
+
+#-----------------------------------------
+
+def make_track_chunk(data):
+    return b'MTrk' + len(data).to_bytes(4, 'big') + bytes(data)
+
+#-----------------------------------------
+
+def write_raw_file(filename, chunks, format_type=1, ppq=480):
+    with open(filename, 'wb') as outfile:
+        outfile.write(b'MThd' + (6).to_bytes(4, 'big') 
+                + format_type.to_bytes(2, 'big') + len(chunks).to_bytes(2, 'big') + ppq.to_bytes(2, 'big'))
+        for chunk in chunks:
+            outfile.write(make_track_chunk(chunk))
+
+#-----------------------------------------
+
+def make_test_file(filename):
+    """
+    writes a midi file with sysex, pitchwheel and several channels, using mido
+    """
+
+    mid = mido.MidiFile(type=1, ticks_per_beat=480)
+    track = mido.MidiTrack()
+    track.append(mido.MetaMessage('set_tempo', tempo=500000, time=0))
+    track.append(mido.MetaMessage('time_signature', numerator=3, denominator=4, time=0))
+    track.append(mido.Message('sysex', data=[0x7e, 0x7f, 0x09, 0x01], time=0))
+    mid.tracks.append(track)
+    track = mido.MidiTrack()
+    track.append(mido.Message('program_change', channel=1, program=5, time=0))
+    for (time, pitch) in [(0, -8192), (10, 0), (10, 8191), (10, 0)]:
+        track.append(mido.Message('pitchwheel', channel=1, pitch=pitch, time=time))
+    for note in range(60, 64):
+        track.append(mido.Message('note_on', channel=1, note=note, velocity=100, time=0))
+        track.append(mido.Message('sysex', data=[0x43, 0x10, note], time=5))
+        track.append(mido.Message('note_off', channel=1, note=note, velocity=0, time=240))
+    track.append(mido.Message('aftertouch', channel=1, value=20, time=0))
+    track.append(mido.Message('polytouch', channel=1, note=60, value=30, time=0))
+    mid.tracks.append(track)
+    mid.save(filename)
+
+    return mid
+
+#-----------------------------------------
+
+def read_with_native(filename):
+    """
+    returns absolute messages read by SmfFile
+    """
+
+    smf = midfile.SmfFile(filename)
+    res = []
+    for track in smf.tracks:
+        for msg in track:
+            if msg.type == 'end_of_track': continue
+            res.append((msg.time, tuple(msg.bytes())))
+
+    return sorted(res)
+
+#-----------------------------------------
+
+@pytest.mark.parametrize("filename", media_files, ids=os.path.basename)
+def test_reader_matches_mido(filename):
+    assert read_with_native(filename) == get_abs_messages(mido.MidiFile(filename).tracks)
+
+#-----------------------------------------
+
+@pytest.mark.parametrize("running_status", [True, False])
+@pytest.mark.parametrize("columnar", [0, 1])
+@pytest.mark.parametrize("filename", media_files, ids=os.path.basename)
+def test_media_round_trip(load_seq, tmp_path, filename, columnar, running_status):
+    seq = load_seq(filename, columnar)
+    out_name = str(tmp_path / "out.mid")
+    seq.save_midi_file(out_name, running_status=running_status)
+    expected = get_abs_messages(mido.MidiFile(filename).tracks)
+    assert get_abs_messages(mido.MidiFile(out_name).tracks) == expected
+    # read again the written file
+    seq = load_seq(out_name, columnar)
+    seq.save_midi_file(out_name, running_status=running_status)
+    assert get_abs_messages(mido.MidiFile(out_name).tracks) == expected
+
+#-----------------------------------------
+
+@pytest.mark.parametrize("columnar", [0, 1])
+def test_sysex_pitchwheel_round_trip(load_seq, tmp_path, columnar):
+    in_name = str(tmp_path / "in.mid")
+    out_name = str(tmp_path / "out.mid")
+    mid = make_test_file(in_name)
+    expected = get_abs_messages(mid.tracks)
+    assert read_with_native(in_name) == expected
+    seq = load_seq(in_name, columnar)
+    seq.save_midi_file(out_name)
+    assert get_abs_messages(mido.MidiFile(out_name).tracks) == expected
+
+#-----------------------------------------
+
+@pytest.mark.parametrize("columnar", [0, 1])
+@pytest.mark.parametrize("filename", media_files, ids=os.path.basename)
+def test_format0_round_trip(load_seq, tmp_path, filename, columnar):
+    seq = load_seq(filename, columnar)
+    out_name = str(tmp_path / "out.mid")
+    seq.save_midi_file(out_name, format_type=0)
+    mid = mido.MidiFile(out_name)
+    assert mid.type == 0
+    assert len(mid.tracks) == 1
+    assert get_abs_messages(mid.tracks) == get_abs_messages(mido.MidiFile(filename).tracks)
+
+#-----------------------------------------
+
+def test_running_status():
+    # note_on, then running status note_on with velocity 0, then running status note_on
+    data = [0, 0x90, 60, 100, 10, 60, 0, 0, 62, 90, 5, 0xe1, 0, 0x40, 5, 0x7f, 0x7f]
+    lst = list(midfile.iter_events(data))
+    assert [ev[:4] for ev in lst] == [
+            (0, 0x90, 60, 100), (10, 0x80, 60, 0), (10, 0x90, 62, 90),
+            (15, 0xe1, 0, 0x40), (20, 0xe1, 0x7f, 0x7f),
+            ]
+    msg_lst = [midfile.make_message(status, data1, data2, tick) for (tick, status, data1, data2, _) in lst]
+    assert [msg.pitch for msg in msg_lst[3:]] == [0, 8191]
+
+#-----------------------------------------
+
+def test_running_status_without_status():
+    with pytest.raises(OSError):
+        list(midfile.iter_events([0, 60, 100]))
+
+#-----------------------------------------
+
+def test_sysex_cancels_running_status():
+    # data byte after a sysex must not reuse the note_on status
+    data = [0, 0x90, 60, 100, 0, 0xf0, 2, 0x43, 0xf7, 0, 60, 0]
+    with pytest.raises(OSError):
+        list(midfile.iter_events(data))
+
+#-----------------------------------------
+
+def test_meta_keeps_running_status():
+    # running status after a meta event is accepted by the reader
+    data = [0, 0x90, 60, 100, 0, 0xff, 0x01, 1, 0x41, 10, 60, 0]
+    lst = list(midfile.iter_events(data))
+    assert lst[-1][:4] == (10, 0x80, 60, 0)
+
+#-----------------------------------------
+
+def test_format0_file(load_seq, tmp_path):
+    in_name = str(tmp_path / "in.mid")
+    out_name = str(tmp_path / "out.mid")
+    # two channels in a single track chunk, with running status
+    data = [0, 0xff, 0x51, 3, 0x07, 0xa1, 0x20, 
+            0, 0x90, 60, 100, 0, 62, 100, 0, 0x91, 40, 80,
+            96, 0x80, 60, 0, 0, 62, 0, 0, 0x81, 40, 0,
+            0, 0xff, 0x2f, 0]
+    write_raw_file(in_name, [data], format_type=0, ppq=96)
+    smf = midfile.SmfFile(in_name)
+    assert (smf.type, smf.ticks_per_beat, len(smf.tracks)) == (0, 96, 1)
+    expected = get_abs_messages(mido.MidiFile(in_name).tracks)
+    assert read_with_native(in_name) == expected
+    seq = load_seq(in_name)
+    seq.save_midi_file(out_name, format_type=0)
+    mid = mido.MidiFile(out_name)
+    assert mid.type == 0
+    assert get_abs_messages(mid.tracks) == expected
+
+#-----------------------------------------
+
+def test_truncated_track(tmp_path):
+    in_name = str(tmp_path / "in.mid")
+    write_raw_file(in_name, [[0, 0x90, 60]])
+    smf = midfile.SmfFile(in_name)
+    with pytest.raises(EOFError):
+        list(smf.tracks[0])
+
+#-----------------------------------------
+
+@pytest.mark.parametrize("val", [0, 0x7f, 0x80, 0x3fff, 0x4000, 0x0fffffff])
+def test_varlen(val):
+    buf = bytearray()
+    midfile.write_varlen(buf, val)
+    assert midfile.read_varlen(buf, 0) == (val, len(buf))
+
+#-----------------------------------------
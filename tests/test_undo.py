@@ -0,0 +1,199 @@
+import os
+import pytest
+
+import miditools as midto
+from conftest import media_dir
+
+#-----------------------------------------
+
+class FakePlayer(object):
+    """
+    player with the attributes used by the clipboard
+    """
+    def __init__(self, seq):
+        self.curseq = seq
+        self.trackedit = midto.MidiTrackEdit()
+
+#-----------------------------------------
+
+class UndoSession(object):
+    """
+    undo and redo as done by the interface
+    """
+    def __init__(self, seq):
+        self.seq = seq
+        self.undoman = midto.UndoManager(spilling=0)
+        self.tools = midto.MidiTools()
+        midto.get_recorder().set_sequence(seq)
+        self.make_undo("Load", 0)
+
+    #-----------------------------------------
+
+    def make_undo(self, title, delta):
+        recorder = midto.get_recorder()
+        cmd = recorder.pop_command()
+        if delta and cmd:
+            self.undoman.add_undo(title, cmd)
+            return cmd
+        snap = self.tools.make_snapshot(self.seq)
+        self.undoman.add_undo(title, snap)
+
+        return snap
+
+    #-----------------------------------------
+
+    def restore(self, move):
+        old_index = self.undoman.index
+        (title, item) = move()
+        assert item
+        assert self.tools.restore_undo(self.seq, self.undoman, old_index)
+        midto.get_recorder().set_sequence(self.seq)
+
+    #-----------------------------------------
+
+    def undo(self):
+        self.restore(self.undoman.prev_undo)
+
+    #-----------------------------------------
+
+    def redo(self):
+        self.restore(self.undoman.next_undo)
+
+    #-----------------------------------------
+
+#-----------------------------------------
+
+def get_state(seq):
+    """
+    returns the events of all tracks, their channels, and the timeline
+    """
+
+    track_lst = []
+    for track in seq.track_lst:
+        store = midto.MidiEventBlocks.from_track(track, None, 7680).to_store()
+        track_lst.append((store.data.tobytes(), [repr(msg) for msg in store.meta_lst], track.channel_num))
+    tim = seq._timeline
+
+    return (track_lst, list(map(int, tim.get_ticks())),
+            [tuple(map(int, item)) for item in tim.group_time_lst])
+
+#-----------------------------------------
+
+def check_timeline(seq):
+    """
+    checks the incremental timeline against a full generation
+    """
+
+    state = get_state(seq)
+    seq.gen_timeline()
+    assert get_state(seq) == state
+
+#-----------------------------------------
+
+def get_edits():
+    """
+    returns a list of editing actions, taking sequence, clipboard and track number
+    """
+
+    def paste_replace(seq, clip, tracknum):
+        bar = seq.base.bar
+        clip.copy_to_clip([tracknum], bar*4, bar*5)
+        clip.paste_replace(bar*6)
+
+    def paste_merge(seq, clip, tracknum):
+        bar = seq.base.bar
+        clip.copy_to_clip([tracknum], bar*4, bar*6)
+        clip.paste_merge(bar*8)
+
+    def erase_note(seq, clip, tracknum):
+        track = seq.track_lst[tracknum]
+        tick = track.get_time(len(track.get_list()) // 2)
+        clip.erase_to_clip([tracknum], tick, tick +1)
+
+    return [
+            ("erase_note", erase_note),
+            ("erase_to_clip", lambda seq, clip, num: clip.erase_to_clip([num], seq.base.bar*2, seq.base.bar*3)),
+            ("cut_to_clip", lambda seq, clip, num: clip.cut_to_clip([num], seq.base.bar*2, seq.base.bar*3)),
+            ("paste_replace", paste_replace),
+            ("paste_merge", paste_merge),
+            ("quantize_tracks", lambda seq, clip, num: seq.quantize_tracks([num], 16)),
+            ("change_event_channel", lambda seq, clip, num: seq.change_event_channel(num, 5)),
+            ("erase_track", lambda seq, clip, num: seq.erase_track(num, seq.base.bar*10, seq.base.bar*12)),
+            ]
+
+_edits = get_edits()
+_filename = os.path.join(media_dir, "survive1.mid")
+
+#-----------------------------------------
+
+@pytest.fixture(params=[0, 1], ids=["list", "columnar"])
+def seq(request, load_seq):
+    seq = load_seq(_filename, request.param)
+    # the track with the most events
+    seq.tracknum = max(range(len(seq.track_lst)), key=lambda i: len(seq.track_lst[i].get_list()))
+    yield seq
+    midto.get_recorder().set_sequence(None)
+
+#-----------------------------------------
+
+@pytest.mark.parametrize("delta", [1, 0], ids=["command", "snapshot"])
+@pytest.mark.parametrize("name, edit", _edits, ids=[name for (name, _) in _edits])
+def test_undo_redo(seq, name, edit, delta):
+    clip = midto.MidiClipboard(FakePlayer(seq))
+    session = UndoSession(seq)
+    before = get_state(seq)
+    edit(seq, clip, seq.tracknum)
+    item = session.make_undo(name, delta)
+    if delta:
+        # the editing action is recorded
+        assert isinstance(item, midto.MidiUndoCommand)
+    after = get_state(seq)
+    assert after != before
+    check_timeline(seq)
+    for _ in range(2):
+        session.undo()
+        assert get_state(seq) == before
+        check_timeline(seq)
+        session.redo()
+        assert get_state(seq) == after
+        check_timeline(seq)
+
+#-----------------------------------------
+
+def test_undo_redo_sequence(seq):
+    """
+    undo all edits, then redo them, with commands after a snapshot
+    """
+
+    clip = midto.MidiClipboard(FakePlayer(seq))
+    session = UndoSession(seq)
+    state_lst = [get_state(seq)]
+    for (num, (name, edit)) in enumerate(_edits):
+        edit(seq, clip, seq.tracknum)
+        session.make_undo(name, num % 3)
+        state_lst.append(get_state(seq))
+    for state in reversed(state_lst[:-1]):
+        session.undo()
+        assert get_state(seq) == state
+    for state in state_lst[1:]:
+        session.redo()
+        assert get_state(seq) == state
+    check_timeline(seq)
+
+#-----------------------------------------
+
+def test_snapshot_round_trip(seq):
+    clip = midto.MidiClipboard(FakePlayer(seq))
+    tools = midto.MidiTools()
+    snap_lst = [(tools.make_snapshot(seq), get_state(seq))]
+    for (name, edit) in _edits:
+        edit(seq, clip, seq.tracknum)
+        snap_lst.append((tools.make_snapshot(seq), get_state(seq)))
+    # unchanged tracks are shared with the previous snapshot
+    assert tools.restore_snapshot(seq, snap_lst[-1][0]) == 0
+    for (snap, state) in snap_lst[::2] + snap_lst[::-3]:
+        tools.restore_snapshot(seq, snap)
+        assert get_state(seq) == state
+        check_timeline(seq)
+
+#-----------------------------------------